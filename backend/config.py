@@ -6,20 +6,159 @@ load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 
+DATA_DIR = os.getenv("DATA_DIR", os.path.join(os.path.dirname(__file__), "data"))
+
 PINECONE_INDEX = os.getenv("PINECONE_INDEX", "mini-rag-index")
 PINECONE_HOST = os.getenv("PINECONE_HOST")
 
+# "pinecone" or "local" (in-process, memory-mapped index under DATA_DIR)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "pinecone")
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", os.path.join(DATA_DIR, "vectors"))
+LOCAL_INDEX_QUANTIZE = os.getenv("LOCAL_INDEX_QUANTIZE", "false").lower() == "true"
+# Namespaces with at least this many vectors use the approximate IVF index; 0 disables it
+LOCAL_INDEX_ANN_MIN_VECTORS = int(os.getenv("LOCAL_INDEX_ANN_MIN_VECTORS", "50000"))
+LOCAL_INDEX_ANN_NPROBE = 8
+
 GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+# Answers easy questions (see ANSWER_EASY_CONFIDENCE); empty uses GEMINI_MODEL with a shorter answer
+GEMINI_LIGHT_MODEL = os.getenv("GEMINI_LIGHT_MODEL", "")
+LIGHT_MAX_OUTPUT_TOKENS = 1024
 EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "models/text-embedding-004")
 
+# Each external dependency gets its own thread pool; its size caps concurrent calls
+DEPENDENCY_POOLS = {
+    "gemini_embed": {"max_concurrency": int(os.getenv("GEMINI_EMBED_CONCURRENCY", "16")), "timeout_s": 30.0},
+    # Document embeddings for ingestion get their own threads so uploads can't starve query embeds
+    "gemini_embed_ingest": {"max_concurrency": int(os.getenv("GEMINI_EMBED_INGEST_CONCURRENCY", "8")), "timeout_s": 30.0},
+    "gemini_generate": {"max_concurrency": int(os.getenv("GEMINI_GENERATE_CONCURRENCY", "16")), "timeout_s": 60.0},
+    "pinecone": {"max_concurrency": int(os.getenv("PINECONE_CONCURRENCY", "32")), "timeout_s": 15.0},
+    "local_index": {"max_concurrency": int(os.getenv("LOCAL_INDEX_CONCURRENCY", "4")), "timeout_s": 15.0},
+    "lexical_index": {"max_concurrency": int(os.getenv("LEXICAL_INDEX_CONCURRENCY", "4")), "timeout_s": 15.0},
+    "embedding_cache": {"max_concurrency": int(os.getenv("EMBEDDING_CACHE_CONCURRENCY", "4")), "timeout_s": 15.0},
+    "chunk_store": {"max_concurrency": int(os.getenv("CHUNK_STORE_CONCURRENCY", "4")), "timeout_s": 15.0},
+    "manifest": {"max_concurrency": int(os.getenv("MANIFEST_CONCURRENCY", "2")), "timeout_s": 15.0},
+    # One thread, so a job's status updates are written in the order they're made
+    "job_store": {"max_concurrency": 1, "timeout_s": 15.0},
+    # File reading, PDF text extraction and chunking for uploads; the timeout is per batch of chunks
+    "ingest": {"max_concurrency": int(os.getenv("INGEST_CONCURRENCY", "4")), "timeout_s": 60.0},
+}
+
+EMBED_BATCH_SIZE = 100
+EMBED_MAX_CONCURRENCY = 4
+EMBED_MAX_RETRIES = 5
+EMBED_RETRY_BASE_DELAY = 1.0
+
+EMBED_CACHE_MAX_ENTRIES = 10000
+# Set to an empty string to keep the cache in memory only
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", os.path.join(DATA_DIR, "embedding_cache.sqlite3"))
+EMBED_CACHE_DISK_MAX_ENTRIES = 100000
+
 CHUNK_SIZE = 1000
 CHUNK_OVERLAP = 100
 
+# Uploads stream through chunk -> embed -> upsert in batches of this many chunks, with at most
+# INGEST_QUEUE_BATCHES batches waiting between stages
+INGEST_BATCH_CHUNKS = 100
+INGEST_QUEUE_BATCHES = 4
+INGEST_EMBED_WORKERS = 2
+INGEST_READ_BLOCK_BYTES = 1024 * 1024
+
+# Documents in a batch upload chunked at once; their chunks share embedding and upsert batches
+INGEST_PARALLEL_DOCUMENTS = 4
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "1000"))
+MAX_ARCHIVE_EXTRACTED_MB = int(os.getenv("MAX_ARCHIVE_EXTRACTED_MB", "500"))
+
+# Uploads are queued as jobs and run by this many workers per replica
+INGEST_JOB_WORKERS = int(os.getenv("INGEST_JOB_WORKERS", "2"))
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", os.path.join(DATA_DIR, "jobs.sqlite3"))
+UPLOADS_DIR = os.getenv("UPLOADS_DIR", os.path.join(DATA_DIR, "uploads"))
+JOB_RETENTION_S = 7 * 24 * 3600
+
+# Chunk ids indexed per (namespace, source), so re-uploading a document only embeds changed chunks
+MANIFEST_DB_PATH = os.getenv("MANIFEST_DB_PATH", os.path.join(DATA_DIR, "manifest.sqlite3"))
+
+# Chunk text and rerank features, by chunk id; queries get only ids and scores from the index.
+# With SLIM_VECTOR_METADATA the index keeps no text at all, which is only safe when every replica
+# reads the same chunk store. Otherwise a replica recovers chunks it lacks from the index metadata.
+CHUNK_STORE_DB_PATH = os.getenv("CHUNK_STORE_DB_PATH", os.path.join(DATA_DIR, "chunks.sqlite3"))
+SLIM_VECTOR_METADATA = os.getenv("SLIM_VECTOR_METADATA", "true" if VECTOR_BACKEND == "local" else "false").lower() == "true"
+# Pinecone rejects vectors with more metadata than this; larger chunks are kept in the chunk store only
+VECTOR_METADATA_MAX_BYTES = 40 * 1024
+
+# PDF pages are extracted in a process pool shared by all uploads, PDF_PAGES_PER_TASK pages per
+# task. Each upload keeps at most PDF_EXTRACT_TASKS_PER_UPLOAD tasks in flight so one large PDF
+# can't take every process. PDF_EXTRACT_PROCESSES=0 extracts on the ingest thread instead.
+PDF_EXTRACT_PROCESSES = int(os.getenv("PDF_EXTRACT_PROCESSES", str(os.cpu_count() or 1)))
+PDF_EXTRACT_TASKS_PER_UPLOAD = int(os.getenv("PDF_EXTRACT_TASKS_PER_UPLOAD", "2"))
+PDF_PAGES_PER_TASK = 8
+PDF_PARALLEL_MIN_PAGES = 16
+
 TOP_K_RETRIEVE = 10
+
+# Queries over several namespaces search each one concurrently. A namespace that doesn't answer
+# within the deadline is left out of the results instead of holding up the query.
+NAMESPACE_QUERY_TIMEOUT_S = float(os.getenv("NAMESPACE_QUERY_TIMEOUT_S", "2.0"))
+MAX_QUERY_NAMESPACES = int(os.getenv("MAX_QUERY_NAMESPACES", "100"))
+# How long this replica reuses the namespace list for prefix queries; uploads here refresh it
+NAMESPACE_LIST_TTL_S = 30
+
+# Fuse BM25 keyword hits with vector hits; the lexical index is kept under DATA_DIR on each replica
+HYBRID_RETRIEVAL = os.getenv("HYBRID_RETRIEVAL", "true").lower() == "true"
+# Set to an empty string to keep the lexical index in memory only
+LEXICAL_INDEX_DIR = os.getenv("LEXICAL_INDEX_DIR", os.path.join(DATA_DIR, "lexical"))
+TOP_K_LEXICAL = 10
+RRF_K = 60
 TOP_K_RERANK = 5
 RERANK_THRESHOLD = 0.1
 
-MAX_FILE_SIZE_MB = 5
+# Answer policy, from the rerank scores of the sources. Below the confidence floor the answer is
+# a canned one and Gemini isn't called; 0 always generates. Sources scoring under a fraction of
+# the top one are left out. A confident top source backed by at most ANSWER_EASY_MAX_SOURCES
+# gets the light generation config.
+ANSWER_CONFIDENCE_FLOOR = float(os.getenv("ANSWER_CONFIDENCE_FLOOR", str(RERANK_THRESHOLD)))
+ANSWER_RELATIVE_SCORE = 0.6
+ANSWER_EASY_CONFIDENCE = float(os.getenv("ANSWER_EASY_CONFIDENCE", "0.3"))
+ANSWER_EASY_MAX_SOURCES = 2
+
+# Reranked sources are packed into the prompt in rank order until their text reaches this many
+# tokens. Sources sharing this fraction of their 5-word shingles with one already packed are dropped.
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "4000"))
+CONTEXT_DUPLICATE_SIMILARITY = 0.9
+
+QUERY_CACHE_TTL_S = 600
+QUERY_CACHE_SIMILARITY_THRESHOLD = 0.95
+QUERY_CACHE_MAX_ENTRIES = 256
+
+# /api/query/batch: questions per request, and how many of their answers are generated at once
+BATCH_QUERY_MAX = int(os.getenv("BATCH_QUERY_MAX", "50"))
+BATCH_GENERATE_CONCURRENCY = int(os.getenv("BATCH_GENERATE_CONCURRENCY", "4"))
+
+MAX_FILE_SIZE_MB = int(os.getenv("MAX_FILE_SIZE_MB", "100"))
 ALLOWED_EXTENSIONS = [".txt", ".pdf", ".md"]
 
 RATE_LIMIT = "1000/minute"
+
+# Admission control per replica: each pool runs at most `concurrency` requests and queues up to
+# `max_queue` more. A request that would wait longer than `max_wait_s` gets a 503 with a
+# Retry-After instead of piling up behind the rest.
+ADMISSION_POOLS = {
+    "query": {
+        "concurrency": int(os.getenv("QUERY_ADMISSION_CONCURRENCY", "24")),
+        "max_queue": int(os.getenv("QUERY_ADMISSION_QUEUE", "48")),
+        "max_wait_s": float(os.getenv("QUERY_ADMISSION_MAX_WAIT_S", "5"))
+    },
+    "upload": {
+        "concurrency": int(os.getenv("UPLOAD_ADMISSION_CONCURRENCY", "8")),
+        "max_queue": int(os.getenv("UPLOAD_ADMISSION_QUEUE", "16")),
+        "max_wait_s": float(os.getenv("UPLOAD_ADMISSION_MAX_WAIT_S", "10"))
+    },
+}
+
+# New replicas report ready on /ready once the tokenizer, clients and PDF workers are warm.
+# Steps that fail (a bad key, an unreachable service) are retried with backoff.
+WARMUP_RETRY_S = float(os.getenv("WARMUP_RETRY_S", "5"))
+WARMUP_RETRY_MAX_S = 60.0
+
+# Logs are JSON lines; routine per-request events are kept at LOG_SAMPLE_RATE, warnings always
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.1"))
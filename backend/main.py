@@ -1,24 +1,51 @@
+import time
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 
-from routers import upload, query
+from routers import upload, query, cache, jobs
+from services.admission import AdmissionControlMiddleware
+from services.executors import shutdown_executors
+from services.warmup import start_warm_up, stop_warm_up, readiness
+from services.jobs import start_job_workers, stop_job_workers
+from services.pdf_extractor import shutdown_pdf_extractor
+from services.metrics import HTTP_REQUEST_SECONDS, HTTP_REQUESTS_IN_PROGRESS, render
+from services.logs import configure_logging, log_event
 from config import RATE_LIMIT
 
+configure_logging()
 limiter = Limiter(key_func=get_remote_address)
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Runs in the background; /ready reports 503 until it finishes
+    start_warm_up()
+    await start_job_workers()
+    yield
+    await stop_warm_up()
+    await stop_job_workers()
+    shutdown_executors()
+    shutdown_pdf_extractor()
+
+
 app = FastAPI(
     title="Mini RAG API",
     description="Retrieval-Augmented Generation with Pinecone + Gemini",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
+# Added before CORS so its 503s still carry CORS headers
+app.add_middleware(AdmissionControlMiddleware, routes={"/api/query": "query", "/api/upload": "upload"})
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -29,6 +56,25 @@ app.add_middleware(
 )
 
 
+@app.middleware("http")
+async def observe_requests(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    HTTP_REQUESTS_IN_PROGRESS.inc()
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        HTTP_REQUESTS_IN_PROGRESS.dec()
+        elapsed = time.perf_counter() - start
+        # The route template rather than the raw path, so ids in paths don't each get a series
+        route = request.scope.get("route")
+        route_path = route.path if route is not None else "unmatched"
+        HTTP_REQUEST_SECONDS.labels(request.method, route_path, str(status)).observe(elapsed)
+        log_event("http.request", method=request.method, route=route_path, status=status, duration_ms=int(elapsed * 1000))
+
+
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
     return JSONResponse(
@@ -44,6 +90,8 @@ async def global_exception_handler(request: Request, exc: Exception):
 
 app.include_router(upload.router)
 app.include_router(query.router)
+app.include_router(cache.router)
+app.include_router(jobs.router)
 
 
 @app.get("/")
@@ -53,18 +101,37 @@ async def root():
         "version": "1.0.0",
         "endpoints": {
             "upload": "POST /api/upload",
+            "upload_batch": "POST /api/upload/batch",
+            "job_status": "GET /api/jobs/{job_id}",
             "query": "POST /api/query",
+            "query_stream": "POST /api/query/stream",
+            "query_batch": "POST /api/query/batch",
             "documents": "GET /api/documents",
-            "health": "GET /api/health"
+            "cache_stats": "GET /api/cache/stats",
+            "metrics": "GET /metrics",
+            "health": "GET /api/health",
+            "ready": "GET /ready"
         }
     }
 
 
+@app.get("/metrics")
+async def metrics():
+    body, content_type = render()
+    return Response(content=body, media_type=content_type)
+
+
 @app.get("/health")
 async def health():
     return {"status": "healthy"}
 
 
+@app.get("/ready")
+async def ready():
+    state = readiness()
+    return JSONResponse(status_code=200 if state["ready"] else 503, content={"status": "ready" if state["ready"] else "warming_up", **state})
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
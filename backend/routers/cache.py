@@ -0,0 +1,14 @@
+from fastapi import APIRouter
+
+from services.embedder import get_cache_stats
+from services.query_cache import query_cache
+
+router = APIRouter(prefix="/api", tags=["cache"])
+
+
+@router.get("/cache/stats")
+async def cache_stats():
+    return {
+        "embedding_cache": get_cache_stats(),
+        "query_cache": query_cache.stats()
+    }
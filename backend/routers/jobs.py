@@ -0,0 +1,13 @@
+from fastapi import APIRouter, HTTPException
+
+from services.jobs import get_job, describe_job
+
+router = APIRouter(prefix="/api", tags=["jobs"])
+
+
+@router.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    job = await get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return describe_job(job)
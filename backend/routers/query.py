@@ -1,20 +1,182 @@
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Optional
+from typing import Optional, List, Dict, Tuple, Union
+import asyncio
+import json
+import logging
 import time
 
-from services.embedder import embed_query
-from services.vector_store import query_vectors
-from services.reranker import rerank_documents
-from services.llm import generate_answer, estimate_cost
-from config import TOP_K_RETRIEVE
+from services.embedder import embed_query, embed_texts
+from services.retriever import retrieve, retrieve_across
+from services.reranker import rerank_documents, rerank_document_sets
+from services.llm import (
+    generate_answer, estimate_cost, prepare_prompt, build_citations, estimate_tokens, stream_answer
+)
+from services.query_cache import query_cache, normalize_query
+from services.metrics import observe, COALESCED_REQUESTS
+from services.single_flight import SingleFlight
+from services.answer_policy import plan_answer, LOW_CONFIDENCE_ANSWER
+from services.vector_store import list_namespaces
+from services.logs import log_event
+from config import TOP_K_RETRIEVE, BATCH_QUERY_MAX, BATCH_GENERATE_CONCURRENCY, MAX_QUERY_NAMESPACES
 
 router = APIRouter(prefix="/api", tags=["query"])
 
+NO_DOCUMENTS_ANSWER = "No documents found. Please upload a document first."
+
+query_flights = SingleFlight()
+
 
 class QueryRequest(BaseModel):
     query: str
     namespace: Optional[str] = None
+    # Search several namespaces at once: the ones listed, and every one starting with the prefix
+    namespaces: Optional[List[str]] = None
+    namespace_prefix: Optional[str] = None
+
+
+class BatchQueryRequest(BaseModel):
+    queries: List[str]
+    namespace: Optional[str] = None
+
+
+def _cached_response(result: dict, match: str, start_time: float) -> dict:
+    return {
+        **result,
+        "timing_ms": int((time.time() - start_time) * 1000),
+        "cache_hit": True,
+        "cache_match": match
+    }
+
+
+async def _retrieve_sources(request: QueryRequest, query_embedding: List[float]) -> List[Dict]:
+    retrieved_docs = await retrieve(
+        request.query,
+        query_embedding,
+        namespace=request.namespace,
+        top_k=TOP_K_RETRIEVE
+    )
+    
+    if not retrieved_docs:
+        log_event("query.retrieved", namespace=request.namespace, retrieved=0)
+        return []
+    
+    reranked_docs = await observe("rerank", rerank_documents(request.query, retrieved_docs))
+    return _sources(request.namespace, retrieved_docs, reranked_docs)
+
+
+def _sources(namespace: Union[str, List[str], None], retrieved_docs: List[Dict], reranked_docs: List[Dict]) -> List[Dict]:
+    log_event(
+        "query.retrieved",
+        namespace=namespace,
+        retrieved=len(retrieved_docs),
+        reranked=len(reranked_docs),
+        retrieved_sources=sorted({d.get("source", "unknown") for d in retrieved_docs}),
+        reranked_sources=sorted({d.get("source", "unknown") for d in reranked_docs})
+    )
+    
+    if not reranked_docs:
+        reranked_docs = retrieved_docs[:5]
+    
+    return reranked_docs
+
+
+async def _fanout_namespaces(request: QueryRequest) -> Optional[List[str]]:
+    """The namespaces a multi-namespace query searches, or None for a single-namespace query."""
+    if request.namespaces is None and request.namespace_prefix is None:
+        return None
+    requested = ([request.namespace] if request.namespace else []) + (request.namespaces or [])
+    if request.namespace_prefix is not None:
+        requested += await list_namespaces(request.namespace_prefix)
+    namespaces = list(dict.fromkeys(requested))
+    if len(namespaces) > MAX_QUERY_NAMESPACES:
+        raise HTTPException(status_code=400, detail=f"Too many namespaces. Max per query: {MAX_QUERY_NAMESPACES}")
+    return namespaces
+
+
+async def _retrieve_across(request: QueryRequest, query_embedding: List[float], namespaces: List[str]) -> Tuple[List[Dict], Dict]:
+    retrieved_docs, summary = await retrieve_across(request.query, query_embedding, namespaces, top_k=TOP_K_RETRIEVE)
+    if not retrieved_docs:
+        log_event("query.retrieved", namespace=namespaces, retrieved=0)
+        return [], summary
+    reranked_docs = await observe("rerank", rerank_documents(request.query, retrieved_docs))
+    return _sources(namespaces, retrieved_docs, reranked_docs), summary
+
+
+async def _prepare(request: QueryRequest, namespaces: Optional[List[str]] = None) -> Tuple[List[float], Optional[dict], List[Dict], Optional[Dict]]:
+    """Embed the query, then return a semantic cache hit if there is one, else the sources.
+    Multi-namespace queries skip the cache and also return which namespaces answered."""
+    query_embedding = await observe("embed", embed_query(request.query))
+    if namespaces is not None:
+        sources, summary = await _retrieve_across(request, query_embedding, namespaces)
+        return query_embedding, None, sources, summary
+    similar = query_cache.get_similar(request.namespace, query_embedding)
+    if similar is not None:
+        return query_embedding, similar[0], [], None
+    return query_embedding, None, await _retrieve_sources(request, query_embedding), None
+
+
+async def _answer(request: QueryRequest, normalized_query: str, cache_generation: int,
+                  namespaces: Optional[List[str]] = None) -> Tuple[dict, Optional[str]]:
+    query_embedding, similar, sources, summary = await _prepare(request, namespaces)
+    if similar is not None:
+        return similar, "semantic"
+    
+    if not sources:
+        response = {"answer": NO_DOCUMENTS_ANSWER, "citations": [], "token_estimate": 0}
+    else:
+        response = await _generate(request.query, *plan_answer(sources))
+    
+    if summary is not None:
+        # Not cached: the answer may be missing namespaces that timed out, and an upload to any
+        # one of them would have to invalidate it
+        return {**response, "namespaces": summary}, None
+    if _cacheable(response):
+        query_cache.put(request.namespace, normalized_query, query_embedding, response, cache_generation)
+    return response, None
+
+
+def _cacheable(response: dict) -> bool:
+    # generate_answer reports failures as an answer with no citations; never cache those
+    return bool(response["citations"]) or response.get("answer_policy", {}).get("decision") == "skip"
+
+
+def _skipped_response(policy: Dict) -> dict:
+    return {
+        "answer": LOW_CONFIDENCE_ANSWER,
+        "citations": [],
+        "token_estimate": 0,
+        "cost_estimate": estimate_cost(0),
+        "context": None,
+        "answer_policy": policy
+    }
+
+
+async def _generate(query: str, sources: List[Dict], policy: Dict) -> dict:
+    if policy["decision"] == "skip":
+        return _skipped_response(policy)
+    
+    result = await generate_answer(query, sources, light=policy["decision"] == "light")
+    
+    cost = estimate_cost(result["token_estimate"])
+    
+    return {
+        "answer": result["answer"],
+        "citations": result["citations"],
+        "token_estimate": result["token_estimate"],
+        "cost_estimate": cost,
+        "context": result["context"],
+        "answer_policy": policy
+    }
+
+
+def _flight_key(kind: str, request: QueryRequest, namespaces: Optional[List[str]], normalized_query: str) -> tuple:
+    # The generations are part of the key, so a request arriving after an upload doesn't join a
+    # query that started before it
+    if namespaces is None:
+        return kind, request.namespace, normalized_query, query_cache.generation(request.namespace)
+    return kind, tuple(namespaces), normalized_query, tuple(query_cache.generation(namespace) for namespace in namespaces)
 
 
 @router.post("/query")
@@ -22,50 +184,271 @@ async def query_documents(request: QueryRequest):
     start_time = time.time()
     
     try:
-        query_embedding = await embed_query(request.query)
+        namespaces = await _fanout_namespaces(request)
+        normalized_query = normalize_query(request.query)
+        cached = query_cache.get_exact(request.namespace, normalized_query) if namespaces is None else None
+        if cached is not None:
+            return _cached_response(cached, "exact", start_time)
         
-        retrieved_docs = await query_vectors(
-            query_embedding,
-            namespace=request.namespace,
-            top_k=TOP_K_RETRIEVE
+        # Captured before retrieval so an upload that lands mid-request isn't masked by a stale entry
+        cache_generation = query_cache.generation(request.namespace)
+        # Identical questions asked at once share one embed, retrieval and generation
+        (result, cache_match), coalesced = await query_flights.run(
+            _flight_key("answer", request, namespaces, normalized_query),
+            lambda: _answer(request, normalized_query, cache_generation, namespaces)
         )
+        if coalesced:
+            COALESCED_REQUESTS.labels("query").inc()
         
-        print(f"[DEBUG] Namespace: {request.namespace}")
-        print(f"[DEBUG] Retrieved {len(retrieved_docs)} docs")
-        sources = set(d.get('source', 'unknown') for d in retrieved_docs)
-        print(f"[DEBUG] Sources in retrieved: {sources}")
-        
+        if cache_match is not None:
+            return {**_cached_response(result, cache_match, start_time), "coalesced": coalesced}
+        return {
+            **result,
+            "timing_ms": int((time.time() - start_time) * 1000),
+            "cache_hit": False,
+            "coalesced": coalesced
+        }
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        log_event("query.failed", level=logging.ERROR, namespace=request.namespace, error=str(e))
+        raise HTTPException(status_code=500, detail=f"Query failed: {str(e)}")
+
+
+def _failed_result(namespace: Optional[str], error: Exception) -> dict:
+    log_event("query.failed", level=logging.ERROR, namespace=namespace, error=str(error), batch=True)
+    return {"answer": None, "citations": [], "error": f"Query failed: {str(error)}", "cache_hit": False}
+
+
+async def _answer_batch(queries: List[str], namespace: Optional[str], timings: Dict[str, int]) -> List[dict]:
+    """Answer queries that missed the exact-match cache: one batched embed call, concurrent
+    retrievals, one rerank pass over every candidate set, then generation a few at a time."""
+    cache_generation = query_cache.generation(namespace)
+    
+    stage_start = time.perf_counter()
+    embeddings = await observe("embed", embed_texts(queries, task_type="retrieval_query"))
+    timings["embed"] = int((time.perf_counter() - stage_start) * 1000)
+    
+    results: List[Optional[dict]] = [None] * len(queries)
+    pending = []
+    for i, embedding in enumerate(embeddings):
+        similar = query_cache.get_similar(namespace, embedding)
+        if similar is not None:
+            results[i] = {**similar[0], "cache_hit": True, "cache_match": "semantic"}
+        else:
+            pending.append(i)
+    
+    stage_start = time.perf_counter()
+    # A query whose retrieval or generation fails gets an error entry; the others are still answered
+    outcomes = await asyncio.gather(*(
+        retrieve(queries[i], embeddings[i], namespace=namespace, top_k=TOP_K_RETRIEVE) for i in pending
+    ), return_exceptions=True)
+    timings["retrieve"] = int((time.perf_counter() - stage_start) * 1000)
+    retrieved = []
+    for i, outcome in zip(list(pending), outcomes):
+        if isinstance(outcome, Exception):
+            results[i] = _failed_result(namespace, outcome)
+            pending.remove(i)
+        else:
+            retrieved.append(outcome)
+    
+    stage_start = time.perf_counter()
+    reranked = await observe("rerank", rerank_document_sets([queries[i] for i in pending], retrieved))
+    timings["rerank"] = int((time.perf_counter() - stage_start) * 1000)
+    
+    semaphore = asyncio.Semaphore(BATCH_GENERATE_CONCURRENCY)
+    
+    async def answer(i: int, retrieved_docs: List[Dict], reranked_docs: List[Dict]):
         if not retrieved_docs:
-            return {
-                "answer": "No documents found. Please upload a document first.",
-                "citations": [],
+            log_event("query.retrieved", namespace=namespace, retrieved=0)
+            results[i] = {"answer": NO_DOCUMENTS_ANSWER, "citations": [], "token_estimate": 0, "cache_hit": False}
+            return
+        sources, policy = plan_answer(_sources(namespace, retrieved_docs, reranked_docs))
+        generate_start = time.perf_counter()
+        if policy["decision"] == "skip":
+            response = _skipped_response(policy)
+        else:
+            async with semaphore:
+                generate_start = time.perf_counter()
+                response = await _generate(queries[i], sources, policy)
+        if _cacheable(response):
+            query_cache.put(namespace, normalize_query(queries[i]), embeddings[i], response, cache_generation)
+        results[i] = {**response, "cache_hit": False, "generate_ms": int((time.perf_counter() - generate_start) * 1000)}
+    
+    stage_start = time.perf_counter()
+    outcomes = await asyncio.gather(
+        *(answer(i, docs, ranked) for i, docs, ranked in zip(pending, retrieved, reranked)), return_exceptions=True
+    )
+    for i, outcome in zip(pending, outcomes):
+        if isinstance(outcome, Exception):
+            results[i] = _failed_result(namespace, outcome)
+    timings["generate"] = int((time.perf_counter() - stage_start) * 1000)
+    return results
+
+
+@router.post("/query/batch")
+async def query_documents_batch(request: BatchQueryRequest):
+    start_time = time.time()
+    if not request.queries:
+        raise HTTPException(status_code=400, detail="Provide at least one query")
+    if len(request.queries) > BATCH_QUERY_MAX:
+        raise HTTPException(status_code=400, detail=f"Too many queries. Max per batch: {BATCH_QUERY_MAX}")
+    
+    try:
+        timings = {"embed": 0, "retrieve": 0, "rerank": 0, "generate": 0}
+        results: List[Optional[dict]] = [None] * len(request.queries)
+        # Repeats within the batch are answered once
+        misses: Dict[str, List[int]] = {}
+        for i, query in enumerate(request.queries):
+            normalized_query = normalize_query(query)
+            cached = query_cache.get_exact(request.namespace, normalized_query)
+            if cached is not None:
+                results[i] = {**cached, "cache_hit": True, "cache_match": "exact"}
+            else:
+                misses.setdefault(normalized_query, []).append(i)
+        
+        if misses:
+            answered = await _answer_batch([request.queries[indices[0]] for indices in misses.values()], request.namespace, timings)
+            for indices, result in zip(misses.values(), answered):
+                for i in indices:
+                    results[i] = result
+        
+        log_event("query.batch", namespace=request.namespace, queries=len(request.queries), answered=len(misses), **{
+            f"{stage}_ms": ms for stage, ms in timings.items()
+        })
+        return {
+            "results": [{"query": query, **result} for query, result in zip(request.queries, results)],
+            "timings_ms": timings,
+            "timing_ms": int((time.time() - start_time) * 1000)
+        }
+    
+    except Exception as e:
+        log_event("query.failed", level=logging.ERROR, namespace=request.namespace, error=str(e), batch=True)
+        raise HTTPException(status_code=500, detail=f"Query failed: {str(e)}")
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def _stream_events(request: QueryRequest, namespaces: Optional[List[str]], start_time: float):
+    try:
+        normalized_query = normalize_query(request.query)
+        cached = query_cache.get_exact(request.namespace, normalized_query) if namespaces is None else None
+        cache_match = "exact"
+        
+        cache_generation = query_cache.generation(request.namespace)
+        coalesced = False
+        summary = None
+        if cached is None:
+            # Streams can't share an answer as it's generated, but identical ones share retrieval
+            (query_embedding, cached, sources, summary), coalesced = await query_flights.run(
+                _flight_key("sources", request, namespaces, normalized_query),
+                lambda: _prepare(request, namespaces)
+            )
+            cache_match = "semantic"
+            if coalesced:
+                COALESCED_REQUESTS.labels("query_stream").inc()
+        
+        if cached is not None:
+            yield _sse("citations", {"citations": cached["citations"], "cache_hit": True, "cache_match": cache_match})
+            yield _sse("token", {"text": cached["answer"]})
+            yield _sse("done", {
                 "timing_ms": int((time.time() - start_time) * 1000),
-                "token_estimate": 0
-            }
+                "token_estimate": cached["token_estimate"],
+                "cost_estimate": cached["cost_estimate"],
+                "cache_hit": True
+            })
+            return
         
-        reranked_docs = await rerank_documents(request.query, retrieved_docs)
+        if not sources:
+            yield _sse("citations", {"citations": [], "cache_hit": False})
+            yield _sse("token", {"text": NO_DOCUMENTS_ANSWER})
+            yield _sse("done", {
+                "timing_ms": int((time.time() - start_time) * 1000),
+                "token_estimate": 0,
+                "cache_hit": False,
+                **({"namespaces": summary} if summary is not None else {})
+            })
+            return
         
-        print(f"[DEBUG] Reranked {len(reranked_docs)} docs")
-        sources = set(d.get('source', 'unknown') for d in reranked_docs)
-        print(f"[DEBUG] Sources in reranked: {sources}")
+        sources, policy = plan_answer(sources)
+        if policy["decision"] == "skip":
+            response = _skipped_response(policy)
+            if summary is None:
+                query_cache.put(request.namespace, normalized_query, query_embedding, response, cache_generation)
+            yield _sse("citations", {"citations": [], "cache_hit": False, "coalesced": coalesced})
+            yield _sse("token", {"text": response["answer"]})
+            yield _sse("done", {
+                "timing_ms": int((time.time() - start_time) * 1000),
+                "token_estimate": 0,
+                "cost_estimate": response["cost_estimate"],
+                "answer_policy": policy,
+                "cache_hit": False,
+                **({"namespaces": summary} if summary is not None else {})
+            })
+            return
         
-        if not reranked_docs:
-            reranked_docs = retrieved_docs[:5]
+        light = policy["decision"] == "light"
+        passages, prompt, context = prepare_prompt(request.query, sources, concise=light)
+        citations = build_citations(passages)
+        yield _sse("citations", {"citations": citations, "cache_hit": False, "coalesced": coalesced})
         
-        result = await generate_answer(request.query, reranked_docs)
+        answer_parts = []
+        first_token_ms = None
+        async for text in stream_answer(prompt, context["prompt_tokens"], light=light):
+            if first_token_ms is None:
+                first_token_ms = int((time.time() - start_time) * 1000)
+            answer_parts.append(text)
+            yield _sse("token", {"text": text})
         
-        cost = estimate_cost(result["token_estimate"])
+        answer = "".join(answer_parts)
+        token_estimate = estimate_tokens(context["prompt_tokens"], answer)
+        cost = estimate_cost(token_estimate)
+        if summary is None:
+            query_cache.put(request.namespace, normalized_query, query_embedding, {
+                "answer": answer,
+                "citations": citations,
+                "token_estimate": token_estimate,
+                "cost_estimate": cost,
+                "context": context,
+                "answer_policy": policy
+            }, cache_generation)
         
-        return {
-            "answer": result["answer"],
-            "citations": result["citations"],
+        yield _sse("done", {
             "timing_ms": int((time.time() - start_time) * 1000),
-            "token_estimate": result["token_estimate"],
-            "cost_estimate": cost
-        }
-        
+            "time_to_first_token_ms": first_token_ms,
+            "token_estimate": token_estimate,
+            "cost_estimate": cost,
+            "context": context,
+            "answer_policy": policy,
+            "cache_hit": False,
+            **({"namespaces": summary} if summary is not None else {})
+        })
+    
+    except Exception as e:
+        # Headers are already sent once streaming starts, so failures are reported in-band
+        log_event("query.failed", level=logging.ERROR, namespace=request.namespace, error=str(e), stream=True)
+        yield _sse("error", {"detail": f"Query failed: {str(e)}"})
+
+
+@router.post("/query/stream")
+async def query_documents_stream(request: QueryRequest):
+    start_time = time.time()
+    # Resolved before streaming starts, so a bad namespace list is still an HTTP error
+    try:
+        namespaces = await _fanout_namespaces(request)
+    except HTTPException:
+        raise
     except Exception as e:
+        log_event("query.failed", level=logging.ERROR, namespace=request.namespace, error=str(e), stream=True)
         raise HTTPException(status_code=500, detail=f"Query failed: {str(e)}")
+    return StreamingResponse(
+        _stream_events(request, namespaces, start_time),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 
 @router.get("/health")
@@ -1,30 +1,69 @@
 from fastapi import APIRouter, UploadFile, File, Form, HTTPException
-from typing import Optional
-import time
+from fastapi.responses import JSONResponse
+from typing import List, Optional
+import shutil
 import os
 
-from services.chunker import chunk_text
-from services.embedder import embed_texts
-from services.vector_store import upsert_vectors
-from config import MAX_FILE_SIZE_MB, ALLOWED_EXTENSIONS
+from services.archive import ArchiveError, is_archive, extract_archive, safe_relative_path, ARCHIVE_EXTENSIONS
+from services.executors import run_blocking
+from services.jobs import new_job_id, upload_path, submit_job, wait_for_job
+from config import MAX_FILE_SIZE_MB, ALLOWED_EXTENSIONS, BATCH_MAX_FILES
 
 router = APIRouter(prefix="/api", tags=["upload"])
 
 
+def _file_size(file: UploadFile) -> int:
+    if file.size is not None:
+        return file.size
+    file.file.seek(0, os.SEEK_END)
+    size = file.file.tell()
+    file.file.seek(0)
+    return size
+
+
+def _save_upload(file: UploadFile, path: str):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    file.file.seek(0)
+    with open(path, "wb") as out:
+        shutil.copyfileobj(file.file, out, 1024 * 1024)
+
+
+def _save_text(text: str, path: str):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as out:
+        out.write(text)
+
+
+def _save_batch(files: List[UploadFile], paths: List[str], directory: str):
+    for file, path in zip(files, paths):
+        _save_upload(file, os.path.join(directory, *path.split("/")))
+
+
+def _check_size(file: UploadFile, name: str):
+    if _file_size(file) > MAX_FILE_SIZE_MB * 1024 * 1024:
+        raise HTTPException(status_code=400, detail=f"{name} is too large. Max size: {MAX_FILE_SIZE_MB}MB")
+
+
+async def _indexed_response(job_id: str, message: str, **extra):
+    job = await wait_for_job(job_id)
+    if job["status"] == "failed":
+        raise HTTPException(status_code=job["error_status"] or 500, detail=job["error"])
+    return {"success": True, "message": message, "job_id": job_id, **extra, "stats": job["result"]}
+
+
 @router.post("/upload")
 async def upload_document(
     file: Optional[UploadFile] = File(None),
     text: Optional[str] = Form(None),
     title: Optional[str] = Form("Untitled Document"),
-    namespace: Optional[str] = Form(None)
+    namespace: Optional[str] = Form(None),
+    wait: bool = Form(False)
 ):
-    start_time = time.time()
-    
     try:
         if not file and not text:
             raise HTTPException(status_code=400, detail="Provide either a file or text content")
         
-        content = ""
+        job_id = new_job_id()
         source = "direct_input"
         
         if file:
@@ -35,59 +74,106 @@ async def upload_document(
                     detail=f"File type not allowed. Allowed: {ALLOWED_EXTENSIONS}"
                 )
             
-            file_content = await file.read()
-            size_mb = len(file_content) / (1024 * 1024)
+            size_mb = _file_size(file) / (1024 * 1024)
             if size_mb > MAX_FILE_SIZE_MB:
                 raise HTTPException(
                     status_code=400,
                     detail=f"File too large. Max size: {MAX_FILE_SIZE_MB}MB"
                 )
             
-            if ext == ".pdf":
-                try:
-                    from pypdf import PdfReader
-                    import io
-                    reader = PdfReader(io.BytesIO(file_content))
-                    content = "\n\n".join([page.extract_text() for page in reader.pages])
-                except Exception as e:
-                    raise HTTPException(status_code=400, detail=f"Error reading PDF: {str(e)}")
-            else:
-                content = file_content.decode("utf-8")
+            # The multipart parser's spool file goes away with the request, so the job gets its own copy
+            path = upload_path(job_id, ext)
+            await run_blocking("ingest", _save_upload, file, path)
+            kind = "pdf" if ext == ".pdf" else "text"
             
             source = file.filename
             if not title or title == "Untitled Document":
                 title = os.path.splitext(file.filename)[0]
         else:
-            content = text
+            path = upload_path(job_id, ".txt")
+            await run_blocking("ingest", _save_text, text, path)
+            kind = "text"
         
-        if not content or len(content.strip()) < 10:
-            raise HTTPException(status_code=400, detail="Content too short")
+        job = await submit_job(job_id, kind, path, source=source, title=title, namespace=namespace)
         
-        chunks = chunk_text(content, source=source, title=title)
+        if wait:
+            return await _indexed_response(job_id, "Document indexed successfully")
         
-        if not chunks:
-            raise HTTPException(status_code=400, detail="No chunks generated from content")
+        return JSONResponse(status_code=202, content={
+            "success": True,
+            "message": "Document queued for indexing",
+            "job_id": job_id,
+            "status": job["status"],
+            "stats": {"namespace": job["namespace"]}
+        })
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
+
+
+@router.post("/upload/batch")
+async def upload_batch(
+    files: Optional[List[UploadFile]] = File(None),
+    archive: Optional[UploadFile] = File(None),
+    namespace: Optional[str] = Form(None),
+    wait: bool = Form(False)
+):
+    """Index many documents as one job. Their chunks are embedded and upserted in shared batches,
+    and the job result has a stats entry per document."""
+    job_id = new_job_id()
+    directory = upload_path(job_id, "")
+    try:
+        if not files and not archive:
+            raise HTTPException(status_code=400, detail="Provide files or an archive")
         
-        chunk_texts = [chunk["text"] for chunk in chunks]
-        embeddings = await embed_texts(chunk_texts)
+        skipped = []
+        if archive:
+            if not is_archive(archive.filename):
+                raise HTTPException(status_code=400, detail=f"Archive type not allowed. Allowed: {list(ARCHIVE_EXTENSIONS)}")
+            _check_size(archive, archive.filename)
+            archive.file.seek(0)
+            try:
+                sources, skipped = await run_blocking("ingest", extract_archive, archive.file, archive.filename, directory)
+            except ArchiveError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+        else:
+            if len(files) > BATCH_MAX_FILES:
+                raise HTTPException(status_code=400, detail=f"Too many documents. Max per batch: {BATCH_MAX_FILES}")
+            sources = [safe_relative_path(file.filename or "") for file in files]
+            for file, source in zip(files, sources):
+                if source is None or os.path.splitext(source)[1].lower() not in ALLOWED_EXTENSIONS:
+                    raise HTTPException(
+                        status_code=400,
+                        detail=f"File type not allowed for {file.filename}. Allowed: {ALLOWED_EXTENSIONS}"
+                    )
+                _check_size(file, file.filename)
+            # Each file's name is its source, which re-uploads are matched on
+            if len(set(sources)) < len(sources):
+                raise HTTPException(status_code=400, detail="Duplicate file names in batch")
+            await run_blocking("ingest", _save_batch, files, sources, directory)
         
-        result = await upsert_vectors(embeddings, chunks, namespace=namespace)
+        if not sources:
+            raise HTTPException(status_code=400, detail=f"No documents found. Allowed: {ALLOWED_EXTENSIONS}")
         
-        processing_time = time.time() - start_time
+        job = await submit_job(job_id, "batch", directory, source="batch", title=f"{len(sources)} documents", namespace=namespace)
         
-        return {
+        if wait:
+            return await _indexed_response(job_id, "Documents indexed successfully", skipped=skipped)
+        return JSONResponse(status_code=202, content={
             "success": True,
-            "message": "Document indexed successfully",
-            "stats": {
-                "chunks_created": len(chunks),
-                "namespace": result["namespace"],
-                "processing_time_ms": int(processing_time * 1000),
-                "avg_chunk_tokens": sum(c["token_count"] for c in chunks) // len(chunks)
-            }
-        }
+            "message": "Documents queued for indexing",
+            "job_id": job_id,
+            "status": job["status"],
+            "documents": sources,
+            "skipped": skipped,
+            "stats": {"namespace": job["namespace"]}
+        })
     except HTTPException:
+        shutil.rmtree(directory, ignore_errors=True)
         raise
     except Exception as e:
+        shutil.rmtree(directory, ignore_errors=True)
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
 
 
@@ -0,0 +1,153 @@
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from typing import Deque, Dict, Optional
+import sys
+import os
+
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import ADMISSION_POOLS, LOG_SAMPLE_RATE
+from services.logs import log_event
+from services.metrics import ADMISSION_IN_FLIGHT, ADMISSION_QUEUE_DEPTH, ADMISSION_WAIT_SECONDS, ADMISSION_REJECTED
+
+# Weight of the latest sample in the moving averages of hold and wait times
+EWMA_ALPHA = 0.2
+
+
+class Rejected(Exception):
+    def __init__(self, reason: str, retry_after_s: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after_s = retry_after_s
+
+
+class AdmissionPool:
+    """Runs at most `concurrency` requests at once, with up to `max_queue` more waiting in
+    arrival order. A request is turned away straight away when the queue is full or when, going
+    by how long requests have recently held a slot, it wouldn't get one within `max_wait_s`; one
+    that is queued and still waiting at `max_wait_s` is turned away then. Admitted requests
+    therefore keep their usual latency while the excess fails fast.
+    """
+    
+    def __init__(self, name: str, concurrency: int, max_queue: int, max_wait_s: float):
+        self.name = name
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.max_wait_s = max_wait_s
+        self.running = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._hold_s = 0.0
+        self._wait_s = 0.0
+    
+    def queued(self) -> int:
+        return len(self._waiters)
+    
+    def expected_wait(self) -> float:
+        """Wait for a request arriving now: the queue ahead of it drains `concurrency` at a time."""
+        return self._hold_s * (len(self._waiters) + 1) / self.concurrency
+    
+    def retry_after(self) -> int:
+        return max(1, math.ceil(max(self.expected_wait(), self._wait_s)))
+    
+    def _update_gauges(self):
+        ADMISSION_IN_FLIGHT.labels(self.name).set(self.running)
+        ADMISSION_QUEUE_DEPTH.labels(self.name).set(len(self._waiters))
+    
+    def _admitted(self, waited_s: float):
+        self._wait_s += EWMA_ALPHA * (waited_s - self._wait_s)
+        ADMISSION_WAIT_SECONDS.labels(self.name).observe(waited_s)
+        self._update_gauges()
+    
+    async def acquire(self):
+        if self.running < self.concurrency and not self._waiters:
+            self.running += 1
+            self._admitted(0.0)
+            return
+        if len(self._waiters) >= self.max_queue:
+            raise Rejected("queue_full", self.retry_after())
+        if self.expected_wait() > self.max_wait_s:
+            raise Rejected("deadline", self.retry_after())
+        
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._update_gauges()
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout=self.max_wait_s)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done():
+                # The slot was handed over just as this request gave up on it; pass it on
+                self.release(0.0)
+            else:
+                waiter.cancel()
+                self._waiters.remove(waiter)
+                self._update_gauges()
+            if isinstance(e, asyncio.TimeoutError):
+                raise Rejected("deadline", self.retry_after())
+            raise
+        self._admitted(time.perf_counter() - start)
+    
+    def release(self, held_s: float):
+        if held_s:
+            self._hold_s += EWMA_ALPHA * (held_s - self._hold_s)
+        # The slot passes straight to the longest waiter, so `running` doesn't change
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                self._update_gauges()
+                return
+        self.running -= 1
+        self._update_gauges()
+
+
+def build_pools() -> Dict[str, AdmissionPool]:
+    return {name: AdmissionPool(name, **settings) for name, settings in ADMISSION_POOLS.items()}
+
+
+class AdmissionControlMiddleware:
+    """Admits requests whose path starts with one of `routes` through that route's pool, for
+    the whole response including a streamed body, and answers the rest with a 503."""
+    
+    def __init__(self, app: ASGIApp, routes: Dict[str, str], pools: Optional[Dict[str, AdmissionPool]] = None):
+        self.app = app
+        self.routes = routes
+        self.pools = pools if pools is not None else build_pools()
+    
+    def _pool_for(self, path: str) -> Optional[AdmissionPool]:
+        for prefix, name in self.routes.items():
+            if path.startswith(prefix):
+                return self.pools[name]
+        return None
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        pool = self._pool_for(scope["path"]) if scope["type"] == "http" and scope["method"] != "OPTIONS" else None
+        if pool is None:
+            await self.app(scope, receive, send)
+            return
+        
+        try:
+            await pool.acquire()
+        except Rejected as e:
+            ADMISSION_REJECTED.labels(pool.name, e.reason).inc()
+            # Sheds come in floods under overload; ADMISSION_REJECTED has the exact counts
+            log_event("admission.rejected", level=logging.WARNING, sample_rate=LOG_SAMPLE_RATE, pool=pool.name,
+                      reason=e.reason, retry_after_s=e.retry_after_s, running=pool.running, queued=pool.queued())
+            response = JSONResponse(
+                status_code=503,
+                content={"detail": "Server is overloaded, retry later", "retry_after_s": e.retry_after_s},
+                headers={"Retry-After": str(e.retry_after_s)}
+            )
+            await response(scope, receive, send)
+            return
+        
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            pool.release(time.perf_counter() - start)
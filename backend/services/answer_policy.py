@@ -0,0 +1,41 @@
+from typing import List, Dict, Tuple
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import (
+    ANSWER_CONFIDENCE_FLOOR, ANSWER_RELATIVE_SCORE, ANSWER_EASY_CONFIDENCE, ANSWER_EASY_MAX_SOURCES
+)
+from services.metrics import ANSWER_DECISIONS
+from services.reranker import check_sufficient_context
+
+LOW_CONFIDENCE_ANSWER = "I cannot answer this based on the provided context. None of the retrieved sources matches the question closely enough."
+
+
+def plan_answer(sources: List[Dict]) -> Tuple[List[Dict], Dict]:
+    """Decide from the sources' rerank scores how to answer, and which sources to answer from.
+    
+    Sources without a rerank score are retrieval's fallback when reranking kept nothing, so they
+    count as zero confidence. The decision is one of:
+      skip     - the top score is below ANSWER_CONFIDENCE_FLOOR; answer LOW_CONFIDENCE_ANSWER
+      light    - a confident top source with few others close to it; a short, cheaper answer
+      generate - the usual answer
+    """
+    confidence = sources[0].get("rerank_score", 0.0) if sources else 0.0
+    if ANSWER_CONFIDENCE_FLOOR > 0 and not check_sufficient_context(sources, ANSWER_CONFIDENCE_FLOOR):
+        decision = "skip"
+        kept = []
+    else:
+        # Sources well below the best one add prompt tokens more than they add to the answer
+        cutoff = confidence * ANSWER_RELATIVE_SCORE
+        kept = [doc for doc in sources if doc.get("rerank_score", 0.0) >= cutoff] or sources
+        easy = confidence >= ANSWER_EASY_CONFIDENCE and len(kept) <= ANSWER_EASY_MAX_SOURCES
+        decision = "light" if easy else "generate"
+    
+    ANSWER_DECISIONS.labels(decision).inc()
+    return kept, {
+        "decision": decision,
+        "confidence": round(float(confidence), 4),
+        "sources_considered": len(sources),
+        "sources_used": len(kept)
+    }
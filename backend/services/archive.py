@@ -0,0 +1,79 @@
+import posixpath
+import tarfile
+import zipfile
+from typing import List, Optional, Tuple, BinaryIO
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import ALLOWED_EXTENSIONS, BATCH_MAX_FILES, MAX_FILE_SIZE_MB, MAX_ARCHIVE_EXTRACTED_MB
+
+ARCHIVE_EXTENSIONS = (".zip", ".tar", ".tar.gz", ".tgz")
+
+
+class ArchiveError(ValueError):
+    pass
+
+
+def is_archive(filename: str) -> bool:
+    return filename.lower().endswith(ARCHIVE_EXTENSIONS)
+
+
+def safe_relative_path(name: str) -> Optional[str]:
+    """`name` as a relative path that stays inside the upload directory, or None if it can't."""
+    path = posixpath.normpath(name.replace("\\", "/")).lstrip("/")
+    if path in ("", ".") or path.startswith("../") or path == ".." or any(part.startswith(".") for part in path.split("/")):
+        return None
+    return path
+
+
+def _members(archive: BinaryIO, filename: str):
+    """Yield (name, size, open) for each regular file in a zip or tar archive."""
+    if filename.lower().endswith(".zip"):
+        with zipfile.ZipFile(archive) as zf:
+            for info in zf.infolist():
+                if not info.is_dir():
+                    yield info.filename, info.file_size, lambda info=info: zf.open(info)
+    else:
+        with tarfile.open(fileobj=archive, mode="r:*") as tf:
+            for member in tf:
+                # Links and devices are skipped; only regular files are extracted
+                if member.isfile():
+                    yield member.name, member.size, lambda member=member: tf.extractfile(member)
+
+
+def extract_archive(archive: BinaryIO, filename: str, directory: str) -> Tuple[List[str], List[str]]:
+    """Extract the supported documents in an archive into `directory`.
+    
+    Returns the relative paths extracted and the member names skipped. Sizes are checked as
+    the bytes are written rather than trusted from the archive headers.
+    """
+    extracted, skipped = [], []
+    total = 0
+    try:
+        for name, size, open_member in _members(archive, filename):
+            path = safe_relative_path(name)
+            if path is None or path in extracted or os.path.splitext(path)[1].lower() not in ALLOWED_EXTENSIONS:
+                skipped.append(name)
+                continue
+            if len(extracted) == BATCH_MAX_FILES:
+                raise ArchiveError(f"Too many documents. Max per batch: {BATCH_MAX_FILES}")
+            if size > MAX_FILE_SIZE_MB * 1024 * 1024:
+                raise ArchiveError(f"{name} is too large. Max size: {MAX_FILE_SIZE_MB}MB")
+            
+            target = os.path.join(directory, *path.split("/"))
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open_member() as src, open(target, "wb") as out:
+                while True:
+                    block = src.read(1024 * 1024)
+                    if not block:
+                        break
+                    total += len(block)
+                    if total > MAX_ARCHIVE_EXTRACTED_MB * 1024 * 1024:
+                        raise ArchiveError(f"Archive too large when extracted. Max: {MAX_ARCHIVE_EXTRACTED_MB}MB")
+                    out.write(block)
+            extracted.append(path)
+    # zipfile raises RuntimeError for encrypted members
+    except (zipfile.BadZipFile, tarfile.TarError, RuntimeError) as e:
+        raise ArchiveError(f"Error reading archive: {str(e)}")
+    return extracted, skipped
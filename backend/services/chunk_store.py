@@ -0,0 +1,84 @@
+import sqlite3
+import threading
+from typing import Dict, List, Iterable, Optional
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import CHUNK_STORE_DB_PATH
+
+SQLITE_MAX_PARAMS = 500
+FIELDS = ("text", "source", "title", "chunk_index", "term_freqs", "doc_len")
+
+
+class ChunkStore:
+    """Chunk text and rerank features by (namespace, chunk id), kept in SQLite, so the vector
+    index only has to return ids and scores. Rows are shaped like the index metadata they replace."""
+    
+    def __init__(self, db_path: str):
+        self._db_path = db_path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+    
+    @property
+    def _db(self) -> sqlite3.Connection:
+        # Opened on first use, under the lock, or by connect() during warm-up rather than at import
+        if self._conn is None:
+            if self._db_path != ":memory:":
+                os.makedirs(os.path.dirname(os.path.abspath(self._db_path)), exist_ok=True)
+            db = sqlite3.connect(self._db_path, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS chunks ("
+                "namespace TEXT NOT NULL, chunk_id TEXT NOT NULL, text TEXT NOT NULL, source TEXT, title TEXT, "
+                "chunk_index INTEGER, term_freqs TEXT, doc_len INTEGER, "
+                "PRIMARY KEY (namespace, chunk_id)) WITHOUT ROWID"
+            )
+            db.commit()
+            self._conn = db
+        return self._conn
+    
+    def connect(self):
+        with self._lock:
+            self._db
+    
+    def put_many(self, namespace: str, chunks: Dict[str, Dict]):
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO chunks VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(namespace, chunk_id, *(chunk.get(field) for field in FIELDS)) for chunk_id, chunk in chunks.items()]
+            )
+            self._db.commit()
+    
+    def get_many(self, namespace: str, chunk_ids: List[str]) -> Dict[str, Dict]:
+        found = {}
+        unique_ids = list(dict.fromkeys(chunk_ids))
+        with self._lock:
+            for i in range(0, len(unique_ids), SQLITE_MAX_PARAMS):
+                batch = unique_ids[i:i + SQLITE_MAX_PARAMS]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._db.execute(
+                    f"SELECT chunk_id, {', '.join(FIELDS)} FROM chunks WHERE namespace = ? AND chunk_id IN ({placeholders})",
+                    [namespace, *batch]
+                ).fetchall()
+                for chunk_id, *values in rows:
+                    # Chunks indexed before rerank features were stored have no term_freqs
+                    found[chunk_id] = {field: value for field, value in zip(FIELDS, values) if value is not None}
+        return found
+    
+    def delete(self, namespace: str, chunk_ids: Iterable[str]):
+        with self._lock:
+            self._db.executemany(
+                "DELETE FROM chunks WHERE namespace = ? AND chunk_id = ?",
+                [(namespace, chunk_id) for chunk_id in chunk_ids]
+            )
+            self._db.commit()
+    
+    def delete_namespace(self, namespace: str):
+        with self._lock:
+            self._db.execute("DELETE FROM chunks WHERE namespace = ?", (namespace,))
+            self._db.commit()
+
+
+chunk_store = ChunkStore(CHUNK_STORE_DB_PATH)
@@ -1,17 +1,28 @@
 import tiktoken
-from typing import List, Dict
+from functools import lru_cache
+from typing import List, Dict, Iterable, Iterator, Tuple
 import re
 import sys
 import os
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from config import CHUNK_SIZE, CHUNK_OVERLAP
+from services.reranker import build_rerank_features
 
-encoding = tiktoken.get_encoding("cl100k_base")
+
+@lru_cache(maxsize=1)
+def get_encoding() -> tiktoken.Encoding:
+    # Loading the BPE ranks takes a few hundred ms, so it happens on first use or during warm-up
+    return tiktoken.get_encoding("cl100k_base")
+
+
+WINDOW_CACHE_MAX_CHARS = 256
+
+_SENTENCE_BREAK = re.compile(r'(?<=[.!?])\s+')
 
 
 def count_tokens(text: str) -> int:
-    return len(encoding.encode(text))
+    return len(get_encoding().encode_ordinary(text))
 
 
 def split_into_sentences(text: str) -> List[str]:
@@ -19,78 +30,216 @@ def split_into_sentences(text: str) -> List[str]:
     return [s.strip() for s in sentences if s.strip()]
 
 
-def chunk_text(text: str, source: str = "unknown", title: str = "Untitled") -> List[Dict]:
-    paragraphs = [p.strip() for p in text.split('\n\n') if p.strip()]
+def _first_cut(text: str) -> int:
+    cut = text.find(" ", 1)
+    while cut != -1 and text[cut - 1].isspace():
+        cut = text.find(" ", cut + 1)
+    return cut if cut != -1 else len(text)
+
+
+def _last_cut(text: str) -> int:
+    cut = text.rfind(" ")
+    while cut > 0 and text[cut - 1].isspace():
+        cut = text.rfind(" ", 0, cut)
+    return max(cut, 0)
+
+
+class _Span:
+    """A piece of text whose interior tokens were counted once, between its first and last cut.
+    
+    A cut is a space preceded by a non-space character. cl100k's pre-tokenizer never puts such
+    a pair in one piece, so a cut is a token boundary in any text that contains the span. The
+    token count of spans joined by separators is therefore the sum of their interiors plus the
+    counts of the short windows between one span's last cut and the next span's first cut.
+    """
+    __slots__ = ("text", "first_cut", "last_cut", "interior_tokens")
     
-    chunks = []
-    current_chunk = ""
-    current_tokens = 0
+    def __init__(self, text: str):
+        self.text = text
+        self.first_cut = _first_cut(text)
+        self.last_cut = _last_cut(text)
+        self.interior_tokens = _count(text[self.first_cut:self.last_cut]) if self.first_cut < self.last_cut else 0
+    
+    @property
+    def has_cut(self) -> bool:
+        return self.first_cut <= self.last_cut and 0 < self.first_cut < len(self.text)
+
+
+def _count(text: str) -> int:
+    # Pieces are plain document text, so special-token strings are not treated specially
+    return len(get_encoding().encode_ordinary(text)) if text else 0
+
+
+@lru_cache(maxsize=65536)
+def _count_short(text: str) -> int:
+    return _count(text)
+
+
+def _count_window(text: str) -> int:
+    # The same windows come up when counting a paragraph, its sentences and then its chunk.
+    # Text without spaces has no cuts, so a window can be a whole paragraph; don't cache those.
+    return _count_short(text) if len(text) <= WINDOW_CACHE_MAX_CHARS else _count(text)
+
+
+def _joined_tokens(spans: List[_Span], separators: List[str]) -> int:
+    """Token count of spans[0] + separators[0] + spans[1] + ..., counting only the windows."""
+    total = 0
+    window = []
+    for i, span in enumerate(spans):
+        if i:
+            window.append(separators[i - 1])
+        if span.has_cut:
+            window.append(span.text[:span.first_cut])
+            total += _count_window("".join(window)) + span.interior_tokens
+            window = [span.text[span.last_cut:]]
+        else:
+            window.append(span.text)
+    return total + _count_window("".join(window))
+
+
+def _split_paragraph(paragraph: str) -> Tuple[List[str], List[str]]:
+    # Same pieces as split_into_sentences on a stripped paragraph, plus the whitespace between them
+    sentences, separators, start = [], [], 0
+    for match in _SENTENCE_BREAK.finditer(paragraph):
+        sentences.append(paragraph[start:match.start()])
+        separators.append(match.group())
+        start = match.end()
+    sentences.append(paragraph[start:])
+    return sentences, separators
+
+
+class _Paragraph:
+    __slots__ = ("spans", "separators", "tokens")
+    
+    def __init__(self, text: str):
+        # Every token is at least one byte, so a paragraph this short can't need sentence splitting
+        if len(text.encode("utf-8")) <= CHUNK_SIZE:
+            self.spans, self.separators = [_Span(text)], []
+        else:
+            sentences, self.separators = _split_paragraph(text)
+            self.spans = [_Span(sentence) for sentence in sentences]
+        self.tokens = _joined_tokens(self.spans, self.separators)
+
+
+class _ChunkBuilder:
+    """Accumulates one chunk as spans and separators, joining the text once when flushed."""
+    
+    def __init__(self):
+        self.spans: List[_Span] = []
+        self.separators: List[str] = []
+        self.tokens = 0
+    
+    def __bool__(self) -> bool:
+        return bool(self.spans)
+    
+    def add(self, spans: List[_Span], separators: List[str], tokens: int, joiner: str):
+        if self.spans:
+            self.separators.append(joiner)
+        self.spans.extend(spans)
+        self.separators.extend(separators)
+        self.tokens += tokens
+    
+    def text(self) -> str:
+        parts = [self.spans[0].text]
+        for separator, span in zip(self.separators, self.spans[1:]):
+            parts.append(separator)
+            parts.append(span.text)
+        return "".join(parts)
+
+
+def _pack_chunks(paragraphs: Iterable[_Paragraph]) -> Iterator[_ChunkBuilder]:
+    current = _ChunkBuilder()
     
     for para in paragraphs:
-        para_tokens = count_tokens(para)
-        
-        if para_tokens > CHUNK_SIZE:
-            if current_chunk:
-                chunks.append(current_chunk)
-                current_chunk = ""
-                current_tokens = 0
+        if para.tokens > CHUNK_SIZE:
+            if current:
+                yield current
+                current = _ChunkBuilder()
             
-            sentences = split_into_sentences(para)
-            for sentence in sentences:
-                sent_tokens = count_tokens(sentence)
-                
-                if current_tokens + sent_tokens <= CHUNK_SIZE:
-                    current_chunk += (" " if current_chunk else "") + sentence
-                    current_tokens += sent_tokens
+            for sentence in para.spans:
+                sent_tokens = _joined_tokens([sentence], [])
+                if current.tokens + sent_tokens <= CHUNK_SIZE:
+                    current.add([sentence], [], sent_tokens, " ")
                 else:
-                    if current_chunk:
-                        chunks.append(current_chunk)
-                    current_chunk = sentence
-                    current_tokens = sent_tokens
+                    if current:
+                        yield current
+                    current = _ChunkBuilder()
+                    current.add([sentence], [], sent_tokens, " ")
         
-        elif current_tokens + para_tokens <= CHUNK_SIZE:
-            current_chunk += ("\n\n" if current_chunk else "") + para
-            current_tokens += para_tokens
+        elif current.tokens + para.tokens <= CHUNK_SIZE:
+            current.add(para.spans, para.separators, para.tokens, "\n\n")
         
         else:
-            if current_chunk:
-                chunks.append(current_chunk)
-            current_chunk = para
-            current_tokens = para_tokens
-    
-    if current_chunk:
-        chunks.append(current_chunk)
+            if current:
+                yield current
+            current = _ChunkBuilder()
+            current.add(para.spans, para.separators, para.tokens, "\n\n")
     
-    if CHUNK_OVERLAP > 0 and len(chunks) > 1:
-        overlapped_chunks = []
-        for i, chunk in enumerate(chunks):
-            if i > 0:
-                prev_sentences = split_into_sentences(chunks[i-1])
-                overlap_text = ""
-                overlap_tokens = 0
-                
-                for sent in reversed(prev_sentences):
-                    sent_tokens = count_tokens(sent)
-                    if overlap_tokens + sent_tokens <= CHUNK_OVERLAP:
-                        overlap_text = sent + " " + overlap_text
-                        overlap_tokens += sent_tokens
-                    else:
-                        break
-                
-                if overlap_text:
-                    chunk = overlap_text.strip() + " " + chunk
-            
-            overlapped_chunks.append(chunk)
-        chunks = overlapped_chunks
-    
-    result = []
-    for i, chunk in enumerate(chunks):
-        result.append({
+    if current:
+        yield current
+
+
+def _overlap_prefix(previous_chunk: str) -> str:
+    """Trailing sentences of the previous chunk that fit in CHUNK_OVERLAP tokens."""
+    overlap_parts = []
+    overlap_tokens = 0
+    for sent in reversed(split_into_sentences(previous_chunk)):
+        sent_tokens = _count(sent)
+        if overlap_tokens + sent_tokens <= CHUNK_OVERLAP:
+            overlap_parts.append(sent)
+            overlap_tokens += sent_tokens
+        else:
+            break
+    return " ".join(reversed(overlap_parts))
+
+
+def iter_paragraphs(pieces: Iterable[str]) -> Iterator[str]:
+    """Stripped, non-empty paragraphs of "".join(pieces), without holding the whole text."""
+    pending: List[str] = []
+    for piece in pieces:
+        if not piece:
+            # An empty piece would hide a "\n\n" split across its neighbours
+            continue
+        # A "\n\n" can straddle two pieces, so only split once the buffered text might contain one
+        straddles = pending and pending[-1].endswith("\n") and piece.startswith("\n")
+        if "\n\n" not in piece and not straddles:
+            pending.append(piece)
+            continue
+        paragraphs = ("".join(pending) + piece).split("\n\n")
+        pending = [paragraphs.pop()]
+        for para in paragraphs:
+            if para.strip():
+                yield para.strip()
+    tail = "".join(pending).strip()
+    if tail:
+        yield tail
+
+
+def iter_chunks(paragraphs: Iterable[str], source: str = "unknown", title: str = "Untitled") -> Iterator[Dict]:
+    """Chunk a stream of paragraphs, yielding each chunk as soon as the next one starts."""
+    previous_body = None
+    for i, builder in enumerate(_pack_chunks(_Paragraph(para) for para in paragraphs)):
+        body = builder.text()
+        prefix = _overlap_prefix(previous_body) if previous_body is not None and CHUNK_OVERLAP > 0 else ""
+        if prefix:
+            # The overlap is counted as one more span in front of the body, so the chunk
+            # is never re-tokenized as a whole
+            chunk = prefix + " " + body
+            token_count = _joined_tokens([_Span(prefix)] + builder.spans, [" "] + builder.separators)
+        else:
+            chunk = body
+            token_count = _joined_tokens(builder.spans, builder.separators)
+        previous_body = body
+        
+        yield {
             "text": chunk,
             "source": source,
             "title": title,
             "chunk_index": i,
-            "token_count": count_tokens(chunk)
-        })
-    
-    return result
+            "token_count": token_count,
+            **build_rerank_features(chunk)
+        }
+
+
+def chunk_text(text: str, source: str = "unknown", title: str = "Untitled") -> List[Dict]:
+    return list(iter_chunks(iter_paragraphs([text]), source=source, title=title))
@@ -0,0 +1,140 @@
+import re
+from typing import List, Dict, Optional, Tuple
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import CONTEXT_TOKEN_BUDGET, CONTEXT_DUPLICATE_SIMILARITY
+from services.chunker import count_tokens, get_encoding
+
+SHINGLE_WORDS = 5
+
+_WORD = re.compile(r"\w+")
+# Chunk overlaps are whole sentences, split the way chunker.split_into_sentences splits them
+_SENTENCE_END = re.compile(r"[.!?](?=\s)")
+
+
+def _shingles(text: str) -> frozenset:
+    words = _WORD.findall(text.lower())
+    if len(words) <= SHINGLE_WORDS:
+        return frozenset([" ".join(words)])
+    return frozenset(" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1))
+
+
+def _is_duplicate(shingles: frozenset, kept: List[frozenset]) -> bool:
+    # Measured against the smaller text, so a chunk contained in a longer one also counts
+    for other in kept:
+        smaller = min(len(shingles), len(other))
+        if smaller and len(shingles & other) / smaller >= CONTEXT_DUPLICATE_SIMILARITY:
+            return True
+    return False
+
+
+def overlap_length(previous: str, following: str) -> int:
+    """Length of the longest run of whole sentences at the start of `following` that also ends
+    `previous`, which is the overlap the chunker copies into the next chunk of a document."""
+    tail = " ".join(previous.split())
+    best = 0
+    for match in _SENTENCE_END.finditer(following):
+        # The chunker joins overlap sentences with single spaces, so compare with whitespace collapsed
+        head = " ".join(following[:match.end()].split())
+        if len(head) > len(tail):
+            break
+        if tail.endswith(head) and (len(head) == len(tail) or tail[-len(head) - 1] == " "):
+            best = match.end()
+    return best
+
+
+def _passages(sources: List[Dict], counts: Dict[str, int]) -> Tuple[List[Dict], int]:
+    """Join chunks that are consecutive in the same document into one passage, dropping the
+    overlap between them. Passages keep the rank of their best chunk. A document is a source
+    within a namespace, since queries over several namespaces can see two files of one name."""
+    by_document: Dict[Tuple[Optional[str], str], List[Tuple[int, Dict]]] = {}
+    for rank, doc in enumerate(sources):
+        by_document.setdefault((doc.get("namespace"), doc.get("source", "unknown")), []).append((rank, doc))
+    
+    passages = []
+    merged = 0
+    for chunks in by_document.values():
+        chunks.sort(key=lambda item: (item[1].get("chunk_index") is None, item[1].get("chunk_index") or 0))
+        current = None
+        for rank, doc in chunks:
+            index = doc.get("chunk_index")
+            if current is not None and index is not None and current["chunk_indices"][-1] == index - 1:
+                overlap = overlap_length(current["last_text"], doc["text"])
+                current["text"] += doc["text"][overlap:] if overlap else "\n\n" + doc["text"]
+                current["chunk_indices"].append(index)
+                current["last_text"] = doc["text"]
+                current["rank"] = min(current["rank"], rank)
+                current["score"] = max(current["score"], doc.get("score", 0))
+                current["rerank_score"] = max(current["rerank_score"], doc.get("rerank_score", doc.get("score", 0)))
+                merged += 1
+                continue
+            current = {
+                "rank": rank,
+                "text": doc["text"],
+                "source": doc.get("source", "unknown"),
+                "title": doc.get("title", "Untitled"),
+                "chunk_indices": [index] if index is not None else [],
+                "score": doc.get("score", 0),
+                "rerank_score": doc.get("rerank_score", doc.get("score", 0)),
+                "last_text": doc["text"]
+            }
+            if doc.get("namespace") is not None:
+                current["namespace"] = doc["namespace"]
+            passages.append(current)
+    
+    passages.sort(key=lambda p: p["rank"])
+    for passage in passages:
+        if passage["text"] not in counts:
+            counts[passage["text"]] = count_tokens(passage["text"])
+        passage["token_count"] = counts[passage["text"]]
+    return passages, merged
+
+
+def pack_sources(sources: List[Dict], budget: Optional[int] = None) -> Tuple[List[Dict], Dict]:
+    """Pick sources for the prompt in rank order until their text fills `budget` tokens.
+    
+    Near-duplicates of a source already picked are skipped, and consecutive chunks of one
+    document are merged into a single passage without their shared overlap, so neither is
+    paid for twice. A source that doesn't fit is skipped in favour of smaller, lower-ranked
+    ones; the top source is always kept, cut down to the budget if it has to be.
+    """
+    budget = CONTEXT_TOKEN_BUDGET if budget is None else budget
+    counts: Dict[str, int] = {}
+    picked: List[Dict] = []
+    kept_shingles: List[frozenset] = []
+    duplicates = over_budget = 0
+    
+    for doc in sources:
+        shingles = _shingles(doc["text"])
+        if _is_duplicate(shingles, kept_shingles):
+            duplicates += 1
+            continue
+        passages, _ = _passages(picked + [doc], counts)
+        if picked and sum(p["token_count"] for p in passages) > budget:
+            over_budget += 1
+            continue
+        picked.append(doc)
+        kept_shingles.append(shingles)
+    
+    passages, merged = _passages(picked, counts)
+    truncated = False
+    if passages and passages[0]["token_count"] > budget:
+        tokens = get_encoding().encode_ordinary(passages[0]["text"])
+        passages[0]["text"] = get_encoding().decode(tokens[:budget])
+        passages[0]["token_count"] = budget
+        truncated = True
+    for passage in passages:
+        del passage["rank"], passage["last_text"]
+    
+    return passages, {
+        "budget_tokens": budget,
+        "context_tokens": sum(p["token_count"] for p in passages),
+        "sources_retrieved": len(sources),
+        "passages": len(passages),
+        "chunks_merged": merged,
+        "duplicates_removed": duplicates,
+        "dropped_over_budget": over_budget,
+        "truncated": truncated
+    }
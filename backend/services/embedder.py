@@ -1,42 +1,116 @@
+import asyncio
+import random
 import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
 from typing import List
 import sys
 import os
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from config import GEMINI_API_KEY, EMBEDDING_MODEL
+from config import (
+    EMBEDDING_MODEL, EMBED_BATCH_SIZE, EMBED_MAX_CONCURRENCY,
+    EMBED_MAX_RETRIES, EMBED_RETRY_BASE_DELAY, EMBED_CACHE_MAX_ENTRIES,
+    EMBED_CACHE_PATH, EMBED_CACHE_DISK_MAX_ENTRIES
+)
+from services.embedding_cache import EmbeddingCache, make_cache_key
+from services import gemini
+from services.executors import run_blocking
 
-genai.configure(api_key=GEMINI_API_KEY)
+embedding_cache = EmbeddingCache(
+    EMBED_CACHE_MAX_ENTRIES,
+    db_path=EMBED_CACHE_PATH or None,
+    disk_max_entries=EMBED_CACHE_DISK_MAX_ENTRIES
+)
 
+RETRYABLE_ERRORS = (google_exceptions.TooManyRequests, google_exceptions.ServiceUnavailable)
 
-async def embed_text(text: str) -> List[float]:
+
+def _embed_content(content, task_type: str):
+    gemini.configure()
     result = genai.embed_content(
         model=EMBEDDING_MODEL,
-        content=text,
-        task_type="retrieval_document"
+        content=content,
+        task_type=task_type
     )
     return result['embedding']
 
 
+async def warm_up():
+    """One uncached query embedding, which also opens the connection generation requests use."""
+    await run_blocking("gemini_embed", _embed_content, "warm-up", "retrieval_query")
+
+
+def _pool_for(task_type: str) -> str:
+    return "gemini_embed" if task_type == "retrieval_query" else "gemini_embed_ingest"
+
+
+async def _embed_with_retry(content, task_type: str):
+    for attempt in range(EMBED_MAX_RETRIES + 1):
+        try:
+            return await run_blocking(_pool_for(task_type), _embed_content, content, task_type)
+        except RETRYABLE_ERRORS:
+            if attempt == EMBED_MAX_RETRIES:
+                raise
+            # Exponential backoff with jitter so parallel batches don't retry in lockstep
+            delay = EMBED_RETRY_BASE_DELAY * (2 ** attempt)
+            await asyncio.sleep(delay + random.uniform(0, delay))
+
+
+async def _embed_batch(batch: List[str], task_type: str, semaphore: asyncio.Semaphore) -> List[List[float]]:
+    async with semaphore:
+        return await _embed_with_retry(batch, task_type)
+
+
+async def _embed_cached(text: str, task_type: str) -> List[float]:
+    key = make_cache_key(EMBEDDING_MODEL, task_type, text)
+    cached = await run_blocking("embedding_cache", embedding_cache.get_many, [key])
+    if key in cached:
+        return cached[key]
+    embedding = await _embed_with_retry(text, task_type)
+    await run_blocking("embedding_cache", embedding_cache.put_many, {key: embedding})
+    return embedding
+
+
+async def _embed_uncached(texts: List[str], task_type: str) -> List[List[float]]:
+    semaphore = asyncio.Semaphore(EMBED_MAX_CONCURRENCY)
+    batches = [texts[i:i + EMBED_BATCH_SIZE] for i in range(0, len(texts), EMBED_BATCH_SIZE)]
+    
+    # gather() returns results in submission order, so chunk order is preserved
+    results = await asyncio.gather(*(_embed_batch(batch, task_type, semaphore) for batch in batches))
+    return [embedding for batch in results for embedding in batch]
+
+
+async def embed_text(text: str) -> List[float]:
+    return await _embed_cached(text, "retrieval_document")
+
+
 async def embed_texts(texts: List[str], task_type: str = "retrieval_document") -> List[List[float]]:
-    embeddings = []
-    for text in texts:
-        result = genai.embed_content(
-            model=EMBEDDING_MODEL,
-            content=text,
-            task_type=task_type
-        )
-        embeddings.append(result['embedding'])
-    return embeddings
+    if not texts:
+        return []
+    
+    keys = [make_cache_key(EMBEDDING_MODEL, task_type, text) for text in texts]
+    embeddings = await run_blocking("embedding_cache", embedding_cache.get_many, keys)
+    
+    # Only unseen texts go to the API; duplicates within the request are embedded once
+    missing = {}
+    for key, text in zip(keys, texts):
+        if key not in embeddings and key not in missing:
+            missing[key] = text
+    
+    if missing:
+        fresh = dict(zip(missing.keys(), await _embed_uncached(list(missing.values()), task_type)))
+        await run_blocking("embedding_cache", embedding_cache.put_many, fresh)
+        embeddings.update(fresh)
+    
+    return [embeddings[key] for key in keys]
 
 
 async def embed_query(query: str) -> List[float]:
-    result = genai.embed_content(
-        model=EMBEDDING_MODEL,
-        content=query,
-        task_type="retrieval_query"
-    )
-    return result['embedding']
+    return await _embed_cached(query, "retrieval_query")
+
+
+def get_cache_stats() -> dict:
+    return embedding_cache.stats()
 
 
 def get_embedding_dimension() -> int:
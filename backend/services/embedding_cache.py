@@ -0,0 +1,138 @@
+import hashlib
+import sqlite3
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, Optional
+import os
+
+SQLITE_MAX_PARAMS = 500
+TRIM_EVERY_PUTS = 1000
+
+
+def make_cache_key(model: str, task_type: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\x00{task_type}\x00{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    def __init__(self, max_entries: int, db_path: Optional[str] = None, disk_max_entries: int = 0):
+        self.max_entries = max_entries
+        self.disk_max_entries = disk_max_entries
+        # Vectors are held as float32 arrays; a list of Python floats costs ~8x more memory
+        self._memory: "OrderedDict[str, array]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db_path = db_path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._puts_since_trim = 0
+        
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+    
+    @property
+    def _db(self) -> Optional[sqlite3.Connection]:
+        # The disk tier is opened on first use, under the lock, or by connect() during warm-up
+        if self._conn is None and self._db_path:
+            os.makedirs(os.path.dirname(os.path.abspath(self._db_path)), exist_ok=True)
+            db = sqlite3.connect(self._db_path, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+            db.commit()
+            self._conn = db
+        return self._conn
+    
+    def connect(self):
+        with self._lock:
+            self._db
+    
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        found = {}
+        with self._lock:
+            pending = []
+            for key in keys:
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = vector.tolist()
+                    self.memory_hits += 1
+                else:
+                    pending.append(key)
+            
+            if pending and self._db is not None:
+                unique_pending = list(dict.fromkeys(pending))
+                for i in range(0, len(unique_pending), SQLITE_MAX_PARAMS):
+                    batch = unique_pending[i:i + SQLITE_MAX_PARAMS]
+                    placeholders = ",".join("?" * len(batch))
+                    rows = self._db.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                    ).fetchall()
+                    for key, blob in rows:
+                        vector = array("f")
+                        vector.frombytes(blob)
+                        self._remember(key, vector)
+                        found[key] = vector.tolist()
+            
+            for key in pending:
+                if key in found:
+                    self.disk_hits += 1
+                else:
+                    self.misses += 1
+        
+        return found
+    
+    def put_many(self, items: Dict[str, List[float]]):
+        if not items:
+            return
+        with self._lock:
+            vectors = {key: array("f", values) for key, values in items.items()}
+            for key, vector in vectors.items():
+                self._remember(key, vector)
+            
+            if self._db is not None:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                    [(key, vector.tobytes()) for key, vector in vectors.items()]
+                )
+                self._db.commit()
+                self._puts_since_trim += len(vectors)
+                if self.disk_max_entries and self._puts_since_trim >= TRIM_EVERY_PUTS:
+                    self._trim_disk()
+    
+    def _remember(self, key: str, vector: array):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+    
+    def _trim_disk(self):
+        self._puts_since_trim = 0
+        count = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        excess = count - self.disk_max_entries
+        if excess > 0:
+            # rowid grows with every insert/replace, so the lowest rowids are the oldest writes
+            self._db.execute(
+                "DELETE FROM embeddings WHERE rowid IN (SELECT rowid FROM embeddings ORDER BY rowid LIMIT ?)",
+                (excess,)
+            )
+            self._db.commit()
+    
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM embeddings")
+                self._db.commit()
+            self.memory_hits = self.disk_hits = self.misses = 0
+    
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_entries": len(self._memory),
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+                "disk_enabled": bool(self._db_path)
+            }
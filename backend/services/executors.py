@@ -0,0 +1,88 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Callable, Dict
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import DEPENDENCY_POOLS
+from services.metrics import DEPENDENCY_CALLS, DEPENDENCY_CALL_SECONDS
+
+_executors: Dict[str, ThreadPoolExecutor] = {}
+_in_flight: Dict[str, int] = {}
+_lock = threading.Lock()
+
+
+def get_executor(dependency: str) -> ThreadPoolExecutor:
+    with _lock:
+        executor = _executors.get(dependency)
+        if executor is None:
+            executor = ThreadPoolExecutor(
+                max_workers=DEPENDENCY_POOLS[dependency]["max_concurrency"],
+                thread_name_prefix=dependency
+            )
+            _executors[dependency] = executor
+        return executor
+
+
+def start_executors():
+    for dependency in DEPENDENCY_POOLS:
+        get_executor(dependency)
+
+
+def get_timeout(dependency: str) -> float:
+    return DEPENDENCY_POOLS[dependency]["timeout_s"]
+
+
+def _tracked(dependency: str, fn: Callable):
+    with _lock:
+        _in_flight[dependency] = _in_flight.get(dependency, 0) + 1
+    try:
+        return fn()
+    finally:
+        with _lock:
+            _in_flight[dependency] -= 1
+
+
+async def run_blocking(dependency: str, fn: Callable, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(get_executor(dependency), _tracked, dependency, partial(fn, *args, **kwargs))
+    outcome = "error"
+    start = time.perf_counter()
+    try:
+        # The timeout covers time spent queued for a worker as well as the call itself. A timed-out
+        # call keeps its worker until the SDK returns, so the pool size remains a hard cap.
+        result = await asyncio.wait_for(future, timeout=get_timeout(dependency))
+        outcome = "ok"
+        return result
+    except asyncio.TimeoutError:
+        outcome = "timeout"
+        raise
+    except asyncio.CancelledError:
+        outcome = "cancelled"
+        raise
+    finally:
+        DEPENDENCY_CALLS.labels(dependency, outcome).inc()
+        DEPENDENCY_CALL_SECONDS.labels(dependency).observe(time.perf_counter() - start)
+
+
+def executor_stats() -> Dict:
+    with _lock:
+        return {
+            dependency: {
+                "max_concurrency": DEPENDENCY_POOLS[dependency]["max_concurrency"],
+                "in_flight": _in_flight.get(dependency, 0),
+                "queued": executor._work_queue.qsize()
+            }
+            for dependency, executor in _executors.items()
+        }
+
+
+def shutdown_executors():
+    with _lock:
+        for executor in _executors.values():
+            executor.shutdown(wait=False, cancel_futures=True)
+        _executors.clear()
@@ -0,0 +1,20 @@
+import threading
+import google.generativeai as genai
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import GEMINI_API_KEY
+
+_configured = False
+_lock = threading.Lock()
+
+
+def configure():
+    """Give the SDK its API key on first use rather than at import, so a missing or bad key
+    shows up as a failed call (and an unready replica) instead of an import error."""
+    global _configured
+    with _lock:
+        if not _configured:
+            genai.configure(api_key=GEMINI_API_KEY)
+            _configured = True
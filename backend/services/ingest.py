@@ -0,0 +1,282 @@
+import asyncio
+import codecs
+import itertools
+import time
+from typing import List, Dict, Optional, Iterable, Iterator, BinaryIO, Callable, Awaitable, Set, Tuple
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import (
+    INGEST_BATCH_CHUNKS, INGEST_QUEUE_BATCHES, INGEST_EMBED_WORKERS, INGEST_READ_BLOCK_BYTES, INGEST_PARALLEL_DOCUMENTS
+)
+from services.chunker import iter_chunks, iter_paragraphs
+from services.embedder import embed_texts
+from services.executors import run_blocking
+from services.manifest import chunk_manifest
+from services.metrics import INGEST_STAGE_SECONDS, TOKENS
+from services.vector_store import upsert_vectors, delete_vectors, delete_namespace, new_namespace, chunk_id
+
+MIN_CONTENT_CHARS = 10
+
+
+class EmptyDocumentError(ValueError):
+    pass
+
+
+def iter_text_file(file: BinaryIO, block_size: int = INGEST_READ_BLOCK_BYTES) -> Iterator[str]:
+    # The incremental decoder holds back a multi-byte character split across two blocks
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    while True:
+        block = file.read(block_size)
+        if not block:
+            break
+        yield decoder.decode(block)
+    yield decoder.decode(b"", final=True)
+
+
+def iter_pdf_pages(pages: Iterable[str]) -> Iterator[str]:
+    # Pages are separated like "\n\n".join(pages), so a page break always ends a paragraph
+    for i, page in enumerate(pages):
+        if i:
+            yield "\n\n"
+        yield page
+
+
+def _next_batch(chunks: Iterator[Dict], size: int) -> List[Dict]:
+    return list(itertools.islice(chunks, size))
+
+
+class _TimedIterator:
+    """Adds up the time spent waiting on an iterator, so extraction can be told apart from chunking."""
+    
+    def __init__(self, iterable: Iterable[str]):
+        self._iterator = iter(iterable)
+        self.seconds = 0.0
+    
+    def __iter__(self):
+        return self
+    
+    def __next__(self) -> str:
+        start = time.perf_counter()
+        try:
+            return next(self._iterator)
+        finally:
+            self.seconds += time.perf_counter() - start
+
+
+class _Document:
+    def __init__(self, pieces: Iterable[str], source: str, title: str, existing: Dict[str, Optional[int]]):
+        self.source = source
+        self.title = title
+        self.pieces = _TimedIterator(pieces)
+        self.chunks = iter_chunks(iter_paragraphs(self.pieces), source=source, title=title)
+        # Chunk ids indexed for this source before the upload with their positions, and the ids
+        # this upload contains
+        self.existing = existing
+        self.seen: Set[str] = set()
+        self.upserted: List[str] = []
+        self.error: Optional[Exception] = None
+        self.stats = {"chunks_created": 0, "total_tokens": 0, "vectors_upserted": 0, "chunks_unchanged": 0, "chunks_deleted": 0}
+    
+    def next_batch(self) -> List[Dict]:
+        start, extract_start = time.perf_counter(), self.pieces.seconds
+        batch = _next_batch(self.chunks, INGEST_BATCH_CHUNKS)
+        extract = self.pieces.seconds - extract_start
+        INGEST_STAGE_SECONDS.labels("extract").observe(extract)
+        INGEST_STAGE_SECONDS.labels("chunk").observe(time.perf_counter() - start - extract)
+        return batch
+    
+    def result(self) -> Dict:
+        return {
+            "source": self.source,
+            "title": self.title,
+            "chunks_created": self.stats["chunks_created"],
+            "vectors_upserted": self.stats["vectors_upserted"],
+            "chunks_unchanged": self.stats["chunks_unchanged"],
+            "chunks_deleted": self.stats["chunks_deleted"],
+            "avg_chunk_tokens": self.stats["total_tokens"] // self.stats["chunks_created"] if self.stats["chunks_created"] else 0,
+            "error": str(self.error) if self.error is not None else None
+        }
+
+
+async def ingest_documents(documents: List[Dict], namespace: Optional[str] = None,
+                           discard_on_failure: Optional[bool] = None,
+                           on_progress: Optional[Callable[[Dict], Awaitable[None]]] = None, replace: bool = False,
+                           fail_fast: bool = False) -> Dict:
+    """Chunk, embed and upsert documents, each given as {"pieces", "source", "title"} with its
+    text as a stream of pieces.
+    
+    Reading and chunking run on the ingest executor one batch at a time, up to
+    INGEST_PARALLEL_DOCUMENTS documents at once. Their chunks are pooled into full
+    INGEST_BATCH_CHUNKS batches for embedding and upserts, and at most INGEST_QUEUE_BATCHES
+    batches wait between stages however large the documents are.
+    
+    Chunks the manifest already lists at the same position for a document's source in the
+    namespace are not upserted again. One that moved is, so its stored chunk_index stays right
+    for merging neighbouring chunks; its embedding normally comes from the embedding cache. With `replace`, each document is a new version of its source: once it is
+    fully indexed, the chunks of the previous version that it no longer contains are deleted.
+    
+    A document that can't be read records its error and has the chunks this call added for it
+    removed, unless `fail_fast` makes it fail the whole call. If embedding or upserting fails,
+    the namespace is deleted if it was created for these documents; by default that is when
+    no namespace was given.
+    """
+    if discard_on_failure is None:
+        discard_on_failure = namespace is None
+    namespace = namespace or new_namespace()
+    docs = [
+        _Document(d["pieces"], d["source"], d["title"], await run_blocking("manifest", chunk_manifest.positions, namespace, d["source"]))
+        for d in documents
+    ]
+    
+    embed_queue: asyncio.Queue = asyncio.Queue(maxsize=INGEST_QUEUE_BATCHES)
+    upsert_queue: asyncio.Queue = asyncio.Queue(maxsize=INGEST_QUEUE_BATCHES)
+    readers = asyncio.Semaphore(INGEST_PARALLEL_DOCUMENTS)
+    # Changed chunks from every document, waiting to fill a batch
+    pending: List[Tuple[_Document, str, Dict]] = []
+    totals = {"vectors_upserted": 0, "chunks_unchanged": 0}
+    
+    async def flush(full_only: bool):
+        while len(pending) >= INGEST_BATCH_CHUNKS or (pending and not full_only):
+            batch = pending[:INGEST_BATCH_CHUNKS]
+            del pending[:INGEST_BATCH_CHUNKS]
+            await embed_queue.put(batch)
+    
+    async def read(doc: _Document):
+        first = True
+        while True:
+            # Each chunk generator is only ever advanced by its own reader, one batch at a time
+            batch = await run_blocking("ingest", doc.next_batch)
+            # A short batch means the generator is exhausted, so this is the whole document
+            if first and (not batch or (len(batch) < INGEST_BATCH_CHUNKS and sum(len(c["text"]) for c in batch) < MIN_CONTENT_CHARS)):
+                raise EmptyDocumentError("Content too short")
+            first = False
+            if not batch:
+                return
+            doc.stats["chunks_created"] += len(batch)
+            doc.stats["total_tokens"] += sum(c["token_count"] for c in batch)
+            for chunk in batch:
+                # Repeated chunks within the document share an id, so they're indexed once
+                vector_id = chunk_id(chunk)
+                if vector_id in doc.seen or (vector_id in doc.existing and doc.existing[vector_id] == chunk["chunk_index"]):
+                    doc.stats["chunks_unchanged"] += 1
+                    totals["chunks_unchanged"] += 1
+                else:
+                    pending.append((doc, vector_id, chunk))
+                doc.seen.add(vector_id)
+            await flush(full_only=True)
+    
+    async def read_document(doc: _Document):
+        async with readers:
+            try:
+                await read(doc)
+            except Exception as e:
+                if fail_fast:
+                    raise
+                doc.error = e
+    
+    async def produce():
+        await asyncio.gather(*(read_document(doc) for doc in docs))
+        await flush(full_only=False)
+        for _ in range(INGEST_EMBED_WORKERS):
+            await embed_queue.put(None)
+    
+    async def embed():
+        while True:
+            batch = await embed_queue.get()
+            if batch is None:
+                await upsert_queue.put(None)
+                return
+            with INGEST_STAGE_SECONDS.labels("embed").time():
+                embeddings = await embed_texts([chunk["text"] for _, _, chunk in batch])
+            TOKENS.labels("embedded").inc(sum(chunk["token_count"] for _, _, chunk in batch))
+            await upsert_queue.put((embeddings, batch))
+    
+    async def upsert():
+        finished_embedders = 0
+        while finished_embedders < INGEST_EMBED_WORKERS:
+            item = await upsert_queue.get()
+            if item is None:
+                finished_embedders += 1
+                continue
+            embeddings, batch = item
+            with INGEST_STAGE_SECONDS.labels("upsert").time():
+                await upsert_vectors(embeddings, [chunk for _, _, chunk in batch], namespace=namespace)
+            by_document: Dict[_Document, Dict[str, int]] = {}
+            for doc, vector_id, chunk in batch:
+                by_document.setdefault(doc, {})[vector_id] = chunk["chunk_index"]
+            for doc, ids in by_document.items():
+                await run_blocking("manifest", chunk_manifest.add, namespace, doc.source, ids)
+                doc.upserted.extend(ids)
+                doc.stats["vectors_upserted"] += len(ids)
+            totals["vectors_upserted"] += len(batch)
+            if on_progress is not None:
+                await on_progress(dict(totals))
+    
+    tasks = [asyncio.ensure_future(produce()), asyncio.ensure_future(upsert())]
+    tasks += [asyncio.ensure_future(embed()) for _ in range(INGEST_EMBED_WORKERS)]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        # Stop the other stages; they would otherwise wait forever on their queues
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if discard_on_failure:
+            # Don't leave half a document behind in a namespace nobody was told about. This is
+            # best effort: the namespace may not exist yet, and the original error matters more.
+            try:
+                await delete_namespace(namespace)
+            except Exception:
+                pass
+        raise
+    
+    stale = []
+    for doc in docs:
+        if doc.error is not None:
+            # Don't keep part of a document that couldn't be read to the end
+            doc_stale = doc.upserted
+        elif replace:
+            doc_stale = list(doc.existing.keys() - doc.seen)
+            doc.stats["chunks_deleted"] = len(doc_stale)
+        else:
+            continue
+        # Out of the manifest first, so it never lists a chunk the index has lost
+        await run_blocking("manifest", chunk_manifest.remove, namespace, doc.source, doc_stale)
+        stale.extend(doc_stale)
+    if stale:
+        await delete_vectors(stale, namespace)
+    
+    results = [doc.result() for doc in docs]
+    return {
+        "namespace": namespace,
+        "chunks_created": sum(r["chunks_created"] for r in results),
+        "vectors_upserted": sum(r["vectors_upserted"] for r in results),
+        "chunks_unchanged": sum(r["chunks_unchanged"] for r in results),
+        "chunks_deleted": sum(r["chunks_deleted"] for r in results),
+        "documents": results
+    }
+
+
+async def ingest_document(pieces: Iterable[str], source: str, title: str, namespace: Optional[str] = None,
+                          discard_on_failure: Optional[bool] = None,
+                          on_progress: Optional[Callable[[Dict], Awaitable[None]]] = None, replace: bool = False) -> Dict:
+    """Chunk, embed and upsert one document; see ingest_documents. Any error fails the call."""
+    result = await ingest_documents(
+        [{"pieces": pieces, "source": source, "title": title}],
+        namespace=namespace,
+        discard_on_failure=discard_on_failure,
+        on_progress=on_progress,
+        replace=replace,
+        fail_fast=True
+    )
+    document = result["documents"][0]
+    return {
+        "namespace": result["namespace"],
+        "chunks_created": document["chunks_created"],
+        "vectors_upserted": document["vectors_upserted"],
+        "chunks_unchanged": document["chunks_unchanged"],
+        "chunks_deleted": document["chunks_deleted"],
+        "avg_chunk_tokens": document["avg_chunk_tokens"]
+    }
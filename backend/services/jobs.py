@@ -0,0 +1,307 @@
+import asyncio
+import json
+import logging
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from typing import List, Dict, Optional, Iterator
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import INGEST_JOB_WORKERS, JOBS_DB_PATH, UPLOADS_DIR, JOB_RETENTION_S
+from services.executors import run_blocking
+from services.logs import log_event
+from services.ingest import ingest_document, ingest_documents, iter_text_file, iter_pdf_pages, EmptyDocumentError
+from services.pdf_extractor import count_pages, extract_pages
+from services.vector_store import new_namespace
+
+COLUMNS = (
+    "id", "status", "stage", "kind", "source", "title", "namespace", "created_namespace", "file_path",
+    "chunks_done", "error", "error_status", "result", "created_at", "started_at", "finished_at"
+)
+FINISHED = ("completed", "failed")
+
+
+class PdfReadError(ValueError):
+    pass
+
+
+class JobStore:
+    """Ingestion jobs in SQLite, so queued and interrupted jobs are still known after a restart."""
+    
+    def __init__(self, db_path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, status TEXT NOT NULL, stage TEXT, kind TEXT NOT NULL, source TEXT, "
+                "title TEXT, namespace TEXT NOT NULL, created_namespace INTEGER NOT NULL, file_path TEXT, "
+                "chunks_done INTEGER NOT NULL DEFAULT 0, error TEXT, error_status INTEGER, result TEXT, "
+                "created_at REAL NOT NULL, started_at REAL, finished_at REAL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+            self._db.commit()
+    
+    def create(self, job: Dict):
+        with self._lock:
+            placeholders = ",".join("?" * len(COLUMNS))
+            self._db.execute(f"INSERT INTO jobs ({','.join(COLUMNS)}) VALUES ({placeholders})", [job.get(c) for c in COLUMNS])
+            self._db.commit()
+    
+    def update(self, job_id: str, **fields):
+        if "result" in fields and fields["result"] is not None:
+            fields["result"] = json.dumps(fields["result"])
+        assignments = ", ".join(f"{column} = ?" for column in fields)
+        with self._lock:
+            self._db.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", [*fields.values(), job_id])
+            self._db.commit()
+    
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return _row_to_job(row) if row else None
+    
+    def unfinished(self) -> List[Dict]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT * FROM jobs WHERE status NOT IN (?, ?) ORDER BY created_at", FINISHED
+            ).fetchall()
+        return [_row_to_job(row) for row in rows]
+    
+    def purge(self, finished_before: float) -> int:
+        with self._lock:
+            deleted = self._db.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND finished_at < ?", (*FINISHED, finished_before)
+            ).rowcount
+            self._db.commit()
+        return deleted
+
+
+def _row_to_job(row: sqlite3.Row) -> Dict:
+    job = dict(row)
+    job["created_namespace"] = bool(job["created_namespace"])
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    return job
+
+
+job_store = JobStore(JOBS_DB_PATH)
+_queue: Optional[asyncio.Queue] = None
+_workers: List[asyncio.Task] = []
+_finished: Dict[str, asyncio.Event] = {}
+
+
+def upload_path(job_id: str, ext: str) -> str:
+    return os.path.join(UPLOADS_DIR, job_id + ext)
+
+
+def new_job_id() -> str:
+    return uuid.uuid4().hex
+
+
+async def submit_job(job_id: str, kind: str, file_path: str, source: str, title: str, namespace: Optional[str]) -> Dict:
+    """Record a job for an upload already saved at `file_path` and queue it."""
+    job = {
+        "id": job_id,
+        "status": "queued",
+        "kind": kind,
+        "source": source,
+        "title": title,
+        # Resolved now so the client knows where the document will land before it's indexed
+        "namespace": namespace or new_namespace(),
+        "created_namespace": namespace is None,
+        "file_path": file_path,
+        "chunks_done": 0,
+        "created_at": time.time()
+    }
+    await run_blocking("job_store", job_store.create, job)
+    _ensure_workers()
+    _finished[job_id] = asyncio.Event()
+    _queue.put_nowait(job_id)
+    return await run_blocking("job_store", job_store.get, job_id)
+
+
+async def wait_for_job(job_id: str) -> Dict:
+    event = _finished.get(job_id)
+    if event is not None:
+        await event.wait()
+    return await run_blocking("job_store", job_store.get, job_id)
+
+
+async def get_job(job_id: str) -> Optional[Dict]:
+    return await run_blocking("job_store", job_store.get, job_id)
+
+
+def describe_job(job: Dict) -> Dict:
+    now = time.time()
+    elapsed = (job["finished_at"] or now) - job["started_at"] if job["started_at"] else 0.0
+    return {
+        "job_id": job["id"],
+        "status": job["status"],
+        "stage": job["stage"],
+        "source": job["source"],
+        "title": job["title"],
+        "namespace": job["namespace"],
+        "chunks_done": job["chunks_done"],
+        "elapsed_ms": int(elapsed * 1000),
+        "chunks_per_second": round(job["chunks_done"] / elapsed, 2) if elapsed > 0 else 0.0,
+        "error": job["error"],
+        "stats": job["result"]
+    }
+
+
+def _ensure_workers():
+    global _queue
+    if _queue is None:
+        _queue = asyncio.Queue()
+    alive = [worker for worker in _workers if not worker.done()]
+    _workers[:] = alive
+    for _ in range(INGEST_JOB_WORKERS - len(alive)):
+        _workers.append(asyncio.ensure_future(_worker()))
+
+
+async def start_job_workers():
+    """Start the workers and pick up jobs left over from the previous process."""
+    _ensure_workers()
+    await run_blocking("job_store", job_store.purge, time.time() - JOB_RETENTION_S)
+    for job in await run_blocking("job_store", job_store.unfinished):
+        if job["status"] == "running":
+            # Chunk ids are content hashes and the manifest lists what was already upserted, so
+            # running the job again resumes it rather than duplicating chunks
+            await run_blocking("job_store", job_store.update, job["id"], status="queued", stage=None, chunks_done=0, started_at=None)
+        _finished.setdefault(job["id"], asyncio.Event())
+        _queue.put_nowait(job["id"])
+
+
+async def stop_job_workers():
+    global _queue
+    for worker in _workers:
+        worker.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+    # Jobs cut off here stay "running" and are handled by start_job_workers on the next start
+    _queue = None
+
+
+async def _worker():
+    while True:
+        job_id = await _queue.get()
+        job = await run_blocking("job_store", job_store.get, job_id)
+        if job is not None and job["status"] == "queued":
+            await _run_job(job)
+
+
+def _count_pdf_pages(path: str) -> int:
+    try:
+        # Only the cross-reference table and page tree are parsed here; text is extracted later
+        return count_pages(path)
+    except Exception as e:
+        raise PdfReadError(f"Error reading PDF: {str(e)}")
+
+
+def _iter_file(path: str) -> Iterator[str]:
+    # Opened when the ingest pipeline first reads it, so a batch doesn't hold every file open
+    if path.lower().endswith(".pdf"):
+        yield from iter_pdf_pages(extract_pages(path, _count_pdf_pages(path)))
+    else:
+        with open(path, "rb") as f:
+            yield from iter_text_file(f)
+
+
+def _batch_documents(directory: str) -> List[Dict]:
+    documents = []
+    for root, _, files in os.walk(directory):
+        for name in files:
+            path = os.path.join(root, name)
+            source = os.path.relpath(path, directory).replace(os.sep, "/")
+            documents.append({"pieces": _iter_file(path), "source": source, "title": os.path.splitext(name)[0]})
+    return sorted(documents, key=lambda d: d["source"])
+
+
+def _document_stats(result: Dict) -> Dict:
+    return {
+        "chunks_created": result["chunks_created"],
+        "chunks_embedded": result["vectors_upserted"],
+        "chunks_unchanged": result["chunks_unchanged"],
+        "chunks_deleted": result["chunks_deleted"]
+    }
+
+
+async def _run_job(job: Dict):
+    started_at = time.time()
+    await run_blocking("job_store", job_store.update, job["id"], status="running", stage="reading", started_at=started_at)
+    
+    async def on_progress(stats: Dict):
+        await run_blocking("job_store", job_store.update, job["id"], stage="indexing",
+                           chunks_done=stats["vectors_upserted"] + stats["chunks_unchanged"])
+    
+    try:
+        if job["kind"] == "batch":
+            result = await ingest_documents(
+                await run_blocking("ingest", _batch_documents, job["file_path"]),
+                namespace=job["namespace"],
+                discard_on_failure=job["created_namespace"],
+                on_progress=on_progress,
+                replace=True
+            )
+            stats = {
+                **_document_stats(result),
+                "documents": [
+                    {"source": d["source"], "title": d["title"], **_document_stats(d), "avg_chunk_tokens": d["avg_chunk_tokens"], "error": d["error"]}
+                    for d in result["documents"]
+                ]
+            }
+        else:
+            result = await ingest_document(
+                _iter_file(job["file_path"]),
+                source=job["source"],
+                title=job["title"],
+                namespace=job["namespace"],
+                discard_on_failure=job["created_namespace"],
+                on_progress=on_progress,
+                # Pasted text has no name to match a later upload against
+                replace=job["source"] != "direct_input"
+            )
+            stats = {**_document_stats(result), "avg_chunk_tokens": result["avg_chunk_tokens"]}
+        await _finish(job, "completed", chunks_done=result["chunks_created"], result={
+            **stats,
+            "namespace": result["namespace"],
+            "processing_time_ms": int((time.time() - job["created_at"]) * 1000)
+        })
+    except (EmptyDocumentError, PdfReadError) as e:
+        await _finish(job, "failed", error=str(e), error_status=400)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        await _finish(job, "failed", error=f"Upload failed: {str(e)}", error_status=500)
+
+
+async def _finish(job: Dict, status: str, **fields):
+    await run_blocking("job_store", job_store.update, job["id"], status=status, stage=None, finished_at=time.time(), **fields)
+    log_event(
+        "ingest.job_finished",
+        level=logging.INFO if status == "completed" else logging.WARNING,
+        # Uploads are rare next to queries, so every one is logged
+        sample_rate=1.0,
+        job_id=job["id"],
+        kind=job["kind"],
+        status=status,
+        namespace=job["namespace"],
+        chunks=fields.get("chunks_done"),
+        elapsed_ms=int((time.time() - job["created_at"]) * 1000),
+        error=fields.get("error")
+    )
+    if os.path.isdir(job["file_path"]):
+        shutil.rmtree(job["file_path"], ignore_errors=True)
+    elif os.path.exists(job["file_path"]):
+        os.remove(job["file_path"])
+    event = _finished.pop(job["id"], None)
+    if event is not None:
+        event.set()
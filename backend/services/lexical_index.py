@@ -0,0 +1,265 @@
+import json
+import math
+import os
+import shutil
+import threading
+from array import array
+from typing import List, Dict, Optional, Tuple
+from urllib.parse import quote
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import LEXICAL_INDEX_DIR
+from services.reranker import tokenize, K1, B
+
+NAMESPACE_FILE_PREFIX = "ns_"
+NAMESPACE_FILE_SUFFIX = ".jsonl"
+COMPACT_DEAD_FRACTION = 0.5
+
+
+def encode_varint(value: int, out: bytearray):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def decode_varints(data: bytes) -> np.ndarray:
+    """Decode a run of LEB128 varints in one vectorized pass."""
+    raw = np.frombuffer(bytes(data), dtype=np.uint8)
+    if not len(raw):
+        return np.zeros(0, dtype=np.int64)
+    ends = (raw & 0x80) == 0
+    starts = np.flatnonzero(np.concatenate(([True], ends[:-1])))
+    group = np.cumsum(np.concatenate(([False], ends[:-1])))
+    shifts = (np.arange(len(raw)) - starts[group]) * 7
+    return np.add.reduceat((raw & 0x7F).astype(np.int64) << shifts, starts)
+
+
+def parse_term_freqs(term_freqs: str) -> List[Tuple[str, int]]:
+    pairs = []
+    for item in term_freqs.split():
+        term, _, count = item.rpartition(":")
+        pairs.append((term, int(count)))
+    return pairs
+
+
+class _Namespace:
+    """Inverted index for one namespace. Each term's postings are a bytearray of
+    varint (doc gap, term frequency) pairs; doc numbers only ever grow, so gaps stay small."""
+    
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self.lock = threading.RLock()
+        self.ids: List[Optional[str]] = []
+        self.id_to_doc: Dict[str, int] = {}
+        self.doc_lens = array("I")
+        self.alive = bytearray()
+        self.postings: Dict[str, bytearray] = {}
+        self.last_doc: Dict[str, int] = {}
+        self.total_len = 0
+        if path and os.path.exists(path):
+            self._load()
+    
+    @property
+    def count(self) -> int:
+        return len(self.id_to_doc)
+    
+    def _load(self):
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A torn final line from a crash mid-write; everything before it is intact
+                    break
+                if entry["op"] == "add":
+                    self._apply_add(entry["id"], entry["terms"], entry["len"])
+                else:
+                    self._apply_delete(entry["id"])
+    
+    def _apply_add(self, doc_id: str, term_freqs: str, doc_len: int):
+        self._apply_delete(doc_id)
+        doc = len(self.ids)
+        self.ids.append(doc_id)
+        self.id_to_doc[doc_id] = doc
+        self.doc_lens.append(doc_len)
+        self.alive.append(1)
+        self.total_len += doc_len
+        for term, count in parse_term_freqs(term_freqs):
+            postings = self.postings.get(term)
+            if postings is None:
+                postings = self.postings[term] = bytearray()
+            encode_varint(doc - self.last_doc.get(term, 0), postings)
+            encode_varint(count, postings)
+            self.last_doc[term] = doc
+    
+    def _apply_delete(self, doc_id: str) -> bool:
+        doc = self.id_to_doc.pop(doc_id, None)
+        if doc is None:
+            return False
+        self.ids[doc] = None
+        self.alive[doc] = 0
+        self.total_len -= self.doc_lens[doc]
+        return True
+    
+    def _append_log(self, entries: List[Dict]):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "a") as log:
+            for entry in entries:
+                log.write(json.dumps(entry) + "\n")
+    
+    def add(self, docs: List[Dict]):
+        with self.lock:
+            entries = [{"op": "add", "id": d["id"], "terms": d["term_freqs"], "len": d["doc_len"]} for d in docs]
+            self._append_log(entries)
+            for entry in entries:
+                self._apply_add(entry["id"], entry["terms"], entry["len"])
+            self._maybe_compact()
+    
+    def delete(self, ids: List[str]):
+        with self.lock:
+            removed = [doc_id for doc_id in ids if self._apply_delete(doc_id)]
+            self._append_log([{"op": "del", "id": doc_id} for doc_id in removed])
+            self._maybe_compact()
+    
+    def _maybe_compact(self):
+        # Replacing a document leaves its old postings behind, so rebuild once most are dead
+        if self.ids and (len(self.ids) - self.count) / len(self.ids) > COMPACT_DEAD_FRACTION:
+            self._compact()
+    
+    def _compact(self):
+        # Recover each live document's term frequencies with one decode per term
+        live_terms: Dict[int, List[str]] = {doc: [] for doc in self.id_to_doc.values()}
+        for term, postings in self.postings.items():
+            docs, counts = self._decode(postings)
+            for doc, count in zip(docs.tolist(), counts.tolist()):
+                if doc in live_terms:
+                    live_terms[doc].append(f"{term}:{count}")
+        live = [
+            (doc_id, " ".join(live_terms[doc]), self.doc_lens[doc])
+            for doc_id, doc in sorted(self.id_to_doc.items(), key=lambda item: item[1])
+        ]
+        
+        self.ids, self.id_to_doc = [], {}
+        self.doc_lens, self.alive = array("I"), bytearray()
+        self.postings, self.last_doc = {}, {}
+        self.total_len = 0
+        for doc_id, term_freqs, doc_len in live:
+            self._apply_add(doc_id, term_freqs, doc_len)
+        
+        if self.path:
+            # Write to a temp file and rename so a crash mid-compaction leaves the old log intact
+            with open(self.path + ".tmp", "w") as log:
+                for doc_id, term_freqs, doc_len in live:
+                    log.write(json.dumps({"op": "add", "id": doc_id, "terms": term_freqs, "len": doc_len}) + "\n")
+            os.replace(self.path + ".tmp", self.path)
+    
+    @staticmethod
+    def _decode(postings: bytearray) -> Tuple[np.ndarray, np.ndarray]:
+        values = decode_varints(postings)
+        return np.cumsum(values[0::2]), values[1::2]
+    
+    def search(self, query_terms: List[str], top_k: int) -> List[Tuple[str, float]]:
+        with self.lock:
+            total_docs = self.count
+            if not total_docs or top_k <= 0:
+                return []
+            alive = np.frombuffer(bytes(self.alive), dtype=bool)
+            doc_lens = np.frombuffer(self.doc_lens, dtype=np.uint32).astype(np.float64)
+            length_norm = K1 * (1 - B + B * (doc_lens / (self.total_len / total_docs or 1)))
+            scores = np.zeros(len(self.ids))
+            
+            for term in dict.fromkeys(query_terms):
+                postings = self.postings.get(term)
+                if postings is None:
+                    continue
+                docs, counts = self._decode(postings)
+                live = alive[docs]
+                docs, counts = docs[live], counts[live].astype(np.float64)
+                if not len(docs):
+                    continue
+                df = len(docs)
+                idf = math.log((total_docs - df + 0.5) / (df + 0.5) + 1)
+                scores[docs] += idf * (counts * (K1 + 1)) / (counts + length_norm[docs])
+            
+            candidates = np.flatnonzero(scores > 0)
+            if len(candidates) > top_k:
+                candidates = candidates[np.argpartition(-scores[candidates], top_k - 1)[:top_k]]
+            candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+            return [(self.ids[doc], float(scores[doc])) for doc in candidates]
+    
+    def memory_bytes(self) -> int:
+        with self.lock:
+            return sum(len(p) for p in self.postings.values()) + len(self.doc_lens) * self.doc_lens.itemsize + len(self.alive)
+
+
+class LexicalIndex:
+    """Per-namespace BM25 inverted index, persisted as an append-only log of the
+    term frequencies computed at ingest. `root` of None keeps it in memory only."""
+    
+    def __init__(self, root: Optional[str]):
+        self.root = root
+        self._namespaces: Dict[str, _Namespace] = {}
+        self._lock = threading.Lock()
+    
+    def _path(self, namespace: str) -> Optional[str]:
+        if not self.root:
+            return None
+        return os.path.join(self.root, NAMESPACE_FILE_PREFIX + quote(namespace, safe="") + NAMESPACE_FILE_SUFFIX)
+    
+    def _namespace(self, namespace: Optional[str], create: bool = False) -> Optional[_Namespace]:
+        namespace = namespace or ""
+        with self._lock:
+            ns = self._namespaces.get(namespace)
+            if ns is None:
+                path = self._path(namespace)
+                if create or (path and os.path.exists(path)):
+                    ns = self._namespaces[namespace] = _Namespace(path)
+            return ns
+    
+    def add(self, namespace: Optional[str], docs: List[Dict]):
+        if docs:
+            self._namespace(namespace, create=True).add(docs)
+    
+    def search(self, namespace: Optional[str], query: str, top_k: int) -> List[Dict]:
+        ns = self._namespace(namespace)
+        if ns is None:
+            return []
+        return [{"id": doc_id, "score": score} for doc_id, score in ns.search(tokenize(query), top_k)]
+    
+    def delete(self, namespace: Optional[str], ids: List[str]):
+        ns = self._namespace(namespace)
+        if ns is not None:
+            ns.delete(ids)
+    
+    def delete_namespace(self, namespace: Optional[str]):
+        namespace = namespace or ""
+        with self._lock:
+            self._namespaces.pop(namespace, None)
+            path = self._path(namespace)
+            if path and os.path.exists(path):
+                os.remove(path)
+    
+    def clear(self):
+        with self._lock:
+            self._namespaces.clear()
+            if self.root:
+                shutil.rmtree(self.root, ignore_errors=True)
+    
+    def stats(self) -> Dict:
+        with self._lock:
+            namespaces = list(self._namespaces.values())
+        return {
+            "loaded_namespaces": len(namespaces),
+            "documents": sum(ns.count for ns in namespaces),
+            "terms": sum(len(ns.postings) for ns in namespaces),
+            "postings_bytes": sum(ns.memory_bytes() for ns in namespaces)
+        }
+
+
+lexical_index = LexicalIndex(LEXICAL_INDEX_DIR or None)
@@ -1,14 +1,22 @@
+import asyncio
+import threading
 import google.generativeai as genai
-from typing import List, Dict
+from typing import List, Dict, AsyncIterator, Tuple
 import time
 import sys
 import os
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from config import GEMINI_API_KEY, GEMINI_MODEL
+from config import GEMINI_MODEL, GEMINI_LIGHT_MODEL, LIGHT_MAX_OUTPUT_TOKENS
+from services import gemini
+from services.chunker import count_tokens
+from services.context import pack_sources
+from services.executors import run_blocking, get_executor, get_timeout
+from services.metrics import QUERY_STAGE_SECONDS, DEPENDENCY_CALLS, TOKENS, observe
 
-genai.configure(api_key=GEMINI_API_KEY)
-model = genai.GenerativeModel(GEMINI_MODEL)
+model = None
+light_model = None
+_model_lock = threading.Lock()
 
 SYSTEM_PROMPT = """You are a helpful assistant that answers questions based ONLY on the provided sources.
 
@@ -20,63 +28,181 @@ RULES:
 5. Never make up information not in the sources"""
 
 
-async def generate_answer(query: str, sources: List[Dict]) -> Dict:
-    start_time = time.time()
-    
-    if not sources:
-        return {
-            "answer": "I cannot answer this based on the provided context. No relevant sources were found.",
-            "citations": [],
-            "timing_ms": int((time.time() - start_time) * 1000),
-            "token_estimate": 0
-        }
-    
+def build_prompt(query: str, sources: List[Dict], concise: bool = False) -> str:
     sources_text = "\n\n".join([
         f"[{i+1}] {source['text']}"
         for i, source in enumerate(sources)
     ])
     
-    prompt = f"""{SYSTEM_PROMPT}
+    return f"""{SYSTEM_PROMPT}
 
 SOURCES:
 {sources_text}
 
 QUESTION: {query}
 
-Provide a comprehensive answer with inline citations [1], [2], etc."""
+{"Answer in two or three sentences" if concise else "Provide a comprehensive answer"} with inline citations [1], [2], etc."""
+
+
+def build_citations(sources: List[Dict]) -> List[Dict]:
+    citations = []
+    for i, source in enumerate(sources):
+        citation = {
+            "number": i + 1,
+            "text": source['text'][:300] + "..." if len(source['text']) > 300 else source['text'],
+            "source": source.get('source', 'Unknown'),
+            "title": source.get('title', 'Untitled'),
+            "score": source.get('rerank_score', source.get('score', 0))
+        }
+        if source.get('namespace') is not None:
+            citation["namespace"] = source['namespace']
+        citations.append(citation)
+    return citations
+
+
+def estimate_tokens(prompt_tokens: int, answer: str) -> int:
+    # cl100k counts; Gemini's tokenizer differs a little, so this stays an estimate
+    return prompt_tokens + count_tokens(answer)
+
+
+def prepare_prompt(query: str, sources: List[Dict], concise: bool = False) -> Tuple[List[Dict], str, Dict]:
+    """Pack the sources into the context budget and build the prompt from the packed passages.
+    The returned context stats include the prompt's tokens and how many packing saved."""
+    passages, context = pack_sources(sources)
+    prompt = build_prompt(query, passages, concise)
+    context["prompt_tokens"] = count_tokens(prompt)
+    context["tokens_saved"] = count_tokens(build_prompt(query, sources, concise)) - context["prompt_tokens"]
+    TOKENS.labels("saved").inc(max(context["tokens_saved"], 0))
+    return passages, prompt, context
+
+
+def get_model():
+    global model
+    with _model_lock:
+        if model is None:
+            gemini.configure()
+            model = genai.GenerativeModel(GEMINI_MODEL)
+        return model
+
+
+def get_light_model():
+    global light_model
+    if not GEMINI_LIGHT_MODEL:
+        return get_model()
+    with _model_lock:
+        if light_model is None:
+            gemini.configure()
+            light_model = genai.GenerativeModel(GEMINI_LIGHT_MODEL)
+        return light_model
+
+
+def _generate_kwargs(light: bool) -> Dict:
+    return {"generation_config": {"max_output_tokens": LIGHT_MAX_OUTPUT_TOKENS}} if light else {}
+
+
+def _generate(prompt: str, light: bool = False) -> str:
+    response = (get_light_model() if light else get_model()).generate_content(prompt, **_generate_kwargs(light))
+    return response.text
 
+
+def _chunk_text(chunk) -> str:
+    # The final chunk of a stream can carry only a finish reason and no text parts
     try:
-        response = model.generate_content(prompt)
-        answer = response.text
-        
-        citations = []
-        for i, source in enumerate(sources):
-            citations.append({
-                "number": i + 1,
-                "text": source['text'][:300] + "..." if len(source['text']) > 300 else source['text'],
-                "source": source.get('source', 'Unknown'),
-                "title": source.get('title', 'Untitled'),
-                "score": source.get('rerank_score', source.get('score', 0))
-            })
-        
-        token_estimate = (len(prompt) + len(answer)) // 4
+        return chunk.text
+    except ValueError:
+        return ""
+
+
+async def generate_answer(query: str, sources: List[Dict], light: bool = False) -> Dict:
+    """`light` asks for a short answer, capped at LIGHT_MAX_OUTPUT_TOKENS, from GEMINI_LIGHT_MODEL."""
+    start_time = time.time()
+    
+    if not sources:
+        return {
+            "answer": "I cannot answer this based on the provided context. No relevant sources were found.",
+            "citations": [],
+            "timing_ms": int((time.time() - start_time) * 1000),
+            "token_estimate": 0,
+            "context": None
+        }
+    
+    passages, prompt, context = prepare_prompt(query, sources, concise=light)
+    
+    try:
+        answer = await observe("llm_total", run_blocking("gemini_generate", _generate, prompt, light))
+        TOKENS.labels("prompt").inc(context["prompt_tokens"])
+        TOKENS.labels("completion").inc(count_tokens(answer))
         
         return {
             "answer": answer,
-            "citations": citations,
+            "citations": build_citations(passages),
             "timing_ms": int((time.time() - start_time) * 1000),
-            "token_estimate": token_estimate
+            "token_estimate": estimate_tokens(context["prompt_tokens"], answer),
+            "context": context
         }
-        
+    
     except Exception as e:
         return {
             "answer": f"Error generating answer: {str(e)}",
             "citations": [],
             "timing_ms": int((time.time() - start_time) * 1000),
-            "token_estimate": 0
+            "token_estimate": 0,
+            "context": context
         }
 
 
+async def stream_answer(prompt: str, prompt_tokens: int, light: bool = False) -> AsyncIterator[str]:
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    cancelled = threading.Event()
+    
+    def produce():
+        try:
+            gemini_model = get_light_model() if light else get_model()
+            for chunk in gemini_model.generate_content(prompt, stream=True, **_generate_kwargs(light)):
+                if cancelled.is_set():
+                    break
+                text = _chunk_text(chunk)
+                if text:
+                    loop.call_soon_threadsafe(queue.put_nowait, ("token", text))
+            loop.call_soon_threadsafe(queue.put_nowait, ("done", None))
+        except Exception as e:
+            loop.call_soon_threadsafe(queue.put_nowait, ("error", e))
+    
+    # The SDK stream is a blocking iterator, so it is drained on a worker thread
+    loop.run_in_executor(get_executor("gemini_generate"), produce)
+    start = time.perf_counter()
+    first_token = True
+    outcome = "error"
+    answer_parts = []
+    try:
+        while True:
+            # Bounds the wait for each chunk rather than the whole answer, which can be long
+            kind, payload = await asyncio.wait_for(queue.get(), timeout=get_timeout("gemini_generate"))
+            if kind == "token":
+                if first_token:
+                    QUERY_STAGE_SECONDS.labels("llm_first_token").observe(time.perf_counter() - start)
+                    first_token = False
+                answer_parts.append(payload)
+                yield payload
+            elif kind == "error":
+                raise payload
+            else:
+                outcome = "ok"
+                break
+    except asyncio.TimeoutError:
+        outcome = "timeout"
+        raise
+    finally:
+        # Stops the worker early when the client disconnects mid-answer
+        cancelled.set()
+        # This call bypasses run_blocking, so it is counted here
+        DEPENDENCY_CALLS.labels("gemini_generate", outcome).inc()
+        QUERY_STAGE_SECONDS.labels("llm_total").observe(time.perf_counter() - start)
+        TOKENS.labels("prompt").inc(prompt_tokens)
+        TOKENS.labels("completion").inc(count_tokens("".join(answer_parts)))
+
+
 def estimate_cost(token_count: int) -> Dict:
     input_tokens = int(token_count * 0.7)
     output_tokens = int(token_count * 0.3)
@@ -0,0 +1,383 @@
+import json
+import os
+import shutil
+import threading
+from typing import List, Dict, Optional
+from urllib.parse import quote, unquote
+
+import numpy as np
+
+from services.vector_index import VectorIndex
+
+NAMESPACE_DIR_PREFIX = "ns_"
+SCAN_BLOCK_ROWS = 65536
+KMEANS_ITERATIONS = 8
+KMEANS_SAMPLE = 50000
+ANN_REBUILD_FRACTION = 0.1
+COMPACT_DEAD_FRACTION = 0.5
+
+
+def _unit(vector: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vector, axis=-1, keepdims=True)
+    return vector / np.where(norms > 0, norms, 1)
+
+
+class _Namespace:
+    """One namespace on disk: an append-only matrix file of unit vectors, plus an
+    append-only JSON log of id -> row assignments, metadata and deletions."""
+    
+    def __init__(self, path: str, quantize: bool):
+        self.path = path
+        self.quantize = quantize
+        self.lock = threading.RLock()
+        self.dim = 0
+        self.ids: List[Optional[str]] = []
+        self.metadata: List[Optional[Dict]] = []
+        self.id_to_row: Dict[str, int] = {}
+        self.alive = np.zeros(0, dtype=bool)
+        self.matrix = None
+        self.scales = None
+        self.ann = None
+        self._load()
+    
+    @property
+    def matrix_path(self) -> str:
+        return os.path.join(self.path, "vectors.i8" if self.quantize else "vectors.f32")
+    
+    @property
+    def scales_path(self) -> str:
+        return os.path.join(self.path, "scales.f32")
+    
+    @property
+    def log_path(self) -> str:
+        return os.path.join(self.path, "log.jsonl")
+    
+    @property
+    def count(self) -> int:
+        return len(self.id_to_row)
+    
+    def _load(self):
+        info_path = os.path.join(self.path, "info.json")
+        if not os.path.exists(info_path) or not os.path.exists(self.log_path):
+            return
+        with open(info_path) as f:
+            info = json.load(f)
+        self.dim = info["dim"]
+        self.quantize = info["quantized"]
+        
+        with open(self.log_path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A torn final line from a crash mid-write; everything before it is intact
+                    break
+                if entry["op"] == "put":
+                    self._assign(entry["id"], entry["row"], entry["metadata"])
+                else:
+                    row = self.id_to_row.pop(entry["id"], None)
+                    if row is not None:
+                        self.ids[row] = None
+                        self.metadata[row] = None
+        self.alive = np.array([vector_id is not None for vector_id in self.ids], dtype=bool)
+        
+        # Drop rows written to the matrix files but never recorded in the log
+        row_bytes = self.dim * (1 if self.quantize else 4)
+        self._truncate(self.matrix_path, len(self.ids) * row_bytes)
+        if self.quantize:
+            self._truncate(self.scales_path, len(self.ids) * 4)
+        self._remap()
+    
+    @staticmethod
+    def _truncate(path: str, size: int):
+        if os.path.exists(path) and os.path.getsize(path) > size:
+            with open(path, "r+b") as f:
+                f.truncate(size)
+    
+    def _assign(self, vector_id: str, row: int, metadata: Dict):
+        while len(self.ids) <= row:
+            self.ids.append(None)
+            self.metadata.append(None)
+        self.ids[row] = vector_id
+        self.metadata[row] = metadata
+        self.id_to_row[vector_id] = row
+    
+    def _remap(self):
+        rows = len(self.ids)
+        if rows == 0 or not os.path.exists(self.matrix_path):
+            self.matrix = None
+            self.scales = None
+            return
+        dtype = np.int8 if self.quantize else np.float32
+        self.matrix = np.memmap(self.matrix_path, dtype=dtype, mode="r", shape=(rows, self.dim))
+        if self.quantize:
+            self.scales = np.memmap(self.scales_path, dtype=np.float32, mode="r", shape=(rows,))
+    
+    def _encode(self, unit_vectors: np.ndarray):
+        if not self.quantize:
+            return unit_vectors.astype(np.float32), None
+        scales = np.abs(unit_vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.clip(np.rint(unit_vectors / scales[:, None]), -127, 127).astype(np.int8)
+        return codes, scales.astype(np.float32)
+    
+    def upsert(self, vectors: List[Dict]):
+        with self.lock:
+            values = np.asarray([v["values"] for v in vectors], dtype=np.float32)
+            if self.dim == 0:
+                self.dim = values.shape[1]
+                os.makedirs(self.path, exist_ok=True)
+                with open(os.path.join(self.path, "info.json"), "w") as f:
+                    json.dump({"dim": self.dim, "quantized": self.quantize}, f)
+            if values.shape[1] != self.dim:
+                raise ValueError(f"Vector dimension {values.shape[1]} does not match namespace dimension {self.dim}")
+            
+            codes, scales = self._encode(_unit(values))
+            
+            # Later duplicates of an id in the same batch win, as with Pinecone
+            latest = {v["id"]: i for i, v in enumerate(vectors)}
+            updates = [(self.id_to_row[vid], i) for vid, i in latest.items() if vid in self.id_to_row]
+            appends = [i for vid, i in latest.items() if vid not in self.id_to_row]
+            
+            if updates:
+                dtype = np.int8 if self.quantize else np.float32
+                matrix = np.memmap(self.matrix_path, dtype=dtype, mode="r+", shape=(len(self.ids), self.dim))
+                for row, i in updates:
+                    matrix[row] = codes[i]
+                matrix.flush()
+                if self.quantize:
+                    stored_scales = np.memmap(self.scales_path, dtype=np.float32, mode="r+", shape=(len(self.ids),))
+                    for row, i in updates:
+                        stored_scales[row] = scales[i]
+                    stored_scales.flush()
+            
+            if appends:
+                with open(self.matrix_path, "ab") as f:
+                    f.write(codes[appends].tobytes())
+                if self.quantize:
+                    with open(self.scales_path, "ab") as f:
+                        f.write(scales[appends].tobytes())
+            
+            first_new_row = len(self.ids)
+            with open(self.log_path, "a") as log:
+                for row, i in updates:
+                    log.write(json.dumps({"op": "put", "id": vectors[i]["id"], "row": row, "metadata": vectors[i].get("metadata", {})}) + "\n")
+                    self.metadata[row] = vectors[i].get("metadata", {})
+                for offset, i in enumerate(appends):
+                    row = first_new_row + offset
+                    log.write(json.dumps({"op": "put", "id": vectors[i]["id"], "row": row, "metadata": vectors[i].get("metadata", {})}) + "\n")
+                    self._assign(vectors[i]["id"], row, vectors[i].get("metadata", {}))
+            
+            self.alive = np.concatenate([self.alive, np.ones(len(appends), dtype=bool)])
+            self._remap()
+            # Rows updated in place may now sit in the wrong IVF list, so rebuild on next query
+            if updates:
+                self.ann = None
+    
+    def delete(self, ids: List[str]):
+        with self.lock:
+            with open(self.log_path, "a") as log:
+                for vector_id in ids:
+                    row = self.id_to_row.pop(vector_id, None)
+                    if row is None:
+                        continue
+                    self.ids[row] = None
+                    self.metadata[row] = None
+                    self.alive[row] = False
+                    log.write(json.dumps({"op": "del", "id": vector_id}) + "\n")
+            dead = len(self.ids) - self.count
+            if len(self.ids) and dead / len(self.ids) > COMPACT_DEAD_FRACTION:
+                self._compact()
+    
+    def _compact(self):
+        keep = np.flatnonzero(self.alive)
+        codes = np.array(self.matrix[keep]) if self.matrix is not None else np.zeros((0, self.dim))
+        scales = np.array(self.scales[keep]) if self.quantize and self.scales is not None else None
+        ids = [self.ids[row] for row in keep]
+        metadata = [self.metadata[row] for row in keep]
+        
+        self.matrix = self.scales = None
+        # Write to temp files and rename so a crash mid-compaction leaves the old files intact
+        with open(self.matrix_path + ".tmp", "wb") as f:
+            f.write(codes.tobytes())
+        if scales is not None:
+            with open(self.scales_path + ".tmp", "wb") as f:
+                f.write(scales.tobytes())
+        with open(self.log_path + ".tmp", "w") as log:
+            for row, (vector_id, meta) in enumerate(zip(ids, metadata)):
+                log.write(json.dumps({"op": "put", "id": vector_id, "row": row, "metadata": meta}) + "\n")
+        os.replace(self.matrix_path + ".tmp", self.matrix_path)
+        if scales is not None:
+            os.replace(self.scales_path + ".tmp", self.scales_path)
+        os.replace(self.log_path + ".tmp", self.log_path)
+        
+        self.ids, self.metadata, self.id_to_row = [], [], {}
+        for row, (vector_id, meta) in enumerate(zip(ids, metadata)):
+            self._assign(vector_id, row, meta)
+        self.alive = np.ones(len(ids), dtype=bool)
+        self.ann = None
+        self._remap()
+    
+    def _scores(self, rows: Optional[np.ndarray], query: np.ndarray) -> np.ndarray:
+        """Cosine scores for `rows` (all rows when None), scanned in blocks to bound memory."""
+        total = len(self.ids) if rows is None else len(rows)
+        scores = np.empty(total, dtype=np.float32)
+        for start in range(0, total, SCAN_BLOCK_ROWS):
+            stop = min(start + SCAN_BLOCK_ROWS, total)
+            block_rows = slice(start, stop) if rows is None else rows[start:stop]
+            block = self.matrix[block_rows]
+            if self.quantize:
+                scores[start:stop] = (block.astype(np.float32) @ query) * self.scales[block_rows]
+            else:
+                scores[start:stop] = block @ query
+        return scores
+    
+    def query(self, vector: List[float], top_k: int, ann_min_vectors: int, nprobe: int) -> List[tuple]:
+        with self.lock:
+            if self.matrix is None or self.count == 0:
+                return []
+            query = _unit(np.asarray(vector, dtype=np.float32))
+            
+            if ann_min_vectors and self.count >= ann_min_vectors:
+                rows = self._ann_candidates(query, nprobe)
+            else:
+                rows = np.flatnonzero(self.alive)
+            
+            if len(rows) == len(self.ids):
+                scores = self._scores(None, query)
+            else:
+                scores = self._scores(rows, query)
+            
+            k = min(top_k, len(rows))
+            if k == 0:
+                return []
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top], kind="stable")]
+            return [(self.ids[rows[i]], float(scores[i]), self.metadata[rows[i]]) for i in top]
+    
+    def _ann_candidates(self, query: np.ndarray, nprobe: int) -> np.ndarray:
+        total_rows = len(self.ids)
+        if self.ann is None or (total_rows - self.ann["indexed_rows"]) > ANN_REBUILD_FRACTION * self.ann["indexed_rows"]:
+            self._build_ann()
+        
+        centroid_scores = self.ann["centroids"] @ query
+        probe = np.argsort(-centroid_scores)[:nprobe]
+        rows = [self.ann["lists"][c] for c in probe]
+        # Rows appended since the last build are not in any list yet, so scan them exactly
+        rows.append(np.arange(self.ann["indexed_rows"], total_rows))
+        rows = np.concatenate(rows)
+        return rows[self.alive[rows]]
+    
+    def _build_ann(self):
+        """IVF-flat: k-means centroids over a sample, then every row assigned to its nearest centroid."""
+        total_rows = len(self.ids)
+        alive_rows = np.flatnonzero(self.alive)
+        nlist = max(1, int(np.sqrt(len(alive_rows))))
+        rng = np.random.default_rng(0)
+        sample_rows = np.sort(rng.choice(alive_rows, size=min(KMEANS_SAMPLE, len(alive_rows)), replace=False))
+        sample = self._dense(sample_rows)
+        
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)]
+        for _ in range(KMEANS_ITERATIONS):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            for c in range(nlist):
+                members = sample[assignment == c]
+                if len(members):
+                    centroids[c] = members.mean(axis=0)
+            centroids = _unit(centroids)
+        
+        assignment = np.empty(total_rows, dtype=np.int64)
+        for start in range(0, total_rows, SCAN_BLOCK_ROWS):
+            block = self._dense(np.arange(start, min(start + SCAN_BLOCK_ROWS, total_rows)))
+            assignment[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+        order = np.argsort(assignment, kind="stable")
+        boundaries = np.searchsorted(assignment[order], np.arange(nlist + 1))
+        lists = [order[boundaries[c]:boundaries[c + 1]] for c in range(nlist)]
+        self.ann = {"centroids": centroids, "lists": lists, "indexed_rows": total_rows}
+    
+    def _dense(self, rows: np.ndarray) -> np.ndarray:
+        block = np.asarray(self.matrix[rows], dtype=np.float32)
+        if self.quantize:
+            block = block * self.scales[rows][:, None]
+        return block
+    
+    def fetch(self, ids: List[str]) -> Dict[str, Dict]:
+        with self.lock:
+            found = {}
+            for vector_id in ids:
+                row = self.id_to_row.get(vector_id)
+                if row is not None:
+                    found[vector_id] = {"values": self._dense(np.array([row]))[0].tolist(), "metadata": self.metadata[row]}
+            return found
+
+
+class LocalVectorIndex(VectorIndex):
+    """In-process cosine-similarity index with one memory-mapped matrix per namespace.
+    Exact top-k by default; namespaces of at least `ann_min_vectors` use an IVF index."""
+    
+    dependency = "local_index"
+    
+    def __init__(self, root: str, quantize: bool = False, ann_min_vectors: int = 0, nprobe: int = 8):
+        self.root = root
+        self.quantize = quantize
+        self.ann_min_vectors = ann_min_vectors
+        self.nprobe = nprobe
+        self._namespaces: Dict[str, _Namespace] = {}
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+    
+    def _dir(self, namespace: str) -> str:
+        return os.path.join(self.root, NAMESPACE_DIR_PREFIX + quote(namespace or "", safe=""))
+    
+    def _namespace(self, namespace: str, create: bool = False) -> Optional[_Namespace]:
+        namespace = namespace or ""
+        with self._lock:
+            ns = self._namespaces.get(namespace)
+            if ns is None and (create or os.path.isdir(self._dir(namespace))):
+                ns = _Namespace(self._dir(namespace), self.quantize)
+                self._namespaces[namespace] = ns
+            return ns
+    
+    def upsert(self, vectors: List[Dict], namespace: str):
+        if vectors:
+            self._namespace(namespace, create=True).upsert(vectors)
+    
+    def query(self, vector: List[float], top_k: int, namespace: str, include_metadata: bool = True) -> List[Dict]:
+        ns = self._namespace(namespace)
+        if ns is None:
+            return []
+        return [
+            {"id": vector_id, "score": score, "metadata": metadata if include_metadata else {}}
+            for vector_id, score, metadata in ns.query(vector, top_k, self.ann_min_vectors, self.nprobe)
+        ]
+    
+    def fetch(self, ids: List[str], namespace: str) -> Dict[str, Dict]:
+        ns = self._namespace(namespace)
+        return ns.fetch(ids) if ns is not None else {}
+    
+    def delete(self, ids: List[str], namespace: str):
+        ns = self._namespace(namespace)
+        if ns is not None:
+            ns.delete(ids)
+    
+    def delete_namespace(self, namespace: str):
+        namespace = namespace or ""
+        with self._lock:
+            ns = self._namespaces.pop(namespace, None)
+            if ns is not None:
+                with ns.lock:
+                    ns.matrix = ns.scales = None
+            shutil.rmtree(self._dir(namespace), ignore_errors=True)
+    
+    def describe_stats(self) -> Dict:
+        namespaces = {}
+        for entry in sorted(os.listdir(self.root)):
+            if entry.startswith(NAMESPACE_DIR_PREFIX):
+                name = unquote(entry[len(NAMESPACE_DIR_PREFIX):])
+                ns = self._namespace(name)
+                if ns is not None and ns.count:
+                    namespaces[name] = ns.count
+        return {
+            "total_vectors": sum(namespaces.values()),
+            "namespaces": list(namespaces.keys())
+        }
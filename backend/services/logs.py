@@ -0,0 +1,44 @@
+import json
+import logging
+import random
+from typing import Optional
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import LOG_LEVEL, LOG_SAMPLE_RATE
+
+logger = logging.getLogger("mini_rag")
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "event": record.getMessage(),
+            **getattr(record, "fields", {})
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging():
+    if logger.handlers:
+        return
+    handler = logging.StreamHandler()
+    handler.setFormatter(JsonFormatter())
+    logger.addHandler(handler)
+    logger.setLevel(LOG_LEVEL)
+    logger.propagate = False
+
+
+def log_event(event: str, level: int = logging.INFO, sample_rate: Optional[float] = None, **fields):
+    """Log one JSON line. Events are kept with probability `sample_rate` (LOG_SAMPLE_RATE by
+    default, 1.0 for warnings and above), and the rate is logged so counts can be scaled back up."""
+    if sample_rate is None:
+        sample_rate = 1.0 if level >= logging.WARNING else LOG_SAMPLE_RATE
+    if not logger.isEnabledFor(level) or (sample_rate < 1.0 and random.random() >= sample_rate):
+        return
+    logger.log(level, event, extra={"fields": {**fields, "sample_rate": sample_rate}})
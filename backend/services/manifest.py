@@ -0,0 +1,86 @@
+import sqlite3
+import threading
+from typing import Set, Iterable, Dict, Optional
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import MANIFEST_DB_PATH
+
+
+class ChunkManifest:
+    """The chunk ids indexed for each (namespace, source), and each chunk's position in the
+    source as indexed, kept in SQLite.
+    
+    Ids are added as their vectors are upserted and removed as they are deleted, so the manifest
+    never lists a chunk the index doesn't have.
+    """
+    
+    def __init__(self, db_path: str):
+        self._db_path = db_path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+    
+    @property
+    def _db(self) -> sqlite3.Connection:
+        # Opened on first use, under the lock, or by connect() during warm-up rather than at import
+        if self._conn is None:
+            if self._db_path != ":memory:":
+                os.makedirs(os.path.dirname(os.path.abspath(self._db_path)), exist_ok=True)
+            db = sqlite3.connect(self._db_path, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS chunks ("
+                "namespace TEXT NOT NULL, source TEXT NOT NULL, chunk_id TEXT NOT NULL, "
+                "PRIMARY KEY (namespace, source, chunk_id)) WITHOUT ROWID"
+            )
+            columns = {row[1] for row in db.execute("PRAGMA table_info(chunks)")}
+            if "chunk_index" not in columns:
+                # Manifests written before positions were kept; their chunks read as moved
+                db.execute("ALTER TABLE chunks ADD COLUMN chunk_index INTEGER")
+            db.commit()
+            self._conn = db
+        return self._conn
+    
+    def connect(self):
+        with self._lock:
+            self._db
+    
+    def chunk_ids(self, namespace: str, source: str) -> Set[str]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT chunk_id FROM chunks WHERE namespace = ? AND source = ?", (namespace, source)
+            ).fetchall()
+        return {row[0] for row in rows}
+    
+    def positions(self, namespace: str, source: str) -> Dict[str, Optional[int]]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT chunk_id, chunk_index FROM chunks WHERE namespace = ? AND source = ?", (namespace, source)
+            ).fetchall()
+        return dict(rows)
+    
+    def add(self, namespace: str, source: str, positions: Dict[str, int]):
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO chunks (namespace, source, chunk_id, chunk_index) VALUES (?, ?, ?, ?)",
+                [(namespace, source, chunk_id, chunk_index) for chunk_id, chunk_index in positions.items()]
+            )
+            self._db.commit()
+    
+    def remove(self, namespace: str, source: str, chunk_ids: Iterable[str]):
+        with self._lock:
+            self._db.executemany(
+                "DELETE FROM chunks WHERE namespace = ? AND source = ? AND chunk_id = ?",
+                [(namespace, source, chunk_id) for chunk_id in chunk_ids]
+            )
+            self._db.commit()
+    
+    def delete_namespace(self, namespace: str):
+        with self._lock:
+            self._db.execute("DELETE FROM chunks WHERE namespace = ?", (namespace,))
+            self._db.commit()
+
+
+chunk_manifest = ChunkManifest(MANIFEST_DB_PATH)
@@ -0,0 +1,74 @@
+from typing import Awaitable, Tuple, TypeVar
+
+from prometheus_client import Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest
+
+T = TypeVar("T")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Time to the response headers, by route",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS
+)
+HTTP_REQUESTS_IN_PROGRESS = Gauge("http_requests_in_progress", "Requests being handled")
+
+QUERY_STAGE_SECONDS = Histogram(
+    "rag_query_stage_seconds",
+    "Time in each query stage: embed, vector_query, lexical_query, fetch, rerank, llm_first_token, llm_total",
+    ["stage"], buckets=LATENCY_BUCKETS
+)
+INGEST_STAGE_SECONDS = Histogram(
+    "rag_ingest_stage_seconds", "Time per batch of chunks in each upload stage: extract, chunk, embed, upsert",
+    ["stage"], buckets=LATENCY_BUCKETS
+)
+
+DEPENDENCY_CALLS = Counter(
+    "rag_dependency_calls_total", "Calls run on each dependency's executor, by outcome (ok, error, timeout, cancelled)",
+    ["dependency", "outcome"]
+)
+DEPENDENCY_CALL_SECONDS = Histogram(
+    "rag_dependency_call_seconds", "Time per dependency call, including any wait for a free worker",
+    ["dependency"], buckets=LATENCY_BUCKETS
+)
+
+TOKENS = Counter(
+    "rag_tokens_total", "Tokens by kind: embedded (chunk tokens sent for embedding), prompt, completion and saved (removed by context packing)",
+    ["kind"]
+)
+
+READY = Gauge("rag_ready", "1 once warm-up has finished and the replica reports ready")
+WARMUP_SECONDS = Gauge("rag_warmup_step_seconds", "Time the last successful run of each warm-up step took", ["step"])
+
+COALESCED_REQUESTS = Counter(
+    "rag_coalesced_requests_total", "Queries that shared an identical in-flight query's work instead of starting their own",
+    ["endpoint"]
+)
+
+NAMESPACE_QUERIES = Counter(
+    "rag_namespace_queries_total", "Per-namespace searches of multi-namespace queries, by outcome (ok, error, timeout)",
+    ["outcome"]
+)
+
+ANSWER_DECISIONS = Counter(
+    "rag_answer_decisions_total", "How queries with sources were answered: generate, light (short answer) or skip (no LLM call)",
+    ["decision"]
+)
+
+ADMISSION_IN_FLIGHT = Gauge("rag_admission_in_flight", "Requests admitted and running, by admission pool", ["pool"])
+ADMISSION_QUEUE_DEPTH = Gauge("rag_admission_queue_depth", "Requests waiting for admission, by pool", ["pool"])
+ADMISSION_WAIT_SECONDS = Histogram(
+    "rag_admission_wait_seconds", "Time admitted requests waited in the admission queue", ["pool"], buckets=LATENCY_BUCKETS
+)
+ADMISSION_REJECTED = Counter(
+    "rag_admission_rejected_total", "Requests turned away with a 503, by pool and reason (queue_full, deadline)",
+    ["pool", "reason"]
+)
+
+
+async def observe(stage: str, awaitable: Awaitable[T]) -> T:
+    with QUERY_STAGE_SECONDS.labels(stage).time():
+        return await awaitable
+
+
+def render() -> Tuple[bytes, str]:
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,93 @@
+import multiprocessing
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, Future
+from typing import List, Iterator, Optional, Deque
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import PDF_EXTRACT_PROCESSES, PDF_EXTRACT_TASKS_PER_UPLOAD, PDF_PAGES_PER_TASK, PDF_PARALLEL_MIN_PAGES
+
+_pool: Optional[ProcessPoolExecutor] = None
+_lock = threading.Lock()
+
+
+def get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _lock:
+        if _pool is None:
+            # Spawned rather than forked: the server process has threads (and their locks) to leave behind
+            _pool = ProcessPoolExecutor(
+                max_workers=PDF_EXTRACT_PROCESSES,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pool
+
+
+def shutdown_pdf_extractor():
+    global _pool
+    with _lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def _load_pypdf():
+    import pypdf  # noqa: F401
+
+
+def warm_up():
+    """Import pypdf here and start the extraction processes, so the first PDF doesn't wait on either."""
+    _load_pypdf()
+    if PDF_EXTRACT_PROCESSES > 0:
+        pool = get_pool()
+        # The pool spawns a process per submitted task until it has PDF_EXTRACT_PROCESSES
+        for future in [pool.submit(_load_pypdf) for _ in range(PDF_EXTRACT_PROCESSES)]:
+            future.result()
+
+
+def count_pages(path: str) -> int:
+    from pypdf import PdfReader
+    return len(PdfReader(path).pages)
+
+
+def _extract_range(path: str, start: int, end: int) -> List[str]:
+    # A reader per task: readers aren't thread-safe, and one kept around after the upload would
+    # hold a parsed copy of a large PDF in the worker
+    from pypdf import PdfReader
+    reader = PdfReader(path)
+    return [reader.pages[i].extract_text() or "" for i in range(start, end)]
+
+
+def extract_pages(path: str, page_count: int, tasks_per_upload: int = PDF_EXTRACT_TASKS_PER_UPLOAD) -> Iterator[str]:
+    """Yield the text of each page of the PDF at `path`, in order.
+    
+    Page ranges are extracted in the process pool, with at most `tasks_per_upload` ranges in
+    flight so the reader stays only a few ranges ahead of whoever consumes the pages.
+    """
+    if PDF_EXTRACT_PROCESSES <= 0 or page_count < PDF_PARALLEL_MIN_PAGES:
+        from pypdf import PdfReader
+        reader = PdfReader(path)
+        for page in reader.pages:
+            yield page.extract_text() or ""
+        return
+    
+    pool = get_pool()
+    ranges = iter([(start, min(start + PDF_PAGES_PER_TASK, page_count)) for start in range(0, page_count, PDF_PAGES_PER_TASK)])
+    pending: Deque[Future] = deque()
+    try:
+        for start, end in ranges:
+            pending.append(pool.submit(_extract_range, path, start, end))
+            if len(pending) == tasks_per_upload:
+                break
+        while pending:
+            texts = pending.popleft().result()
+            next_range = next(ranges, None)
+            if next_range is not None:
+                pending.append(pool.submit(_extract_range, path, *next_range))
+            yield from texts
+    finally:
+        # The consumer stopped early (a failed upload); don't leave its pages queued ahead of others
+        for future in pending:
+            future.cancel()
@@ -0,0 +1,122 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+import sys
+import os
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import QUERY_CACHE_TTL_S, QUERY_CACHE_SIMILARITY_THRESHOLD, QUERY_CACHE_MAX_ENTRIES
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_query(query: str) -> str:
+    return _WHITESPACE.sub(' ', query.lower()).strip().rstrip('?!.').strip()
+
+
+def _namespace_key(namespace: Optional[str]) -> str:
+    # Pinecone treats a missing namespace as the default "" namespace
+    return namespace or ""
+
+
+class QueryCache:
+    def __init__(self, ttl_s: float, similarity_threshold: float, max_entries: int):
+        self.ttl_s = ttl_s
+        self.similarity_threshold = similarity_threshold
+        self.max_entries = max_entries
+        self._namespaces: Dict[str, "OrderedDict[str, Dict]"] = {}
+        self._generations: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+    
+    def generation(self, namespace: Optional[str]) -> int:
+        with self._lock:
+            return self._generations.get(_namespace_key(namespace), 0)
+    
+    def get_exact(self, namespace: Optional[str], normalized_query: str) -> Optional[Dict]:
+        with self._lock:
+            entries = self._namespaces.get(_namespace_key(namespace))
+            entry = entries.get(normalized_query) if entries else None
+            if entry is None or entry["expires_at"] < time.time():
+                return None
+            entries.move_to_end(normalized_query)
+            self.exact_hits += 1
+            return entry["result"]
+    
+    def get_similar(self, namespace: Optional[str], embedding: List[float]) -> Optional[Tuple[Dict, float]]:
+        with self._lock:
+            entries = self._namespaces.get(_namespace_key(namespace))
+            self._evict_expired(entries)
+            if not entries:
+                self.misses += 1
+                return None
+            
+            keys = list(entries.keys())
+            matrix = np.stack([entries[key]["embedding"] for key in keys])
+            similarities = matrix @ _unit(embedding)
+            best = int(np.argmax(similarities))
+            similarity = float(similarities[best])
+            
+            if similarity < self.similarity_threshold:
+                self.misses += 1
+                return None
+            entries.move_to_end(keys[best])
+            self.semantic_hits += 1
+            return entries[keys[best]]["result"], similarity
+    
+    def put(self, namespace: Optional[str], normalized_query: str, embedding: List[float], result: Dict, generation: int):
+        key = _namespace_key(namespace)
+        with self._lock:
+            # The namespace changed while this answer was being generated, so it may be stale
+            if self._generations.get(key, 0) != generation:
+                return
+            entries = self._namespaces.setdefault(key, OrderedDict())
+            entries[normalized_query] = {
+                "embedding": _unit(embedding),
+                "result": result,
+                "expires_at": time.time() + self.ttl_s
+            }
+            entries.move_to_end(normalized_query)
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+    
+    def invalidate_namespace(self, namespace: Optional[str]):
+        key = _namespace_key(namespace)
+        with self._lock:
+            self._namespaces.pop(key, None)
+            self._generations[key] = self._generations.get(key, 0) + 1
+    
+    def _evict_expired(self, entries: Optional["OrderedDict[str, Dict]"]):
+        if not entries:
+            return
+        now = time.time()
+        for key in [k for k, entry in entries.items() if entry["expires_at"] < now]:
+            del entries[key]
+    
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.exact_hits + self.semantic_hits + self.misses
+            return {
+                "namespaces": len(self._namespaces),
+                "entries": sum(len(entries) for entries in self._namespaces.values()),
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.exact_hits + self.semantic_hits) / lookups, 4) if lookups else 0.0
+            }
+
+
+def _unit(embedding: List[float]) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+query_cache = QueryCache(QUERY_CACHE_TTL_S, QUERY_CACHE_SIMILARITY_THRESHOLD, QUERY_CACHE_MAX_ENTRIES)
@@ -1,10 +1,13 @@
 import math
 import re
-from typing import List, Dict
+from functools import lru_cache
+from typing import List, Dict, Optional, Tuple
 from collections import Counter
 import sys
 import os
 
+import numpy as np
+
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from config import TOP_K_RERANK, RERANK_THRESHOLD
 
@@ -18,21 +21,55 @@ K1 = 1.5
 B = 0.75
 
 
+STOPWORDS = frozenset({
+    'the', 'a', 'an', 'is', 'are', 'was', 'were', 'be', 'been', 'being',
+    'have', 'has', 'had', 'do', 'does', 'did', 'will', 'would', 'could',
+    'should', 'may', 'might', 'must', 'shall', 'can', 'of', 'at', 'by',
+    'for', 'with', 'about', 'against', 'between', 'into', 'through',
+    'during', 'before', 'after', 'above', 'below', 'to', 'from', 'up',
+    'down', 'in', 'out', 'on', 'off', 'over', 'under', 'again', 'further',
+    'then', 'once', 'here', 'there', 'when', 'where', 'why', 'how', 'all',
+    'each', 'few', 'more', 'most', 'other', 'some', 'such', 'no', 'nor',
+    'not', 'only', 'own', 'same', 'so', 'than', 'too', 'very', 'just',
+    'and', 'but', 'if', 'or', 'because', 'as', 'until', 'while', 'this',
+    'that', 'these', 'those', 'what', 'which', 'who', 'whom', 'it', 'its'
+})
+
+_TOKEN_PATTERN = re.compile(r'\b[a-z0-9]+\b')
+
+
 def tokenize(text: str) -> List[str]:
-    text = text.lower()
-    tokens = re.findall(r'\b[a-z0-9]+\b', text)
-    stopwords = {'the', 'a', 'an', 'is', 'are', 'was', 'were', 'be', 'been', 'being',
-                 'have', 'has', 'had', 'do', 'does', 'did', 'will', 'would', 'could',
-                 'should', 'may', 'might', 'must', 'shall', 'can', 'of', 'at', 'by',
-                 'for', 'with', 'about', 'against', 'between', 'into', 'through',
-                 'during', 'before', 'after', 'above', 'below', 'to', 'from', 'up',
-                 'down', 'in', 'out', 'on', 'off', 'over', 'under', 'again', 'further',
-                 'then', 'once', 'here', 'there', 'when', 'where', 'why', 'how', 'all',
-                 'each', 'few', 'more', 'most', 'other', 'some', 'such', 'no', 'nor',
-                 'not', 'only', 'own', 'same', 'so', 'than', 'too', 'very', 'just',
-                 'and', 'but', 'if', 'or', 'because', 'as', 'until', 'while', 'this',
-                 'that', 'these', 'those', 'what', 'which', 'who', 'whom', 'it', 'its'}
-    return [t for t in tokens if t not in stopwords and len(t) > 1]
+    tokens = _TOKEN_PATTERN.findall(text.lower())
+    return [t for t in tokens if t not in STOPWORDS and len(t) > 1]
+
+
+def build_rerank_features(text: str) -> Dict:
+    tokens = tokenize(text)
+    # Terms are [a-z0-9]+, so ":" and " " can't collide with them. A flat string keeps the
+    # features storable as vector-store metadata, which only allows scalars and string lists.
+    return {
+        "term_freqs": " ".join(f"{term}:{count}" for term, count in Counter(tokens).items()),
+        "doc_len": len(tokens)
+    }
+
+
+def _query_term_pattern(terms: List[str]) -> re.Pattern:
+    # Scanning the stored string for just the query terms is much cheaper than parsing every term
+    alternatives = "|".join(re.escape(term) for term in terms) or "(?!)"
+    return re.compile(rf'(?:^| )({alternatives}):(\d+)')
+
+
+def _doc_term_freqs(doc: Dict, pattern: re.Pattern) -> Tuple[Dict[str, int], int]:
+    if 'term_freqs' in doc and 'doc_len' in doc:
+        return {term: int(count) for term, count in pattern.findall(doc['term_freqs'])}, int(doc['doc_len'])
+    # Vectors indexed before features were stored at ingest time
+    tokens = tokenize(doc['text'])
+    return Counter(tokens), len(tokens)
+
+
+@lru_cache(maxsize=4096)
+def _title_tokens(title: str) -> frozenset:
+    return frozenset(tokenize(title))
 
 
 def compute_bm25(query_tokens: List[str], doc_tokens: List[str], avg_doc_len: float, doc_freq: Dict[str, int], total_docs: int) -> float:
@@ -84,55 +121,173 @@ def compute_term_coverage(query_tokens: List[str], doc_tokens: List[str]) -> flo
     return covered / len(query_tokens)
 
 
-async def rerank_documents(query: str, documents: List[Dict], top_k: int = TOP_K_RERANK) -> List[Dict]:
-    if not documents:
+def _phrase_scores(query: str, texts: List[str]) -> np.ndarray:
+    query_lower = query.lower()
+    words = query_lower.split()
+    bigrams = [f"{words[i]} {words[i+1]}" for i in range(len(words)-1)] if len(words) >= 2 else []
+    
+    scores = np.zeros(len(texts))
+    for i, text in enumerate(texts):
+        text_lower = text.lower()
+        if query_lower in text_lower:
+            scores[i] = 1.0
+        elif bigrams:
+            scores[i] = sum(1 for bg in bigrams if bg in text_lower) / len(bigrams)
+    return scores
+
+
+def _title_scores(query_tokens: List[str], titles: List[str]) -> np.ndarray:
+    by_title = {}
+    for title in set(titles):
+        title_tokens = _title_tokens(title)
+        if not title_tokens or not query_tokens:
+            by_title[title] = 0.0
+        else:
+            by_title[title] = sum(1 for t in query_tokens if t in title_tokens) / len(query_tokens)
+    return np.array([by_title[title] for title in titles], dtype=np.float64)
+
+
+def score_document_sets(queries: List[str], document_sets: List[List[Dict]],
+                        weights: Optional[Dict[str, float]] = None) -> List[np.ndarray]:
+    """Score each query's candidates in one vectorized pass over all of them. Corpus statistics
+    (document frequency, average length) are still per set, so every set scores exactly as it
+    would on its own."""
+    weights = weights or {}
+    w_bm25 = weights.get("bm25", W_BM25)
+    w_title = weights.get("title_match", W_TITLE_MATCH)
+    w_phrase = weights.get("phrase_match", W_PHRASE_MATCH)
+    w_coverage = weights.get("term_coverage", W_TERM_COVERAGE)
+    w_vector = weights.get("vector_score", W_VECTOR_SCORE)
+    
+    query_tokens = [tokenize(query) for query in queries]
+    set_sizes = np.array([len(documents) for documents in document_sets], dtype=np.int64)
+    set_of_row = np.repeat(np.arange(len(queries)), set_sizes)
+    total_rows = int(set_sizes.sum())
+    
+    # Columns are the distinct terms of each query, block-diagonal across sets: candidates come
+    # from several namespaces with no shared vocabulary, so term IDs are assigned per query
+    term_ids: List[Dict[str, int]] = []
+    columns = 0
+    for tokens in query_tokens:
+        ids = {term: columns + i for i, term in enumerate(dict.fromkeys(tokens))}
+        term_ids.append(ids)
+        columns += len(ids)
+    
+    tf = np.zeros((total_rows, columns), dtype=np.float64)
+    doc_lens = np.zeros(total_rows, dtype=np.float64)
+    row = 0
+    for ids, documents in zip(term_ids, document_sets):
+        pattern = _query_term_pattern(list(ids))
+        for doc in documents:
+            doc_tf, doc_len = _doc_term_freqs(doc, pattern)
+            doc_lens[row] = doc_len
+            for term, col in ids.items():
+                count = doc_tf.get(term)
+                if count:
+                    tf[row, col] = count
+            row += 1
+    
+    present = tf > 0
+    # Only a set's own rows can be non-zero in its columns, so column sums are per-set counts
+    doc_freq = present.sum(axis=0)
+    idf = np.zeros(columns)
+    for set_index, ids in enumerate(term_ids):
+        total_docs = int(set_sizes[set_index])
+        for col in ids.values():
+            df = int(doc_freq[col])
+            if df:
+                idf[col] = math.log((total_docs - df + 0.5) / (df + 0.5) + 1)
+    
+    # Document lengths are whole numbers, so the per-set sums are exact in any order
+    length_sums = np.bincount(set_of_row, weights=doc_lens, minlength=len(queries))
+    avg_doc_len = np.divide(length_sums, set_sizes, out=np.ones(len(queries)), where=set_sizes > 0)[set_of_row]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        length_norm = K1 * (1 - B + B * (doc_lens / avg_doc_len))
+    
+    # Accumulate one query term at a time, in query order, so the floating-point sums match
+    # the scalar compute_bm25 / compute_term_coverage results bit for bit
+    rows = np.arange(total_rows)
+    query_lens = np.array([len(tokens) for tokens in query_tokens], dtype=np.int64)
+    bm25 = np.zeros(total_rows)
+    covered = np.zeros(total_rows, dtype=np.int64)
+    for position in range(int(query_lens.max()) if len(queries) else 0):
+        cols = np.array([ids[tokens[position]] if position < len(tokens) else -1
+                         for tokens, ids in zip(query_tokens, term_ids)], dtype=np.int64)[set_of_row]
+        active = cols >= 0
+        cols = np.where(active, cols, 0)
+        term_present = active & present[rows, cols] if columns else np.zeros(total_rows, dtype=bool)
+        covered += term_present
+        if not term_present.any():
+            continue
+        term_tf = tf[rows, cols]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            contribution = idf[cols] * ((term_tf * (K1 + 1)) / (term_tf + length_norm))
+        bm25 = bm25 + np.where(term_present, contribution, 0.0)
+    
+    row_query_lens = query_lens[set_of_row]
+    coverage = np.divide(covered, row_query_lens, out=np.zeros(total_rows), where=row_query_lens > 0)
+    title = np.concatenate([_title_scores(tokens, [doc.get('title', '') for doc in documents])
+                            for tokens, documents in zip(query_tokens, document_sets)] or [np.zeros(0)])
+    phrase = np.concatenate([_phrase_scores(query, [doc['text'] for doc in documents])
+                             for query, documents in zip(queries, document_sets)] or [np.zeros(0)])
+    vector = np.array([doc.get('score', 0) for documents in document_sets for doc in documents], dtype=np.float64)
+    
+    final = (
+        w_bm25 * bm25 +
+        w_title * title +
+        w_phrase * phrase +
+        w_coverage * coverage +
+        w_vector * vector
+    )
+    
+    max_possible = w_bm25 * 10 + w_title + w_phrase + w_coverage + w_vector
+    if max_possible <= 0:
+        final = np.zeros(total_rows)
+    else:
+        final = np.minimum(final / max_possible, 1.0)
+    return np.split(final, np.cumsum(set_sizes)[:-1]) if len(queries) else []
+
+
+def score_documents(query: str, documents: List[Dict], weights: Optional[Dict[str, float]] = None) -> np.ndarray:
+    return score_document_sets([query], [documents], weights)[0]
+
+
+def _select(documents: List[Dict], scores: np.ndarray, top_k: int, threshold: float) -> List[Dict]:
+    # Stable sort on the negated scores keeps ties in retrieval order, like list.sort(reverse=True)
+    order = np.argsort(-scores, kind="stable")
+    
+    reranked = []
+    for i in order:
+        if scores[i] < threshold:
+            break
+        doc_copy = documents[i].copy()
+        doc_copy['rerank_score'] = float(scores[i])
+        reranked.append(doc_copy)
+        if len(reranked) == top_k:
+            break
+    
+    return reranked
+
+
+async def rerank_documents(query: str, documents: List[Dict], top_k: int = TOP_K_RERANK,
+                           threshold: float = RERANK_THRESHOLD, weights: Optional[Dict[str, float]] = None) -> List[Dict]:
+    if not documents or top_k <= 0:
         return []
     
-    query_tokens = tokenize(query)
-    
-    doc_tokens_list = [tokenize(doc['text']) for doc in documents]
-    total_docs = len(documents)
-    avg_doc_len = sum(len(tokens) for tokens in doc_tokens_list) / total_docs if total_docs > 0 else 1
-    
-    doc_freq = {}
-    for tokens in doc_tokens_list:
-        for term in set(tokens):
-            doc_freq[term] = doc_freq.get(term, 0) + 1
-    
-    scored_docs = []
-    for i, doc in enumerate(documents):
-        doc_tokens = doc_tokens_list[i]
-        
-        bm25_score = compute_bm25(query_tokens, doc_tokens, avg_doc_len, doc_freq, total_docs)
-        title_score = compute_title_match(query_tokens, doc.get('title', ''))
-        phrase_score = compute_phrase_match(query, doc['text'])
-        coverage_score = compute_term_coverage(query_tokens, doc_tokens)
-        vector_score = doc.get('score', 0)
-        
-        final_score = (
-            W_BM25 * bm25_score +
-            W_TITLE_MATCH * title_score +
-            W_PHRASE_MATCH * phrase_score +
-            W_TERM_COVERAGE * coverage_score +
-            W_VECTOR_SCORE * vector_score
-        )
-        
-        max_possible = W_BM25 * 10 + W_TITLE_MATCH + W_PHRASE_MATCH + W_TERM_COVERAGE + W_VECTOR_SCORE
-        normalized_score = min(final_score / max_possible, 1.0) if max_possible > 0 else 0
-        
-        doc_copy = doc.copy()
-        doc_copy['rerank_score'] = normalized_score
-        scored_docs.append(doc_copy)
-    
-    scored_docs.sort(key=lambda x: x['rerank_score'], reverse=True)
-    
-    filtered_docs = [doc for doc in scored_docs if doc['rerank_score'] >= RERANK_THRESHOLD]
-    
-    return filtered_docs[:top_k]
-
-
-def check_sufficient_context(documents: List[Dict]) -> bool:
+    return _select(documents, score_documents(query, documents, weights), top_k, threshold)
+
+
+async def rerank_document_sets(queries: List[str], document_sets: List[List[Dict]], top_k: int = TOP_K_RERANK,
+                               threshold: float = RERANK_THRESHOLD, weights: Optional[Dict[str, float]] = None) -> List[List[Dict]]:
+    """rerank_documents for many queries at once, scoring all their candidates in one pass."""
+    if top_k <= 0:
+        return [[] for _ in queries]
+    scores = score_document_sets(queries, document_sets, weights)
+    return [_select(documents, set_scores, top_k, threshold) for documents, set_scores in zip(document_sets, scores)]
+
+
+def check_sufficient_context(documents: List[Dict], threshold: float = RERANK_THRESHOLD) -> bool:
     if not documents:
         return False
     top_score = documents[0].get('rerank_score', 0)
-    return top_score >= RERANK_THRESHOLD
+    return top_score >= threshold
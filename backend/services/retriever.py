@@ -0,0 +1,90 @@
+import asyncio
+import heapq
+import logging
+from typing import List, Dict, Optional, Tuple
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import TOP_K_RETRIEVE, TOP_K_LEXICAL, RRF_K, HYBRID_RETRIEVAL, NAMESPACE_QUERY_TIMEOUT_S
+from services.executors import run_blocking
+from services.lexical_index import lexical_index
+from services.logs import log_event
+from services.metrics import observe, NAMESPACE_QUERIES
+from services.vector_store import query_vectors, fetch_documents
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = RRF_K) -> List[str]:
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank + 1)
+    # sorted is stable, so ties keep the order in which ids were first seen
+    return sorted(scores, key=lambda doc_id: -scores[doc_id])
+
+
+async def retrieve(query: str, query_embedding: List[float], namespace: Optional[str] = None,
+                   top_k: int = TOP_K_RETRIEVE) -> List[Dict]:
+    if not HYBRID_RETRIEVAL:
+        return await observe("vector_query", query_vectors(query_embedding, namespace=namespace, top_k=top_k))
+    
+    vector_docs, lexical_hits = await asyncio.gather(
+        observe("vector_query", query_vectors(query_embedding, namespace=namespace, top_k=top_k)),
+        observe("lexical_query", run_blocking("lexical_index", lexical_index.search, namespace, query, TOP_K_LEXICAL))
+    )
+    
+    fused = reciprocal_rank_fusion([[doc["id"] for doc in vector_docs], [hit["id"] for hit in lexical_hits]])[:top_k]
+    documents = {doc["id"]: doc for doc in vector_docs}
+    
+    # Keyword hits the embedding missed have no text yet; their score is still the cosine
+    # similarity, so the reranker's vector-score feature means the same thing for every candidate
+    missing = [doc_id for doc_id in fused if doc_id not in documents]
+    if missing:
+        for doc in await observe("fetch", fetch_documents(missing, query_embedding, namespace=namespace)):
+            documents[doc["id"]] = doc
+    
+    return [documents[doc_id] for doc_id in fused if doc_id in documents]
+
+
+async def _retrieve_namespace(query: str, query_embedding: List[float], namespace: str, top_k: int,
+                              timeout_s: float) -> Tuple[List[Dict], str]:
+    try:
+        documents = await asyncio.wait_for(retrieve(query, query_embedding, namespace=namespace, top_k=top_k), timeout_s)
+    except asyncio.TimeoutError:
+        NAMESPACE_QUERIES.labels("timeout").inc()
+        log_event("query.namespace_failed", level=logging.WARNING, namespace=namespace, error="timeout")
+        return [], "timeout"
+    except Exception as e:
+        NAMESPACE_QUERIES.labels("error").inc()
+        log_event("query.namespace_failed", level=logging.WARNING, namespace=namespace, error=str(e))
+        return [], "error"
+    NAMESPACE_QUERIES.labels("ok").inc()
+    return documents, "ok"
+
+
+async def retrieve_across(query: str, query_embedding: List[float], namespaces: List[str], top_k: int = TOP_K_RETRIEVE,
+                          timeout_s: float = NAMESPACE_QUERY_TIMEOUT_S) -> Tuple[List[Dict], Dict]:
+    """Retrieve from every namespace concurrently and keep the top_k candidates by vector score.
+    
+    Each namespace gets `timeout_s`; one that errors or runs out of time is left out and reported
+    in the returned summary instead of failing the query. Only if none answer is it an error.
+    """
+    outcomes = await asyncio.gather(*(
+        _retrieve_namespace(query, query_embedding, namespace, top_k, timeout_s) for namespace in namespaces
+    ))
+    summary = {"searched": len(namespaces), "failed": [], "timed_out": []}
+    best: Dict[str, Dict] = {}
+    for namespace, (documents, outcome) in zip(namespaces, outcomes):
+        if outcome == "timeout":
+            summary["timed_out"].append(namespace)
+        elif outcome == "error":
+            summary["failed"].append(namespace)
+        for doc in documents:
+            # Chunk ids come from the content, so a chunk uploaded to two namespaces is kept once
+            if doc["id"] not in best or doc["score"] > best[doc["id"]]["score"]:
+                best[doc["id"]] = {**doc, "namespace": namespace}
+    
+    if namespaces and len(summary["failed"]) + len(summary["timed_out"]) == len(namespaces):
+        raise RuntimeError(f"None of the {len(namespaces)} namespaces answered")
+    # Cosine scores from one embedding model are comparable across namespaces; ties keep namespace order
+    return heapq.nlargest(top_k, best.values(), key=lambda doc: doc["score"]), summary
@@ -0,0 +1,36 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time. Callers that arrive while a call for their key
+    is in flight wait for it and get its result, or its exception, instead of starting another.
+    
+    The call runs as its own task, so a caller that disconnects doesn't cancel it for the rest.
+    Nothing is kept once it finishes; remembering results is the query cache's job.
+    """
+    
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+    
+    def in_flight(self) -> int:
+        return len(self._calls)
+    
+    async def run(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> Tuple[T, bool]:
+        """Returns the result and whether it was shared from a call another request started."""
+        task = self._calls.get(key)
+        shared = task is not None
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        return await asyncio.shield(task), shared
+    
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Every caller may have gone away; retrieving the exception keeps asyncio from logging it
+        if not task.cancelled():
+            task.exception()
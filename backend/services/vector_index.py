@@ -0,0 +1,117 @@
+import threading
+from typing import List, Dict, Optional
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import (
+    VECTOR_BACKEND, PINECONE_API_KEY, PINECONE_HOST, LOCAL_INDEX_DIR, LOCAL_INDEX_QUANTIZE,
+    LOCAL_INDEX_ANN_MIN_VECTORS, LOCAL_INDEX_ANN_NPROBE
+)
+
+
+PINECONE_FETCH_BATCH = 100
+PINECONE_DELETE_BATCH = 1000
+
+
+class VectorIndex:
+    """Synchronous vector index interface. vector_store runs these calls on the
+    executor named by `dependency`, so implementations may block."""
+    
+    dependency = ""
+    
+    def upsert(self, vectors: List[Dict], namespace: str):
+        raise NotImplementedError
+    
+    def query(self, vector: List[float], top_k: int, namespace: str, include_metadata: bool = True) -> List[Dict]:
+        raise NotImplementedError
+    
+    def fetch(self, ids: List[str], namespace: str) -> Dict[str, Dict]:
+        raise NotImplementedError
+    
+    def delete(self, ids: List[str], namespace: str):
+        raise NotImplementedError
+    
+    def delete_namespace(self, namespace: str):
+        raise NotImplementedError
+    
+    def describe_stats(self) -> Dict:
+        raise NotImplementedError
+
+
+class PineconeIndex(VectorIndex):
+    dependency = "pinecone"
+    
+    def __init__(self, api_key: str, host: str):
+        from pinecone import Pinecone
+        self.index = Pinecone(api_key=api_key).Index(host=host)
+    
+    def upsert(self, vectors: List[Dict], namespace: str):
+        self.index.upsert(vectors=vectors, namespace=namespace)
+    
+    def query(self, vector: List[float], top_k: int, namespace: str, include_metadata: bool = True) -> List[Dict]:
+        results = self.index.query(
+            vector=vector,
+            top_k=top_k,
+            include_metadata=include_metadata,
+            namespace=namespace
+        )
+        return [
+            {"id": match.id, "score": match.score, "metadata": match.metadata or {}}
+            for match in results.matches
+        ]
+    
+    def fetch(self, ids: List[str], namespace: str) -> Dict[str, Dict]:
+        found = {}
+        # Fetch ids travel in the query string, so keep each request short
+        for i in range(0, len(ids), PINECONE_FETCH_BATCH):
+            results = self.index.fetch(ids=ids[i:i + PINECONE_FETCH_BATCH], namespace=namespace)
+            for vector_id, vector in results.vectors.items():
+                found[vector_id] = {"values": list(vector.values), "metadata": vector.metadata or {}}
+        return found
+    
+    def delete(self, ids: List[str], namespace: str):
+        for i in range(0, len(ids), PINECONE_DELETE_BATCH):
+            self.index.delete(ids=ids[i:i + PINECONE_DELETE_BATCH], namespace=namespace)
+    
+    def delete_namespace(self, namespace: str):
+        self.index.delete(delete_all=True, namespace=namespace)
+    
+    def describe_stats(self) -> Dict:
+        stats = self.index.describe_index_stats()
+        return {
+            "total_vectors": stats.total_vector_count,
+            "namespaces": list(stats.namespaces.keys()) if stats.namespaces else []
+        }
+
+
+_index: Optional[VectorIndex] = None
+_lock = threading.Lock()
+
+
+def create_index(backend: str = VECTOR_BACKEND) -> VectorIndex:
+    if backend == "pinecone":
+        return PineconeIndex(PINECONE_API_KEY, PINECONE_HOST)
+    if backend == "local":
+        from services.local_index import LocalVectorIndex
+        return LocalVectorIndex(
+            LOCAL_INDEX_DIR,
+            quantize=LOCAL_INDEX_QUANTIZE,
+            ann_min_vectors=LOCAL_INDEX_ANN_MIN_VECTORS,
+            nprobe=LOCAL_INDEX_ANN_NPROBE
+        )
+    raise ValueError(f"Unknown VECTOR_BACKEND: {backend}")
+
+
+def get_index() -> VectorIndex:
+    global _index
+    with _lock:
+        if _index is None:
+            _index = create_index()
+        return _index
+
+
+def set_index(index: VectorIndex):
+    global _index
+    with _lock:
+        _index = index
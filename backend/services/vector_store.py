@@ -1,70 +1,205 @@
-from pinecone import Pinecone
-from typing import List, Dict, Optional
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from typing import List, Dict, Optional, Tuple
 import uuid
 import sys
 import os
 
+import numpy as np
+
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from config import PINECONE_API_KEY, PINECONE_HOST
+from services.query_cache import query_cache
+from services.executors import run_blocking
+from services.vector_index import get_index
+from services.lexical_index import lexical_index
+from services.manifest import chunk_manifest
+from services.chunk_store import chunk_store
+from services.logs import log_event
+from services.reranker import build_rerank_features
+from config import HYBRID_RETRIEVAL, NAMESPACE_LIST_TTL_S, SLIM_VECTOR_METADATA, VECTOR_METADATA_MAX_BYTES
+
+_namespace_list: Optional[Tuple[float, List[str]]] = None
+
+
+def new_namespace() -> str:
+    return f"doc_{uuid.uuid4().hex[:8]}"
 
-pc = Pinecone(api_key=PINECONE_API_KEY)
-index = pc.Index(host=PINECONE_HOST)
+
+def chunk_id(chunk: Dict) -> str:
+    # Derived from the content, so re-indexing an unchanged chunk overwrites it instead of adding a copy
+    key = f"{chunk.get('source', 'unknown')}\0{chunk['text']}"
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
 
 
 async def upsert_vectors(embeddings: List[List[float]], chunks: List[Dict], namespace: Optional[str] = None, batch_size: int = 100) -> Dict:
     if namespace is None:
-        namespace = f"doc_{uuid.uuid4().hex[:8]}"
+        namespace = new_namespace()
     
     vectors = []
+    stored = {}
     for i, (embedding, chunk) in enumerate(zip(embeddings, chunks)):
-        # Use unique ID per chunk to prevent overwrites when adding multiple files
-        chunk_id = f"{namespace}_{uuid.uuid4().hex[:8]}_{i}"
+        metadata = {
+            "text": chunk["text"],
+            "source": chunk.get("source", "unknown"),
+            "title": chunk.get("title", "Untitled"),
+            "chunk_index": chunk.get("chunk_index", i)
+        }
+        if "term_freqs" in chunk:
+            metadata["term_freqs"] = chunk["term_freqs"]
+            metadata["doc_len"] = chunk["doc_len"]
+        vector_id = chunk.get("id") or chunk_id(chunk)
+        stored[vector_id] = metadata
         vectors.append({
-            "id": chunk_id,
+            "id": vector_id,
             "values": embedding,
-            "metadata": {
-                "text": chunk["text"],
-                "source": chunk.get("source", "unknown"),
-                "title": chunk.get("title", "Untitled"),
-                "chunk_index": chunk.get("chunk_index", i)
-            }
+            "metadata": _index_metadata(metadata)
         })
     
-    for i in range(0, len(vectors), batch_size):
-        batch = vectors[i:i + batch_size]
-        index.upsert(vectors=batch, namespace=namespace)
+    # Stored before the vectors are searchable, so a query never finds a chunk without its text
+    await run_blocking("chunk_store", chunk_store.put_many, namespace, stored)
+    index = get_index()
+    await asyncio.gather(*(
+        run_blocking(index.dependency, index.upsert, vectors[i:i + batch_size], namespace)
+        for i in range(0, len(vectors), batch_size)
+    ))
+    
+    if HYBRID_RETRIEVAL:
+        lexical_docs = []
+        for vector, chunk in zip(vectors, chunks):
+            features = chunk if "term_freqs" in chunk else build_rerank_features(chunk["text"])
+            lexical_docs.append({"id": vector["id"], "term_freqs": features["term_freqs"], "doc_len": features["doc_len"]})
+        await run_blocking("lexical_index", lexical_index.add, namespace, lexical_docs)
+    
+    query_cache.invalidate_namespace(namespace)
+    _forget_namespace_list()
     
     return {"namespace": namespace, "vectors_upserted": len(vectors)}
 
 
+def _index_metadata(metadata: Dict) -> Dict:
+    """What the vector index keeps for a chunk: everything, unless the index is slim or the
+    chunk is too big for it, in which case the text and features stay in the chunk store only."""
+    slim = {key: metadata[key] for key in ("source", "title", "chunk_index")}
+    if SLIM_VECTOR_METADATA or len(json.dumps(metadata).encode("utf-8")) > VECTOR_METADATA_MAX_BYTES:
+        return slim
+    return metadata
+
+
+async def _load_documents(scored: List[Tuple[str, float]], namespace: str, fetched: Optional[Dict[str, Dict]] = None) -> List[Dict]:
+    """Attach text and features to (id, score) pairs in one chunk store read. Chunks the store
+    lacks, indexed by another replica or before it existed, are read from the index metadata and
+    added to it."""
+    ids = [vector_id for vector_id, _ in scored]
+    chunks = await run_blocking("chunk_store", chunk_store.get_many, namespace, ids)
+    missing = [vector_id for vector_id in ids if vector_id not in chunks]
+    if missing:
+        if fetched is None:
+            index = get_index()
+            fetched = await run_blocking(index.dependency, index.fetch, missing, namespace)
+        recovered = {
+            vector_id: fetched[vector_id]["metadata"]
+            for vector_id in missing if vector_id in fetched and "text" in fetched[vector_id]["metadata"]
+        }
+        if recovered:
+            await run_blocking("chunk_store", chunk_store.put_many, namespace, recovered)
+            chunks.update(recovered)
+        if len(recovered) < len(missing):
+            log_event("vector_store.chunks_missing", level=logging.WARNING, namespace=namespace, missing=len(missing) - len(recovered))
+    return [_to_document(vector_id, score, chunks[vector_id]) for vector_id, score in scored if vector_id in chunks]
+
+
 async def query_vectors(query_embedding: List[float], namespace: str = None, top_k: int = 10) -> List[Dict]:
-    results = index.query(
-        vector=query_embedding,
-        top_k=top_k,
-        include_metadata=True,
-        namespace=namespace
+    index = get_index()
+    # Ids and scores only; the candidates' text comes from the chunk store
+    matches = await run_blocking(
+        index.dependency,
+        index.query,
+        query_embedding,
+        top_k,
+        namespace or "",
+        include_metadata=False
     )
     
-    documents = []
-    for match in results.matches:
-        documents.append({
-            "id": match.id,
-            "score": match.score,
-            "text": match.metadata.get("text", ""),
-            "source": match.metadata.get("source", "unknown"),
-            "title": match.metadata.get("title", "Untitled")
-        })
+    return await _load_documents([(match["id"], match["score"]) for match in matches], namespace or "")
+
+
+async def fetch_documents(ids: List[str], query_embedding: List[float], namespace: str = None) -> List[Dict]:
+    """Fetch vectors by id and score them against the query like query_vectors would."""
+    index = get_index()
+    found = await run_blocking(index.dependency, index.fetch, ids, namespace or "")
     
-    return documents
+    query = np.asarray(query_embedding, dtype=np.float32)
+    query_norm = np.linalg.norm(query)
+    scored = []
+    for vector_id in ids:
+        if vector_id not in found:
+            continue
+        values = np.asarray(found[vector_id]["values"], dtype=np.float32)
+        norm = np.linalg.norm(values) * query_norm
+        scored.append((vector_id, float(values @ query / norm) if norm > 0 else 0.0))
+    return await _load_documents(scored, namespace or "", fetched=found)
 
 
-async def get_index_stats() -> Dict:
-    stats = index.describe_index_stats()
-    return {
-        "total_vectors": stats.total_vector_count,
-        "namespaces": list(stats.namespaces.keys()) if stats.namespaces else []
+def _to_document(vector_id: str, score: float, metadata: Dict) -> Dict:
+    doc = {
+        "id": vector_id,
+        "score": score,
+        "text": metadata.get("text", ""),
+        "source": metadata.get("source", "unknown"),
+        "title": metadata.get("title", "Untitled")
     }
+    # Lets context packing find neighbouring chunks of the same document
+    if "chunk_index" in metadata:
+        doc["chunk_index"] = int(metadata["chunk_index"])
+    # Rerank features are only present on vectors indexed after they were added
+    if "term_freqs" in metadata:
+        doc["term_freqs"] = metadata["term_freqs"]
+        doc["doc_len"] = metadata.get("doc_len", 0)
+    return doc
+
+
+async def warm_up():
+    """Build the index client and make one call, so its connection is open before the first query."""
+    index = await run_blocking("ingest", get_index)
+    await run_blocking(index.dependency, index.describe_stats)
+
+
+async def get_index_stats() -> Dict:
+    index = get_index()
+    return await run_blocking(index.dependency, index.describe_stats)
+
+
+async def delete_vectors(ids: List[str], namespace: str):
+    index = get_index()
+    await run_blocking(index.dependency, index.delete, ids, namespace)
+    await run_blocking("lexical_index", lexical_index.delete, namespace, ids)
+    await run_blocking("chunk_store", chunk_store.delete, namespace, ids)
+    query_cache.invalidate_namespace(namespace)
 
 
 async def delete_namespace(namespace: str):
-    index.delete(delete_all=True, namespace=namespace)
+    index = get_index()
+    await run_blocking(index.dependency, index.delete_namespace, namespace)
+    await run_blocking("lexical_index", lexical_index.delete_namespace, namespace)
+    await run_blocking("manifest", chunk_manifest.delete_namespace, namespace)
+    await run_blocking("chunk_store", chunk_store.delete_namespace, namespace)
+    query_cache.invalidate_namespace(namespace)
+    _forget_namespace_list()
+
+
+async def list_namespaces(prefix: str = "") -> List[str]:
+    """Namespaces starting with `prefix`, from an index listing reused for NAMESPACE_LIST_TTL_S."""
+    global _namespace_list
+    if _namespace_list is None or _namespace_list[0] < time.time():
+        stats = await get_index_stats()
+        _namespace_list = (time.time() + NAMESPACE_LIST_TTL_S, stats["namespaces"])
+    return [namespace for namespace in _namespace_list[1] if namespace.startswith(prefix)]
+
+
+def _forget_namespace_list():
+    global _namespace_list
+    _namespace_list = None
+
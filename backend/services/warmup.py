@@ -0,0 +1,111 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Optional
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import WARMUP_RETRY_S, WARMUP_RETRY_MAX_S
+from services import embedder, llm, manifest, pdf_extractor, vector_store
+from services.chunker import count_tokens
+from services.executors import run_blocking, start_executors
+from services.logs import log_event
+from services.metrics import WARMUP_SECONDS, READY
+
+
+async def _tokenizer():
+    await run_blocking("ingest", count_tokens, "warm-up")
+
+
+async def _gemini():
+    await run_blocking("gemini_generate", llm.get_model)
+    await run_blocking("gemini_generate", llm.get_light_model)
+    await embedder.warm_up()
+
+
+async def _local_stores():
+    await run_blocking("embedding_cache", embedder.embedding_cache.connect)
+    await run_blocking("chunk_store", vector_store.chunk_store.connect)
+    await run_blocking("manifest", manifest.chunk_manifest.connect)
+
+
+async def _pdf():
+    await run_blocking("ingest", pdf_extractor.warm_up)
+
+
+STEPS: Dict[str, Callable[[], Awaitable[None]]] = {
+    "tokenizer": _tokenizer,
+    "gemini": _gemini,
+    "vector_index": vector_store.warm_up,
+    "local_stores": _local_stores,
+    "pdf_extractor": _pdf,
+}
+
+_steps: Dict[str, Dict] = {}
+_started_at: Optional[float] = None
+_ready_at: Optional[float] = None
+_task: Optional[asyncio.Task] = None
+
+
+def is_ready() -> bool:
+    return _ready_at is not None
+
+
+def readiness() -> Dict:
+    return {
+        "ready": is_ready(),
+        "warmup_ms": int((_ready_at - _started_at) * 1000) if _ready_at is not None else None,
+        "steps": {name: dict(step) for name, step in _steps.items()}
+    }
+
+
+async def _run_step(name: str):
+    start = time.perf_counter()
+    try:
+        await STEPS[name]()
+    except Exception as e:
+        _steps[name] = {"status": "failed", "ms": int((time.perf_counter() - start) * 1000), "error": str(e)}
+        log_event("warmup.step_failed", level=logging.WARNING, step=name, error=str(e))
+        return
+    elapsed = time.perf_counter() - start
+    WARMUP_SECONDS.labels(name).set(elapsed)
+    _steps[name] = {"status": "ok", "ms": int(elapsed * 1000), "error": None}
+
+
+async def warm_up():
+    """Run every step concurrently, then retry the failed ones, backing off from WARMUP_RETRY_S
+    to WARMUP_RETRY_MAX_S, until all pass."""
+    global _started_at, _ready_at
+    _started_at, _ready_at = time.time(), None
+    _steps.clear()
+    _steps.update({name: {"status": "pending", "ms": None, "error": None} for name in STEPS})
+    start_executors()
+    pending = list(STEPS)
+    delay = WARMUP_RETRY_S
+    while True:
+        await asyncio.gather(*(_run_step(name) for name in pending))
+        pending = [name for name in STEPS if _steps[name]["status"] != "ok"]
+        if not pending:
+            break
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, WARMUP_RETRY_MAX_S)
+    _ready_at = time.time()
+    READY.set(1)
+    log_event("warmup.finished", level=logging.INFO, sample_rate=1.0, warmup_ms=int((_ready_at - _started_at) * 1000),
+              steps={name: step["ms"] for name, step in _steps.items()})
+
+
+def start_warm_up():
+    global _task
+    _task = asyncio.ensure_future(warm_up())
+
+
+async def stop_warm_up():
+    global _task, _ready_at
+    if _task is not None:
+        _task.cancel()
+        await asyncio.gather(_task, return_exceptions=True)
+        _task = None
+    _ready_at = None
+    READY.set(0)
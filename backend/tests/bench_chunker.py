@@ -0,0 +1,46 @@
+"""
+Chunker benchmark: the original chunker vs the batched single-pass chunker on multi-MB documents.
+
+    python tests/bench_chunker.py [--sizes-mb 1 4]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from test_chunker import make_document, reference_chunk_text
+from services import chunker
+from services.chunker import chunk_text
+
+
+def document_of_size(size_mb: float) -> str:
+    parts, total, seed = [], 0, 0
+    while total < size_mb * 1024 * 1024:
+        part = make_document(200, seed)
+        parts.append(part)
+        total += len(part.encode("utf-8"))
+        seed += 1
+    return "\n\n".join(parts)
+
+
+def timed(fn, text):
+    # Start each run cold so a larger document doesn't reuse counts from a smaller one
+    chunker._count_short.cache_clear()
+    start = time.perf_counter()
+    result = fn(text)
+    return time.perf_counter() - start, result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes-mb", type=float, nargs="+", default=[1, 4])
+    args = parser.parse_args()
+
+    print(f"{'size':>8} {'chunks':>7} {'original':>10} {'batched':>10} {'speedup':>8}")
+    for size_mb in args.sizes_mb:
+        text = document_of_size(size_mb)
+        original_s, expected = timed(reference_chunk_text, text)
+        batched_s, actual = timed(chunk_text, text)
+        assert actual == expected, "batched chunker output differs from the original"
+        print(f"{size_mb:>6.1f}MB {len(actual):>7} {original_s:>9.2f}s {batched_s:>9.2f}s {original_s / batched_s:>7.1f}x")
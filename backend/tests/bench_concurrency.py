@@ -0,0 +1,178 @@
+"""
+Load-test benchmark: concurrent /api/query throughput on a single worker.
+Blocking fakes stand in for Gemini and Pinecone, so no network or API keys are needed.
+
+"before" calls the SDKs inline on the event loop (the old behaviour);
+"after" routes them through the per-dependency executors.
+
+--overload sends a burst far beyond the query pool at once, with admission control on and
+effectively off, and reports the latency of requests that were answered and how many were shed.
+
+    python tests/bench_concurrency.py --requests 64 --concurrency 16
+    python tests/bench_concurrency.py --overload 400
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+# Everything the app persists goes to a scratch directory, read when config is imported
+DATA_DIR = tempfile.mkdtemp(prefix="askdocs-bench-")
+os.environ["DATA_DIR"] = DATA_DIR
+os.environ["EMBED_CACHE_PATH"] = ""
+for name in ("LOCAL_INDEX_DIR", "LEXICAL_INDEX_DIR", "JOBS_DB_PATH", "UPLOADS_DIR", "MANIFEST_DB_PATH", "CHUNK_STORE_DB_PATH"):
+    os.environ.pop(name, None)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import httpx
+
+import main
+from services import admission, embedder, llm, vector_store
+from services.embedding_cache import EmbeddingCache
+from services.vector_index import VectorIndex, set_index
+
+EMBED_LATENCY_S = 0.05
+QUERY_LATENCY_S = 0.03
+GENERATE_LATENCY_S = 0.2
+
+
+def fake_embed_content(model, content, task_type=None):
+    time.sleep(EMBED_LATENCY_S)
+    return {"embedding": [0.1] * 768}
+
+
+class FakeIndex(VectorIndex):
+    dependency = "pinecone"
+
+    def query(self, vector, top_k, namespace, include_metadata=True):
+        time.sleep(QUERY_LATENCY_S)
+        return [
+            {"id": f"chunk_{i}", "score": 0.9 - i * 0.05, "metadata": self._metadata(i) if include_metadata else {}}
+            for i in range(top_k)
+        ]
+
+    def fetch(self, ids, namespace):
+        # Queries read chunk text from the chunk store, which recovers it from here on a miss
+        return {vector_id: {"values": [0.1] * 768, "metadata": self._metadata(int(vector_id.split("_")[1]))} for vector_id in ids}
+
+    def _metadata(self, i):
+        return {
+            "text": f"Machine learning is a subset of artificial intelligence. Fact {i}.",
+            "source": "bench.md",
+            "title": "Benchmark"
+        }
+
+
+class FakeModel:
+    def generate_content(self, prompt, stream=False, generation_config=None):
+        time.sleep(GENERATE_LATENCY_S)
+        return SimpleNamespace(text="Machine learning is a subset of AI [1].")
+
+
+async def run_inline(dependency, fn, *args, **kwargs):
+    return fn(*args, **kwargs)
+
+
+def install_fakes():
+    embedder.genai.embed_content = fake_embed_content
+    set_index(FakeIndex())
+    llm.model = FakeModel()
+
+
+async def drive(num_requests: int, concurrency: int, label: str) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=main.app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        async def one(i: int):
+            async with semaphore:
+                # Unique queries and namespaces so neither cache short-circuits the pipeline
+                response = await client.post("/api/query", json={"query": f"what is machine learning {i}", "namespace": f"{label}_{i}"})
+                response.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(num_requests)))
+        return time.perf_counter() - start
+
+
+def measure(num_requests: int, concurrency: int, inline: bool) -> dict:
+    embedder.embedding_cache = EmbeddingCache(max_entries=1)
+    originals = (embedder.run_blocking, llm.run_blocking, vector_store.run_blocking)
+    if inline:
+        embedder.run_blocking = llm.run_blocking = vector_store.run_blocking = run_inline
+    try:
+        elapsed = asyncio.run(drive(num_requests, concurrency, "inline" if inline else "executor"))
+    finally:
+        embedder.run_blocking, llm.run_blocking, vector_store.run_blocking = originals
+    return {"elapsed_s": elapsed, "throughput_rps": num_requests / elapsed}
+
+
+async def burst(num_requests: int, label: str) -> dict:
+    transport = httpx.ASGITransport(app=main.app)
+    latencies = []
+    shed = 0
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=300) as client:
+        async def one(i: int):
+            nonlocal shed
+            start = time.perf_counter()
+            response = await client.post("/api/query", json={"query": f"what is machine learning {i}", "namespace": f"{label}_{i}"})
+            if response.status_code == 503:
+                shed += 1
+                return
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+
+        await asyncio.gather(*(one(i) for i in range(num_requests)))
+
+    latencies.sort()
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    return {"admitted": len(latencies), "shed": shed, "p50_ms": latencies[len(latencies) // 2] * 1000, "p99_ms": p99 * 1000}
+
+
+def measure_overload(num_requests: int, limited: bool) -> dict:
+    embedder.embedding_cache = EmbeddingCache(max_entries=1)
+    pools = dict(admission.ADMISSION_POOLS)
+    if not limited:
+        pools["query"] = {"concurrency": num_requests, "max_queue": num_requests, "max_wait_s": 300.0}
+    original = admission.ADMISSION_POOLS
+    admission.ADMISSION_POOLS = pools
+    # Rebuild the middleware stack so the admission middleware picks up these pools
+    main.app.middleware_stack = None
+    try:
+        return asyncio.run(burst(num_requests, "limited" if limited else "unlimited"))
+    finally:
+        admission.ADMISSION_POOLS = original
+        main.app.middleware_stack = None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--overload", type=int, default=0, help="Burst size for the admission control comparison")
+    args = parser.parse_args()
+
+    install_fakes()
+    try:
+        if args.overload:
+            print(f"Burst of {args.overload} queries, query pool: {admission.ADMISSION_POOLS['query']}")
+            for label, limited in (("No admission control", False), ("Admission control", True)):
+                result = measure_overload(args.overload, limited)
+                print(f"{label:22s} admitted {result['admitted']:4d}  shed {result['shed']:4d}  "
+                      f"p50 {result['p50_ms']:7.0f}ms  p99 {result['p99_ms']:7.0f}ms")
+        else:
+            before = measure(args.requests, args.concurrency, inline=True)
+            after = measure(args.requests, args.concurrency, inline=False)
+
+            serial_latency_ms = (EMBED_LATENCY_S + QUERY_LATENCY_S + GENERATE_LATENCY_S) * 1000
+            print(f"Requests: {args.requests}, concurrency: {args.concurrency}, pipeline latency: {serial_latency_ms:.0f}ms")
+            print(f"Before (blocking on event loop): {before['throughput_rps']:6.1f} req/s  ({before['elapsed_s']:.2f}s)")
+            print(f"After  (dependency executors):   {after['throughput_rps']:6.1f} req/s  ({after['elapsed_s']:.2f}s)")
+            print(f"Speedup: {after['throughput_rps'] / before['throughput_rps']:.1f}x")
+    finally:
+        shutil.rmtree(DATA_DIR, ignore_errors=True)
@@ -0,0 +1,411 @@
+"""
+End-to-end benchmark: uploads and queries driven through the FastAPI app at a fixed concurrency.
+Deterministic local stand-ins replace Gemini embeddings, Gemini generation and Pinecone, each with
+a configurable latency, so runs need no network or API keys and are comparable between commits.
+
+Each stage (upload, query, query_stream) reports p50/p95/p99 latency, throughput, peak RSS while
+it ran, and the mean time per pipeline stage from the Prometheus histograms. Results are written
+as JSON; pass an earlier run as --baseline to compare against it.
+
+    python tests/bench_e2e.py --documents 20 --queries 200 --concurrency 8 --output before.json
+    python tests/bench_e2e.py --documents 20 --queries 200 --concurrency 8 --baseline before.json
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+from typing import List, Dict, Optional, Callable, Awaitable
+
+# Everything the app persists goes to a scratch directory, read when config is imported
+DATA_DIR = tempfile.mkdtemp(prefix="askdocs-bench-")
+os.environ["DATA_DIR"] = DATA_DIR
+os.environ["EMBED_CACHE_PATH"] = ""
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+for name in ("LOCAL_INDEX_DIR", "LEXICAL_INDEX_DIR", "JOBS_DB_PATH", "UPLOADS_DIR", "MANIFEST_DB_PATH", "CHUNK_STORE_DB_PATH"):
+    os.environ.pop(name, None)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import httpx
+import numpy as np
+from prometheus_client import REGISTRY
+
+import main
+from services import embedder, llm
+from services.vector_index import VectorIndex, set_index
+from test_goldset import TEST_DOCUMENT
+
+EMBEDDING_DIMENSION = 768
+NAMESPACE = "bench"
+VOCABULARY = sorted(set(re.findall(r"[a-z]+", TEST_DOCUMENT.lower())))
+PIPELINE_METRICS = {"query": "rag_query_stage_seconds", "ingest": "rag_ingest_stage_seconds"}
+
+
+def hashed_embedding(text: str) -> List[float]:
+    # Bag of words hashed into buckets: deterministic, and texts sharing words score higher
+    vector = np.zeros(EMBEDDING_DIMENSION)
+    for word in re.findall(r"\w+", text.lower()):
+        vector[int.from_bytes(hashlib.md5(word.encode()).digest()[:4], "little") % EMBEDDING_DIMENSION] += 1.0
+    norm = np.linalg.norm(vector)
+    return (vector / norm if norm else vector).tolist()
+
+
+class FakeEmbedder:
+    def __init__(self, latency_s: float):
+        self.latency_s = latency_s
+
+    def __call__(self, content, task_type: str):
+        time.sleep(self.latency_s)
+        if isinstance(content, list):
+            return [hashed_embedding(text) for text in content]
+        return hashed_embedding(content)
+
+
+class FakeIndex(VectorIndex):
+    """Exact in-memory index that sleeps like a network round trip on every call."""
+
+    dependency = "pinecone"
+
+    def __init__(self, latency_s: float):
+        self.latency_s = latency_s
+        self._namespaces: Dict[str, Dict[str, Dict]] = {}
+        self._lock = threading.Lock()
+
+    def upsert(self, vectors: List[Dict], namespace: str):
+        time.sleep(self.latency_s)
+        with self._lock:
+            stored = self._namespaces.setdefault(namespace, {})
+            for vector in vectors:
+                stored[vector["id"]] = {"values": np.asarray(vector["values"]), "metadata": vector["metadata"]}
+
+    def query(self, vector: List[float], top_k: int, namespace: str, include_metadata: bool = True) -> List[Dict]:
+        time.sleep(self.latency_s)
+        with self._lock:
+            items = list(self._namespaces.get(namespace, {}).items())
+        if not items:
+            return []
+        scores = np.stack([item["values"] for _, item in items]) @ np.asarray(vector)
+        top = np.argsort(-scores, kind="stable")[:top_k]
+        return [
+            {"id": items[i][0], "score": float(scores[i]), "metadata": items[i][1]["metadata"] if include_metadata else {}}
+            for i in top
+        ]
+
+    def fetch(self, ids: List[str], namespace: str) -> Dict[str, Dict]:
+        time.sleep(self.latency_s)
+        with self._lock:
+            stored = self._namespaces.get(namespace, {})
+            return {
+                vector_id: {"values": stored[vector_id]["values"].tolist(), "metadata": stored[vector_id]["metadata"]}
+                for vector_id in ids if vector_id in stored
+            }
+
+    def delete(self, ids: List[str], namespace: str):
+        time.sleep(self.latency_s)
+        with self._lock:
+            stored = self._namespaces.get(namespace, {})
+            for vector_id in ids:
+                stored.pop(vector_id, None)
+
+    def delete_namespace(self, namespace: str):
+        time.sleep(self.latency_s)
+        with self._lock:
+            self._namespaces.pop(namespace, None)
+
+    def describe_stats(self) -> Dict:
+        with self._lock:
+            namespaces = {name: {"vector_count": len(stored)} for name, stored in self._namespaces.items()}
+        return {"total_vectors": sum(ns["vector_count"] for ns in namespaces.values()), "namespaces": namespaces}
+
+
+class FakeModel:
+    """Answers after `latency_s`; streamed answers send their first token after `first_token_s`
+    and spread the rest evenly over the remaining time."""
+
+    def __init__(self, latency_s: float, first_token_s: float, answer_words: int = 40):
+        self.latency_s = latency_s
+        self.first_token_s = min(first_token_s, latency_s)
+        self.answer_words = answer_words
+
+    def _answer(self, prompt: str) -> List[str]:
+        question = prompt.rsplit("QUESTION:", 1)[-1].split()
+        return [(question[i % len(question)] if question else "answer") + " " for i in range(self.answer_words - 1)] + ["[1]."]
+
+    def generate_content(self, prompt: str, stream: bool = False, generation_config: Optional[Dict] = None):
+        if not stream:
+            time.sleep(self.latency_s)
+            return SimpleNamespace(text="".join(self._answer(prompt)))
+        return self._stream(self._answer(prompt))
+
+    def _stream(self, words: List[str]):
+        time.sleep(self.first_token_s)
+        delay = (self.latency_s - self.first_token_s) / max(len(words) - 1, 1)
+        for i, word in enumerate(words):
+            if i:
+                time.sleep(delay)
+            yield SimpleNamespace(text=word)
+
+
+def install_fakes(args):
+    embedder._embed_content = FakeEmbedder(args.embed_latency_ms / 1000)
+    set_index(FakeIndex(args.vector_latency_ms / 1000))
+    llm.model = FakeModel(args.llm_latency_ms / 1000, args.llm_first_token_ms / 1000)
+
+
+def make_documents(count: int, size_kb: int, rng: random.Random) -> List[str]:
+    documents = []
+    for _ in range(count):
+        paragraphs, size = [], 0
+        while size < size_kb * 1024:
+            sentences = [" ".join(rng.choices(VOCABULARY, k=rng.randint(8, 20))).capitalize() + "." for _ in range(rng.randint(2, 6))]
+            paragraphs.append(" ".join(sentences))
+            size += len(paragraphs[-1]) + 2
+        documents.append("\n\n".join(paragraphs))
+    return documents
+
+
+def make_queries(count: int, rng: random.Random) -> List[str]:
+    # Drawn at random so the exact and semantic query caches rarely short-circuit the pipeline
+    return [f"What about {' '.join(rng.choices(VOCABULARY, k=rng.randint(4, 8)))}?" for _ in range(count)]
+
+
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # ru_maxrss is the peak for the whole process (KiB on Linux) rather than the current size
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class PeakRss:
+    """Samples this process's resident set size on a thread while a stage runs."""
+
+    def __init__(self, interval_s: float = 0.01):
+        self.interval_s = interval_s
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self):
+        while True:
+            self.peak = max(self.peak, rss_bytes())
+            if self._stop.wait(self.interval_s):
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, rss_bytes())
+
+
+def histogram_totals(metric: str) -> Dict[str, List[float]]:
+    totals: Dict[str, List[float]] = {}
+    for family in REGISTRY.collect():
+        if family.name != metric:
+            continue
+        for sample in family.samples:
+            stage = sample.labels.get("stage")
+            if sample.name == metric + "_sum":
+                totals.setdefault(stage, [0.0, 0.0])[0] = sample.value
+            elif sample.name == metric + "_count":
+                totals.setdefault(stage, [0.0, 0.0])[1] = sample.value
+    return totals
+
+
+def pipeline_snapshot() -> Dict[str, Dict[str, List[float]]]:
+    return {kind: histogram_totals(metric) for kind, metric in PIPELINE_METRICS.items()}
+
+
+def pipeline_delta(before: Dict, after: Dict) -> Dict[str, Dict]:
+    stages = {}
+    for kind, totals in after.items():
+        for stage, (total, count) in totals.items():
+            total_before, count_before = before[kind].get(stage, [0.0, 0.0])
+            if count > count_before:
+                stages[f"{kind}.{stage}"] = {
+                    "count": int(count - count_before),
+                    "mean_ms": round((total - total_before) / (count - count_before) * 1000, 2)
+                }
+    return stages
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    p50, p95, p99 = np.percentile(np.asarray(values) * 1000, [50, 95, 99]) if values else (0.0, 0.0, 0.0)
+    return {"p50_ms": round(float(p50), 2), "p95_ms": round(float(p95), 2), "p99_ms": round(float(p99), 2)}
+
+
+async def run_stage(calls: List[Callable[[], Awaitable[Optional[float]]]], concurrency: int) -> Dict:
+    """Run `calls` with at most `concurrency` in flight. A call may return its time to first byte."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, first_bytes = [], []
+
+    async def one(call):
+        async with semaphore:
+            start = time.perf_counter()
+            first_byte = await call()
+            latencies.append(time.perf_counter() - start)
+            if first_byte is not None:
+                first_bytes.append(first_byte)
+
+    before = pipeline_snapshot()
+    with PeakRss() as rss:
+        start = time.perf_counter()
+        await asyncio.gather(*(one(call) for call in calls))
+        elapsed = time.perf_counter() - start
+
+    result = {
+        "requests": len(calls),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(calls) / elapsed, 2) if elapsed else 0.0,
+        "latency": percentiles(latencies),
+        "peak_rss_mb": round(rss.peak / (1024 * 1024), 1),
+        "pipeline": pipeline_delta(before, pipeline_snapshot())
+    }
+    if first_bytes:
+        result["first_byte"] = percentiles(first_bytes)
+    return result
+
+
+async def drive(args) -> Dict:
+    rng = random.Random(args.seed)
+    documents = make_documents(args.documents, args.document_kb, rng)
+    queries = make_queries(args.queries, rng)
+    # A fresh draw, so the stream stage doesn't repeat the queries the query cache just stored
+    stream_queries = make_queries(args.queries, rng)
+    cache_hits = 0
+
+    # ASGITransport doesn't send lifespan events, so the job workers are started here
+    async with main.app.router.lifespan_context(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=300) as client:
+            def upload(i: int, text: str):
+                async def call():
+                    response = await client.post(
+                        "/api/upload",
+                        files={"file": (f"doc_{i}.md", text.encode(), "text/markdown")},
+                        data={"namespace": NAMESPACE, "wait": "true"}
+                    )
+                    response.raise_for_status()
+                return call
+
+            def query(text: str):
+                async def call():
+                    nonlocal cache_hits
+                    response = await client.post("/api/query", json={"query": text, "namespace": NAMESPACE})
+                    response.raise_for_status()
+                    cache_hits += bool(response.json().get("cache_hit"))
+                return call
+
+            def query_stream(text: str):
+                async def call() -> float:
+                    start, first_byte = time.perf_counter(), None
+                    async with client.stream("POST", "/api/query/stream", json={"query": text, "namespace": NAMESPACE}) as response:
+                        response.raise_for_status()
+                        async for _ in response.aiter_bytes():
+                            if first_byte is None:
+                                first_byte = time.perf_counter() - start
+                    return first_byte
+                return call
+
+            stages = {"upload": await run_stage([upload(i, text) for i, text in enumerate(documents)], args.concurrency)}
+            stages["query"] = await run_stage([query(text) for text in queries], args.concurrency)
+            stages["query_stream"] = await run_stage([query_stream(text) for text in stream_queries], args.concurrency)
+            stages["query"]["cache_hits"] = cache_hits
+    return stages
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """Print each stage's change from `baseline` and return the regressions above `threshold`."""
+    regressions = []
+    print(f"\nCompared with {(baseline.get('commit') or 'unknown')[:12]}:")
+    for stage, result in current["stages"].items():
+        before = baseline["stages"].get(stage)
+        if before is None:
+            continue
+        checks = [(f"latency {p}", result["latency"][p], before["latency"][p], True) for p in ("p50_ms", "p95_ms", "p99_ms")]
+        checks.append(("throughput_rps", result["throughput_rps"], before["throughput_rps"], False))
+        checks.append(("peak_rss_mb", result["peak_rss_mb"], before["peak_rss_mb"], True))
+        for name, now, then, lower_is_better in checks:
+            change = (now - then) / then if then else 0.0
+            worse = change > threshold if lower_is_better else change < -threshold
+            print(f"  {stage:13s} {name:16s} {then:10.2f} -> {now:10.2f}  {change:+7.1%}{'  REGRESSION' if worse else ''}")
+            if worse:
+                regressions.append(f"{stage} {name}")
+    return regressions
+
+
+def print_report(report: Dict):
+    settings = report["settings"]
+    print(f"Commit: {(report['commit'] or 'unknown')[:12]}, concurrency: {settings['concurrency']}, "
+          f"fake latency ms: embed {settings['embed_latency_ms']}, vector {settings['vector_latency_ms']}, llm {settings['llm_latency_ms']}")
+    for stage, result in report["stages"].items():
+        latency = result["latency"]
+        print(f"{stage:13s} {result['requests']:5d} req  {result['throughput_rps']:7.1f} req/s  "
+              f"p50 {latency['p50_ms']:8.1f}ms  p95 {latency['p95_ms']:8.1f}ms  p99 {latency['p99_ms']:8.1f}ms  "
+              f"peak RSS {result['peak_rss_mb']:.0f}MB")
+        for name, pipeline in sorted(result["pipeline"].items()):
+            print(f"  {name:28s} {pipeline['count']:6d} x {pipeline['mean_ms']:8.2f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--documents", type=int, default=20)
+    parser.add_argument("--document-kb", type=int, default=32)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--embed-latency-ms", type=float, default=50)
+    parser.add_argument("--vector-latency-ms", type=float, default=30)
+    parser.add_argument("--llm-latency-ms", type=float, default=200)
+    parser.add_argument("--llm-first-token-ms", type=float, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.1, help="relative change counted as a regression")
+    args = parser.parse_args()
+
+    install_fakes(args)
+    try:
+        stages = asyncio.run(drive(args))
+    finally:
+        shutil.rmtree(DATA_DIR, ignore_errors=True)
+
+    report = {
+        "commit": git_commit(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "settings": {k: v for k, v in vars(args).items() if k not in ("output", "baseline", "threshold")},
+        "stages": stages
+    }
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        if regressions:
+            sys.exit(f"Regressions: {', '.join(regressions)}")
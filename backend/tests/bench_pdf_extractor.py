@@ -0,0 +1,67 @@
+"""
+PDF extraction benchmark: extracting a multi-hundred-page synthetic PDF on the ingest thread vs in
+the process pool, with the worst event-loop stall seen by a 10ms ticker while each runs.
+
+    python tests/bench_pdf_extractor.py [--pages 300] [--processes 1 2 4]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from test_pdf_extractor import make_pdf, make_manual, sequential_pages
+from services import pdf_extractor
+from services.executors import run_blocking, shutdown_executors
+
+
+async def measure(extract):
+    stalls = []
+    done = asyncio.Event()
+
+    async def ticker():
+        while not done.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(0.01)
+            stalls.append(time.perf_counter() - start - 0.01)
+
+    tick = asyncio.ensure_future(ticker())
+    start = time.perf_counter()
+    pages = await run_blocking("ingest", extract)
+    elapsed = time.perf_counter() - start
+    done.set()
+    await tick
+    return elapsed, max(stalls, default=0.0), pages
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=300)
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "manual.pdf")
+        with open(path, "wb") as f:
+            f.write(make_pdf(make_manual(args.pages)))
+
+        print(f"{args.pages} pages, {os.path.getsize(path) / 1024 / 1024:.1f}MB, {os.cpu_count()} CPUs")
+        print(f"{'mode':>16} {'time':>8} {'pages/s':>8} {'max stall':>10}")
+        elapsed, stall, expected = asyncio.run(measure(lambda: sequential_pages(path)))
+        print(f"{'ingest thread':>16} {elapsed:>7.2f}s {args.pages / elapsed:>8.0f} {stall * 1000:>8.1f}ms")
+        baseline = elapsed
+
+        for processes in args.processes:
+            pdf_extractor.PDF_EXTRACT_PROCESSES = processes
+            # Start the processes outside the timed run, as a long-running server would have
+            pdf_extractor.get_pool().submit(int).result()
+            elapsed, stall, pages = asyncio.run(measure(
+                lambda: list(pdf_extractor.extract_pages(path, args.pages, tasks_per_upload=processes))
+            ))
+            assert pages == expected, "process pool pages differ from sequential extraction"
+            label = f"{processes} process{'es' if processes > 1 else ''}"
+            print(f"{label:>16} {elapsed:>7.2f}s {args.pages / elapsed:>8.0f} {stall * 1000:>8.1f}ms  {baseline / elapsed:.1f}x")
+            pdf_extractor.shutdown_pdf_extractor()
+        shutdown_executors()
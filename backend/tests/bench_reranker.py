@@ -0,0 +1,37 @@
+"""
+Reranker microbenchmark: original scalar implementation vs the vectorized scorer
+with ingest-time features, at 10, 100 and 1,000 candidates.
+
+    python tests/bench_reranker.py
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from test_reranker import QUERIES, make_candidates, reference_rerank
+from services.reranker import build_rerank_features, rerank_documents
+
+REPEATS = {10: 200, 100: 50, 1000: 5}
+
+
+def time_per_query(fn, candidates, repeats: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for query in QUERIES:
+            fn(query, candidates)
+    return (time.perf_counter() - start) / (repeats * len(QUERIES))
+
+
+if __name__ == "__main__":
+    loop = asyncio.new_event_loop()
+    print(f"{'candidates':>10} {'original':>12} {'vectorized':>12} {'speedup':>8}")
+    for count, repeats in REPEATS.items():
+        candidates = make_candidates(count, with_features=False)
+        for doc in candidates:
+            doc.update(build_rerank_features(doc["text"]))
+
+        original = time_per_query(lambda q, c: reference_rerank(q, c), candidates, repeats)
+        vectorized = time_per_query(lambda q, c: loop.run_until_complete(rerank_documents(q, c)), candidates, repeats)
+        print(f"{count:>10} {original * 1000:>10.2f}ms {vectorized * 1000:>10.2f}ms {original / vectorized:>7.1f}x")
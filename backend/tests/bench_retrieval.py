@@ -0,0 +1,257 @@
+"""
+Offline retrieval evaluation: recall@k, MRR and nDCG for retrieval and for reranking, with
+per-query latency, over a grid of TOP_K_RETRIEVE, rerank top_k, RERANK_THRESHOLD and reranker
+weight settings.
+
+The corpus is the gold-set document, one source per section, plus distractor documents drawn
+from its vocabulary without any gold keyword. A chunk's relevance to a query is the number of
+the query's expected keywords it contains, so the labels follow tests/test_goldset.py. Queries
+with no expected answer only count toward how often reranking rejects every candidate.
+
+Embeddings are hashed bags of words by default, so runs are deterministic and offline; with
+--live-embeddings the real Gemini embedder is used. The index is the local vector backend.
+
+    python tests/bench_retrieval.py --top-k 3,5,10,20 --thresholds 0,0.05,0.1,0.2
+    python tests/bench_retrieval.py --weights default --weights vector_score=1.0,bm25=0.5
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import re
+import shutil
+import sys
+import time
+from typing import List, Dict, Optional, Tuple
+
+os.environ["VECTOR_BACKEND"] = "local"
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Imported first: it points DATA_DIR at a scratch directory before config is read
+from bench_e2e import DATA_DIR, VOCABULARY, FakeEmbedder, git_commit, percentiles
+from test_goldset import TEST_DOCUMENT, GOLD_SET
+from config import TOP_K_RETRIEVE, TOP_K_RERANK, RERANK_THRESHOLD
+from services import embedder, retriever
+from services.chunker import chunk_text
+from services.embedder import embed_query
+from services.ingest import ingest_documents
+from services.reranker import rerank_documents
+from services.vector_store import chunk_id
+
+NAMESPACE = "eval"
+
+# Questions beyond the gold set's, answered by a single section each
+EXTRA_QUERIES = [
+    {"query": "Which algorithms are used for supervised learning?", "expected_keywords": ["linear regression", "decision trees", "neural networks"]},
+    {"query": "Name some methods for unsupervised learning", "expected_keywords": ["k-means", "principal component analysis"]},
+    {"query": "Where is reinforcement learning used?", "expected_keywords": ["robotics", "game playing", "autonomous vehicles"]},
+    {"query": "What are the challenges of machine learning?", "expected_keywords": ["quality data", "biases", "black box", "expensive"]},
+]
+
+
+def gold_documents() -> List[Dict]:
+    sections = re.split(r"\n(?=## )", TEST_DOCUMENT.strip())
+    return [
+        {"source": f"ml_intro_{i}.md", "title": section.splitlines()[0].lstrip("# "), "text": section}
+        for i, section in enumerate(sections)
+    ]
+
+
+def distractor_documents(count: int, queries: List[Dict], rng: random.Random) -> List[Dict]:
+    keyword_words = {word for q in queries for keyword in q["expected_keywords"] for word in re.findall(r"[a-z]+", keyword.lower())}
+    vocabulary = [word for word in VOCABULARY if not any(keyword in word for keyword in keyword_words)]
+    documents = []
+    for i in range(count):
+        sentences = [" ".join(rng.choices(vocabulary, k=rng.randint(8, 20))).capitalize() + "." for _ in range(rng.randint(3, 8))]
+        documents.append({"source": f"distractor_{i}.md", "title": f"Notes {i}", "text": " ".join(sentences)})
+    return documents
+
+
+def load_goldset(path: Optional[str], distractors: int, seed: int) -> Tuple[List[Dict], List[Dict]]:
+    """Documents and queries from a JSON file of {"documents": [{"source", "title", "text"}],
+    "queries": [{"query", "expected_keywords"}]}, or the built-in gold set."""
+    if path:
+        with open(path) as f:
+            goldset = json.load(f)
+        return goldset["documents"], goldset["queries"]
+    queries = GOLD_SET + EXTRA_QUERIES
+    return gold_documents() + distractor_documents(distractors, queries, random.Random(seed)), queries
+
+
+def relevance(documents: List[Dict], queries: List[Dict]) -> Dict[str, Dict[str, int]]:
+    """Graded relevance per query: chunk id -> number of expected keywords in the chunk."""
+    chunks = [chunk for d in documents for chunk in chunk_text(d["text"], source=d["source"], title=d["title"])]
+    gains = {}
+    for q in queries:
+        keywords = [keyword.lower() for keyword in q["expected_keywords"]]
+        gains[q["query"]] = {}
+        for chunk in chunks:
+            text = chunk["text"].lower()
+            gain = sum(1 for keyword in keywords if keyword in text)
+            if gain:
+                gains[q["query"]][chunk_id(chunk)] = gain
+    return gains
+
+
+def recall_at_k(ranked: List[str], gains: Dict[str, int]) -> float:
+    return len(set(ranked) & set(gains)) / len(gains)
+
+
+def reciprocal_rank(ranked: List[str], gains: Dict[str, int]) -> float:
+    for rank, doc_id in enumerate(ranked, 1):
+        if doc_id in gains:
+            return 1.0 / rank
+    return 0.0
+
+
+def ndcg_at_k(ranked: List[str], gains: Dict[str, int], k: int) -> float:
+    dcg = sum(gains.get(doc_id, 0) / math.log2(rank + 1) for rank, doc_id in enumerate(ranked[:k], 1))
+    ideal = sorted(gains.values(), reverse=True)[:k]
+    ideal_dcg = sum(gain / math.log2(rank + 1) for rank, gain in enumerate(ideal, 1))
+    return dcg / ideal_dcg if ideal_dcg else 0.0
+
+
+def quality(rankings: Dict[str, List[str]], gains: Dict[str, Dict[str, int]], k: int) -> Dict[str, float]:
+    answerable = [query for query in rankings if gains[query]]
+    if not answerable:
+        return {"recall": 0.0, "mrr": 0.0, "ndcg": 0.0}
+    return {
+        "recall": round(sum(recall_at_k(rankings[q], gains[q]) for q in answerable) / len(answerable), 4),
+        "mrr": round(sum(reciprocal_rank(rankings[q], gains[q]) for q in answerable) / len(answerable), 4),
+        "ndcg": round(sum(ndcg_at_k(rankings[q], gains[q], k) for q in answerable) / len(answerable), 4)
+    }
+
+
+def parse_weights(value: str) -> Tuple[str, Optional[Dict[str, float]]]:
+    if value == "default":
+        return value, None
+    weights = {}
+    for item in value.split(","):
+        name, _, weight = item.partition("=")
+        weights[name.strip()] = float(weight)
+    return value, weights
+
+
+def parse_list(cast):
+    return lambda value: [cast(item) for item in value.split(",")]
+
+
+async def evaluate(args, queries: List[Dict], gains: Dict[str, Dict[str, int]]) -> List[Dict]:
+    embeddings = {q["query"]: await embed_query(q["query"]) for q in queries}
+    no_answer = [q["query"] for q in queries if not gains[q["query"]]]
+    rows = []
+    for hybrid in args.hybrid:
+        retriever.HYBRID_RETRIEVAL = hybrid
+        for top_k in args.top_k:
+            retrieved, retrieve_times = {}, []
+            for query, embedding in embeddings.items():
+                for _ in range(args.repeats):
+                    start = time.perf_counter()
+                    retrieved[query] = await retriever.retrieve(query, embedding, namespace=NAMESPACE, top_k=top_k)
+                    retrieve_times.append(time.perf_counter() - start)
+            retrieval = quality({q: [d["id"] for d in docs] for q, docs in retrieved.items()}, gains, top_k)
+
+            for weights_label, weights in args.weights:
+                for threshold in args.thresholds:
+                    for rerank_k in args.rerank_k:
+                        reranked, rerank_times = {}, []
+                        for query, docs in retrieved.items():
+                            for _ in range(args.repeats):
+                                start = time.perf_counter()
+                                reranked[query] = await rerank_documents(query, docs, top_k=rerank_k, threshold=threshold, weights=weights)
+                                rerank_times.append(time.perf_counter() - start)
+                        retrieve_ms, rerank_ms = percentiles(retrieve_times), percentiles(rerank_times)
+                        rows.append({
+                            "hybrid": hybrid,
+                            "top_k": top_k,
+                            "rerank_k": rerank_k,
+                            "threshold": threshold,
+                            "weights": weights_label,
+                            "retrieval": retrieval,
+                            "rerank": quality({q: [d["id"] for d in docs] for q, docs in reranked.items()}, gains, rerank_k),
+                            # Share of unanswerable queries left with no sources, so generation could be skipped
+                            "no_answer_rejected": round(sum(1 for q in no_answer if not reranked[q]) / len(no_answer), 4) if no_answer else None,
+                            "retrieve_ms": {"p50_ms": retrieve_ms["p50_ms"], "p95_ms": retrieve_ms["p95_ms"]},
+                            "rerank_ms": {"p50_ms": rerank_ms["p50_ms"], "p95_ms": rerank_ms["p95_ms"]}
+                        })
+    return rows
+
+
+def cheapest_within(rows: List[Dict], tolerance: float) -> Tuple[Dict, Dict]:
+    """The best row by reranked nDCG, and the cheapest row whose reranked recall and nDCG are
+    within `tolerance` of the best; cheaper means fewer candidates retrieved, then kept."""
+    best = max(rows, key=lambda r: (r["rerank"]["ndcg"], r["rerank"]["recall"]))
+    holding = [
+        r for r in rows
+        if r["rerank"]["ndcg"] >= best["rerank"]["ndcg"] - tolerance and r["rerank"]["recall"] >= best["rerank"]["recall"] - tolerance
+    ]
+    cheapest = min(holding, key=lambda r: (r["top_k"], r["rerank_k"], r["retrieve_ms"]["p50_ms"] + r["rerank_ms"]["p50_ms"]))
+    return best, cheapest
+
+
+def describe(row: Dict) -> str:
+    return (f"hybrid={row['hybrid']} top_k={row['top_k']} rerank_k={row['rerank_k']} "
+            f"threshold={row['threshold']} weights={row['weights']}")
+
+
+def print_rows(rows: List[Dict]):
+    print(f"{'hybrid':>6} {'top_k':>5} {'rr_k':>4} {'thresh':>6} {'weights':>20} | "
+          f"{'R@k':>5} {'MRR':>5} {'nDCG':>5} | {'R@k':>5} {'MRR':>5} {'nDCG':>5} {'noans':>5} | {'ret p50':>8} {'rr p50':>7}")
+    for r in rows:
+        retrieval, rerank = r["retrieval"], r["rerank"]
+        no_answer = f"{r['no_answer_rejected']:5.2f}" if r["no_answer_rejected"] is not None else f"{'-':>5}"
+        print(f"{str(r['hybrid']):>6} {r['top_k']:>5} {r['rerank_k']:>4} {r['threshold']:>6} {r['weights'][:20]:>20} | "
+              f"{retrieval['recall']:5.2f} {retrieval['mrr']:5.2f} {retrieval['ndcg']:5.2f} | "
+              f"{rerank['recall']:5.2f} {rerank['mrr']:5.2f} {rerank['ndcg']:5.2f} {no_answer} | "
+              f"{r['retrieve_ms']['p50_ms']:6.2f}ms {r['rerank_ms']['p50_ms']:5.2f}ms")
+
+
+async def run(args) -> List[Dict]:
+    documents, queries = load_goldset(args.goldset, args.distractors, args.seed)
+    gains = relevance(documents, queries)
+    result = await ingest_documents(
+        [{"pieces": [d["text"]], "source": d["source"], "title": d["title"]} for d in documents],
+        namespace=NAMESPACE
+    )
+    print(f"Indexed {result['chunks_created']} chunks from {len(documents)} documents; {len(queries)} queries, "
+          f"{sum(1 for q in queries if gains[q['query']])} with relevant chunks\n")
+    return await evaluate(args, queries, gains)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--goldset", help="JSON file with documents and queries; defaults to the built-in gold set")
+    parser.add_argument("--distractors", type=int, default=200, help="distractor documents added to the built-in gold set")
+    parser.add_argument("--top-k", type=parse_list(int), default=[3, 5, TOP_K_RETRIEVE, 20])
+    parser.add_argument("--rerank-k", type=parse_list(int), default=[3, TOP_K_RERANK])
+    parser.add_argument("--thresholds", type=parse_list(float), default=[0.0, RERANK_THRESHOLD, 0.2])
+    parser.add_argument("--weights", type=parse_weights, action="append",
+                        help="'default' or name=value pairs such as bm25=0.5,vector_score=1.0; repeat for more")
+    parser.add_argument("--hybrid", type=parse_list(lambda value: value == "on"), default=[True], help="on, off or on,off")
+    parser.add_argument("--repeats", type=int, default=5, help="timed runs per query")
+    parser.add_argument("--tolerance", type=float, default=0.01, help="quality loss accepted for a cheaper configuration")
+    parser.add_argument("--live-embeddings", action="store_true", help="embed with Gemini (needs GEMINI_API_KEY)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write every row to this JSON file")
+    args = parser.parse_args()
+    args.weights = args.weights or [parse_weights("default")]
+
+    if not args.live_embeddings:
+        embedder._embed_content = FakeEmbedder(0.0)
+    try:
+        rows = asyncio.run(run(args))
+    finally:
+        shutil.rmtree(DATA_DIR, ignore_errors=True)
+
+    print("Left: retrieval@top_k. Right: reranked@rerank_k; noans is the share of unanswerable queries with no sources.")
+    print_rows(rows)
+    best, cheapest = cheapest_within(rows, args.tolerance)
+    print(f"\nBest:     {describe(best)}  nDCG {best['rerank']['ndcg']:.3f}, recall {best['rerank']['recall']:.3f}")
+    print(f"Cheapest: {describe(cheapest)}  nDCG {cheapest['rerank']['ndcg']:.3f}, recall {cheapest['rerank']['recall']:.3f}")
+    if args.output:
+        with open(args.output, "w") as f:
+            settings = {k: v for k, v in vars(args).items() if k != "output"}
+            settings["weights"] = [label for label, _ in args.weights]
+            json.dump({"commit": git_commit(), "settings": settings, "rows": rows}, f, indent=2)
@@ -0,0 +1,133 @@
+"""
+Startup benchmark: how long a new replica takes from process start until /ready reports it warm,
+which bounds how fast the deployment can scale out. Each run is a fresh interpreter, split into
+interpreter start, `import main`, and lifespan start until warm-up finishes, with the time of
+every warm-up step.
+
+Gemini embeddings are replaced by a local stand-in with a fixed latency and the vector index is
+the local one, so runs need no network; pass --live to warm up against the real services.
+
+    python tests/bench_startup.py --runs 10 --output startup.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import List, Dict, Optional
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def child(args):
+    started = time.time()
+    sys.path.insert(0, BACKEND_DIR)
+    import_start = time.perf_counter()
+    import main
+    from services import embedder, warmup
+    imported = time.perf_counter()
+
+    if not args.live:
+        def fake_embed(content, task_type):
+            time.sleep(args.embed_latency_ms / 1000)
+            return {"embedding": [0.0] * 768}
+        embedder._embed_content = fake_embed
+
+    async def start():
+        async with main.app.router.lifespan_context(main.app):
+            lifespan_start = time.perf_counter()
+            while not warmup.is_ready():
+                await asyncio.sleep(0.005)
+            return time.perf_counter() - lifespan_start, warmup.readiness()
+
+    ready_s, readiness = asyncio.run(start())
+    print(json.dumps({
+        "started_at": started,
+        "import_s": imported - import_start,
+        "ready_s": ready_s,
+        "steps_ms": {name: step["ms"] for name, step in readiness["steps"].items()}
+    }))
+
+
+def run_once(args) -> Dict:
+    data_dir = tempfile.mkdtemp(prefix="askdocs-startup-")
+    env = {**os.environ, "DATA_DIR": data_dir, "EMBED_CACHE_PATH": "", "LOG_LEVEL": os.environ.get("LOG_LEVEL", "WARNING")}
+    if not args.live:
+        env["VECTOR_BACKEND"] = "local"
+    command = [sys.executable, os.path.abspath(__file__), "--child", "--embed-latency-ms", str(args.embed_latency_ms)]
+    if args.live:
+        command.append("--live")
+    try:
+        spawned = time.time()
+        result = subprocess.run(command, env=env, capture_output=True, text=True, check=True, timeout=args.timeout)
+        total_s = time.time() - spawned
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+    run = json.loads(result.stdout.strip().splitlines()[-1])
+    # Interpreter start includes site imports; the rest of the child's wall time is shutdown
+    return {
+        "interpreter_s": run["started_at"] - spawned,
+        "import_s": run["import_s"],
+        "ready_s": run["ready_s"],
+        "time_to_ready_s": run["started_at"] - spawned + run["import_s"] + run["ready_s"],
+        "total_s": total_s,
+        "steps_ms": run["steps_ms"]
+    }
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    ordered = sorted(values)
+    p95 = ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))]
+    return {"p50_ms": round(statistics.median(ordered) * 1000, 2), "p95_ms": round(p95 * 1000, 2)}
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True, cwd=BACKEND_DIR
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--embed-latency-ms", type=float, default=50)
+    parser.add_argument("--live", action="store_true", help="warm up against the configured Gemini and Pinecone")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args)
+        return
+
+    runs = [run_once(args) for _ in range(args.runs)]
+    phases = {phase: summarize([run[phase] for run in runs])
+              for phase in ("interpreter_s", "import_s", "ready_s", "time_to_ready_s", "total_s")}
+    steps = {name: summarize([run["steps_ms"][name] / 1000 for run in runs]) for name in runs[0]["steps_ms"]}
+    report = {
+        "commit": git_commit(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "settings": {k: v for k, v in vars(args).items() if k not in ("output", "child")},
+        "phases": phases,
+        "warmup_steps": steps
+    }
+
+    print(f"{'phase':<24}{'p50 ms':>10}{'p95 ms':>10}")
+    for name, row in list(phases.items()) + [(f"  warm-up {name}", row) for name, row in steps.items()]:
+        print(f"{name.replace('_s', '') if name in phases else name:<24}{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
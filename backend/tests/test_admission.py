@@ -0,0 +1,106 @@
+"""
+Admission control tests: pools cap concurrent requests, hand slots over in arrival order, and turn
+away requests that can't start in time with a 503 and Retry-After.
+"""
+import asyncio
+import os
+import sys
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.admission import AdmissionControlMiddleware, AdmissionPool, Rejected
+
+
+def test_slots_are_handed_over_in_arrival_order():
+    order = []
+
+    async def request(pool, name):
+        await pool.acquire()
+        order.append(name)
+        await asyncio.sleep(0.01)
+        pool.release(0.01)
+
+    async def main():
+        pool = AdmissionPool("test", concurrency=1, max_queue=10, max_wait_s=5)
+        await asyncio.gather(*(request(pool, i) for i in range(5)))
+        assert pool.running == 0 and pool.queued() == 0
+
+    asyncio.run(main())
+    assert order == [0, 1, 2, 3, 4]
+
+
+def test_full_queue_is_rejected_immediately():
+    async def main():
+        pool = AdmissionPool("test", concurrency=1, max_queue=1, max_wait_s=5)
+        await pool.acquire()
+        waiting = asyncio.create_task(pool.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(Rejected) as rejected:
+            await pool.acquire()
+        assert rejected.value.reason == "queue_full"
+        assert rejected.value.retry_after_s >= 1
+        pool.release(0.01)
+        await waiting
+        pool.release(0.01)
+        assert pool.running == 0
+
+    asyncio.run(main())
+
+
+def test_request_that_cannot_start_in_time_is_rejected():
+    async def main():
+        pool = AdmissionPool("test", concurrency=1, max_queue=10, max_wait_s=0.05)
+        await pool.acquire()
+        with pytest.raises(Rejected) as rejected:
+            await pool.acquire()
+        assert rejected.value.reason == "deadline"
+        assert pool.queued() == 0
+
+        # Once requests are known to hold the slot for longer than the wait allows, don't queue at all
+        pool.release(2.5)
+        await pool.acquire()
+        with pytest.raises(Rejected) as rejected:
+            await pool.acquire()
+        assert rejected.value.reason == "deadline"
+        assert rejected.value.retry_after_s == 1
+
+    asyncio.run(main())
+
+
+def test_middleware_sheds_excess_requests_with_retry_after():
+    app = FastAPI()
+    release = asyncio.Event()
+
+    @app.post("/api/query")
+    async def query():
+        await release.wait()
+        return {"answer": "ok"}
+
+    @app.get("/api/health")
+    async def health():
+        return {"status": "healthy"}
+
+    pools = {"query": AdmissionPool("query", concurrency=2, max_queue=1, max_wait_s=5)}
+    app.add_middleware(AdmissionControlMiddleware, routes={"/api/query": "query"}, pools=pools)
+
+    async def main():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            admitted = [asyncio.create_task(client.post("/api/query")) for _ in range(3)]
+            while pools["query"].queued() < 1:
+                await asyncio.sleep(0.001)
+
+            shed = await client.post("/api/query")
+            assert shed.status_code == 503
+            assert int(shed.headers["Retry-After"]) >= 1
+            # Routes without a pool aren't held up
+            assert (await client.get("/api/health")).status_code == 200
+
+            release.set()
+            assert [r.status_code for r in await asyncio.gather(*admitted)] == [200, 200, 200]
+            assert pools["query"].running == 0
+
+    asyncio.run(main())
@@ -0,0 +1,82 @@
+"""
+Answer policy tests: weak retrieval skips generation, sources follow the score distribution, and
+confident queries get the light generation config.
+"""
+import asyncio
+import os
+import sys
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from routers import query
+from services import answer_policy, llm
+from services.answer_policy import plan_answer, LOW_CONFIDENCE_ANSWER
+
+
+def ranked(*scores):
+    return [{"id": f"d{i}", "text": f"doc {i}", "score": 0.8, "rerank_score": score} for i, score in enumerate(scores)]
+
+
+def test_weak_or_unreranked_sources_skip_generation():
+    for sources in (ranked(0.05, 0.04), [{"id": "d0", "text": "fallback", "score": 0.9}], []):
+        kept, decision = plan_answer(sources)
+        assert kept == [] and decision["decision"] == "skip"
+
+
+def test_sources_well_below_the_best_are_dropped():
+    kept, decision = plan_answer(ranked(0.25, 0.2, 0.16, 0.1, 0.05))
+    assert [doc["id"] for doc in kept] == ["d0", "d1", "d2"]
+    assert decision == {"decision": "generate", "confidence": 0.25, "sources_considered": 5, "sources_used": 3}
+
+
+def test_one_confident_source_gets_the_light_config():
+    kept, decision = plan_answer(ranked(0.45, 0.12, 0.11))
+    assert [doc["id"] for doc in kept] == ["d0"]
+    assert decision["decision"] == "light"
+    # Confident, but many sources are as good: a broad question gets the full answer
+    assert plan_answer(ranked(0.45, 0.44, 0.43, 0.42))[1]["decision"] == "generate"
+
+
+def test_zero_floor_always_generates(monkeypatch):
+    monkeypatch.setattr(answer_policy, "ANSWER_CONFIDENCE_FLOOR", 0.0)
+    kept, decision = plan_answer([{"id": "d0", "text": "fallback", "score": 0.9}])
+    assert len(kept) == 1 and decision["decision"] == "generate"
+
+
+def test_skipped_queries_never_call_gemini_and_are_cached(monkeypatch):
+    calls = []
+
+    async def fake_embed(text):
+        return [1.0, 0.0]
+
+    async def fake_sources(request, embedding):
+        return [{"id": "a", "text": "Unrelated notes.", "source": "notes.md", "title": "Notes", "score": 0.4}]
+
+    async def fake_generate(question, sources, light=False):
+        calls.append(question)
+
+    monkeypatch.setattr(query, "embed_query", fake_embed)
+    monkeypatch.setattr(query, "_retrieve_sources", fake_sources)
+    monkeypatch.setattr(query, "generate_answer", fake_generate)
+
+    request = query.QueryRequest(query="How do I bake bread?", namespace="policy_skip")
+    first = asyncio.run(query.query_documents(request))
+    second = asyncio.run(query.query_documents(request))
+    assert calls == []
+    assert first["answer"] == LOW_CONFIDENCE_ANSWER and first["answer_policy"]["decision"] == "skip"
+    assert second["cache_hit"]
+
+
+def test_light_generation_asks_for_a_short_capped_answer(monkeypatch):
+    seen = {}
+
+    class FakeModel:
+        def generate_content(self, prompt, **kwargs):
+            seen.update(prompt=prompt, **kwargs)
+            return SimpleNamespace(text="Short [1].")
+
+    monkeypatch.setattr(llm, "model", FakeModel())
+    result = asyncio.run(llm.generate_answer("What is RAG?", ranked(0.5), light=True))
+    assert result["answer"] == "Short [1]."
+    assert "two or three sentences" in seen["prompt"]
+    assert seen["generation_config"] == {"max_output_tokens": llm.LIGHT_MAX_OUTPUT_TOKENS}
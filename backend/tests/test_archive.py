@@ -0,0 +1,94 @@
+"""
+Archive extraction tests: supported documents are extracted under the upload directory, anything
+else is skipped, and names that would escape the directory never do.
+"""
+import io
+import os
+import sys
+import tarfile
+import zipfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services import archive
+from services.archive import ArchiveError, extract_archive, safe_relative_path
+
+FILES = {
+    "docs/setup.md": b"# Setup\n\nPrime the pump.",
+    "docs/notes.txt": "café notes".encode("utf-8"),
+    "docs/image.png": b"\x89PNG",
+    "../escape.md": b"outside",
+    "docs/.hidden.md": b"hidden",
+}
+
+
+def make_zip(files) -> io.BytesIO:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zf:
+        for name, data in files.items():
+            zf.writestr(name, data)
+    buffer.seek(0)
+    return buffer
+
+
+def make_tar(files, mode="w:gz") -> io.BytesIO:
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode=mode) as tf:
+        for name, data in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tf.addfile(info, io.BytesIO(data))
+        link = tarfile.TarInfo("docs/link.md")
+        link.type = tarfile.SYMTYPE
+        link.linkname = "/etc/passwd"
+        tf.addfile(link)
+    buffer.seek(0)
+    return buffer
+
+
+def test_safe_relative_path():
+    assert safe_relative_path("docs/a.md") == "docs/a.md"
+    assert safe_relative_path("/abs/a.md") == "abs/a.md"
+    assert safe_relative_path("docs\\sub\\a.md") == "docs/sub/a.md"
+    assert safe_relative_path("docs/../a.md") == "a.md"
+    for name in ["../a.md", "docs/../../a.md", "..", "", ".", ".env", "docs/.git/config"]:
+        assert safe_relative_path(name) is None
+
+
+@pytest.mark.parametrize("filename, make", [
+    ("docs.zip", make_zip),
+    ("docs.tar.gz", make_tar),
+    ("docs.tar", lambda files: make_tar(files, mode="w")),
+])
+def test_extracts_supported_documents_only(tmp_path, filename, make):
+    directory = str(tmp_path / "upload")
+    extracted, skipped = extract_archive(make(FILES), filename, directory)
+
+    assert sorted(extracted) == ["docs/notes.txt", "docs/setup.md"]
+    assert {"docs/image.png", "../escape.md", "docs/.hidden.md"} <= set(skipped)
+    for path in extracted:
+        with open(os.path.join(directory, path), "rb") as f:
+            assert f.read() == FILES[path]
+    assert not os.path.exists(tmp_path / "escape.md")
+    assert not os.path.exists(os.path.join(directory, "docs", "link.md"))
+
+
+def test_limits_are_enforced_while_extracting(tmp_path, monkeypatch):
+    monkeypatch.setattr(archive, "BATCH_MAX_FILES", 2)
+    files = {f"{n}.md": b"text" for n in range(3)}
+    with pytest.raises(ArchiveError, match="Too many documents"):
+        extract_archive(make_zip(files), "docs.zip", str(tmp_path / "a"))
+
+    monkeypatch.setattr(archive, "BATCH_MAX_FILES", 10)
+    monkeypatch.setattr(archive, "MAX_ARCHIVE_EXTRACTED_MB", 1)
+    files = {f"{n}.md": b"x" * 600 * 1024 for n in range(2)}
+    with pytest.raises(ArchiveError, match="too large when extracted"):
+        extract_archive(make_zip(files), "docs.zip", str(tmp_path / "b"))
+
+
+def test_corrupt_archive(tmp_path):
+    with pytest.raises(ArchiveError, match="Error reading archive"):
+        extract_archive(io.BytesIO(b"not an archive"), "docs.zip", str(tmp_path))
+    with pytest.raises(ArchiveError, match="Error reading archive"):
+        extract_archive(io.BytesIO(b"not an archive"), "docs.tar.gz", str(tmp_path))
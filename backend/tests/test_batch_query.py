@@ -0,0 +1,108 @@
+"""
+Batch query tests: one embedding call for the whole batch, per-query results in request order,
+and generation limited to BATCH_GENERATE_CONCURRENCY at a time.
+"""
+import asyncio
+import os
+import sys
+
+import pytest
+from fastapi import HTTPException
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from routers import query
+
+DOCUMENTS = {
+    "rag": {"id": "rag", "text": "RAG retrieves passages then generates an answer.", "source": "rag.md", "title": "RAG", "score": 0.9},
+    "bm25": {"id": "bm25", "text": "BM25 ranks passages by term frequency.", "source": "bm25.md", "title": "BM25", "score": 0.8},
+}
+
+
+def install_fakes(monkeypatch, generate_concurrency=2):
+    calls = {"embed": [], "retrieve": 0, "generate": 0, "max_generating": 0}
+    generating = {"now": 0}
+
+    async def fake_embed_texts(texts, task_type):
+        calls["embed"].append(list(texts))
+        return [[float(len(text)), 1.0] for text in texts]
+
+    async def fake_retrieve(text, embedding, namespace=None, top_k=10):
+        calls["retrieve"] += 1
+        return [DOCUMENTS[key].copy() for key in DOCUMENTS if key in text.lower()]
+
+    async def fake_generate(question, sources, light=False):
+        calls["generate"] += 1
+        generating["now"] += 1
+        calls["max_generating"] = max(calls["max_generating"], generating["now"])
+        await asyncio.sleep(0.01)
+        generating["now"] -= 1
+        return {"answer": f"About {sources[0]['id']} [1].", "citations": [{"number": 1}], "token_estimate": 10, "context": None}
+
+    monkeypatch.setattr(query, "embed_texts", fake_embed_texts)
+    monkeypatch.setattr(query, "retrieve", fake_retrieve)
+    monkeypatch.setattr(query, "generate_answer", fake_generate)
+    monkeypatch.setattr(query, "BATCH_GENERATE_CONCURRENCY", generate_concurrency)
+    return calls
+
+
+def test_batch_embeds_once_and_keeps_request_order(monkeypatch):
+    calls = install_fakes(monkeypatch)
+    questions = ["What is RAG?", "How does BM25 rank?", "what is rag", "Tell me about unicorns", "rag vs bm25", "RAG steps"]
+    response = asyncio.run(query.query_documents_batch(query.BatchQueryRequest(queries=questions, namespace="batch_order")))
+
+    # The repeated question is embedded, retrieved and answered once
+    assert len(calls["embed"]) == 1 and len(calls["embed"][0]) == 5
+    assert calls["retrieve"] == 5
+    assert calls["generate"] == 4
+    assert calls["max_generating"] == 2
+    results = response["results"]
+    assert [r["query"] for r in results] == questions
+    assert [r["answer"] for r in results] == [
+        "About rag [1].", "About bm25 [1].", "About rag [1].", query.NO_DOCUMENTS_ANSWER, "About rag [1].", "About rag [1]."
+    ]
+    assert all("generate_ms" in r for r in results if r["citations"])
+    assert set(response["timings_ms"]) == {"embed", "retrieve", "rerank", "generate"}
+
+
+def test_answered_queries_are_cached_for_the_next_batch(monkeypatch):
+    calls = install_fakes(monkeypatch)
+    request = query.BatchQueryRequest(queries=["What is RAG?", "How does BM25 rank?"], namespace="batch_cache")
+    asyncio.run(query.query_documents_batch(request))
+    response = asyncio.run(query.query_documents_batch(request))
+
+    assert len(calls["embed"]) == 1
+    assert [(r["cache_hit"], r["cache_match"]) for r in response["results"]] == [(True, "exact"), (True, "exact")]
+
+
+def test_failed_queries_get_an_error_entry_and_the_rest_are_answered(monkeypatch):
+    install_fakes(monkeypatch)
+    retrieve, generate = query.retrieve, query.generate_answer
+
+    async def flaky_retrieve(text, embedding, namespace=None, top_k=10):
+        if "broken index" in text:
+            raise ConnectionError("pinecone unreachable")
+        return await retrieve(text, embedding, namespace, top_k)
+
+    async def flaky_generate(question, sources, light=False):
+        if "bm25" in question.lower():
+            raise RuntimeError("quota exceeded")
+        return await generate(question, sources, light)
+
+    monkeypatch.setattr(query, "retrieve", flaky_retrieve)
+    monkeypatch.setattr(query, "generate_answer", flaky_generate)
+    questions = ["What is RAG? (broken index)", "How does BM25 rank?", "What is RAG?"]
+    response = asyncio.run(query.query_documents_batch(query.BatchQueryRequest(queries=questions, namespace="batch_errors")))
+
+    results = response["results"]
+    assert "pinecone unreachable" in results[0]["error"] and results[0]["answer"] is None
+    assert "quota exceeded" in results[1]["error"] and results[1]["citations"] == []
+    assert results[2]["answer"] == "About rag [1]." and "error" not in results[2]
+
+
+def test_batch_size_is_bounded(monkeypatch):
+    install_fakes(monkeypatch)
+    monkeypatch.setattr(query, "BATCH_QUERY_MAX", 2)
+    for questions in ([], ["a", "b", "c"]):
+        with pytest.raises(HTTPException) as error:
+            asyncio.run(query.query_documents_batch(query.BatchQueryRequest(queries=questions)))
+        assert error.value.status_code == 400
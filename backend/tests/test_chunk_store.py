@@ -0,0 +1,126 @@
+"""
+Chunk store tests: the vector index returns ids and scores only, text and rerank features come from
+the local store, and a replica missing chunks recovers them from the index metadata.
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services import vector_index, vector_store
+from services.chunk_store import ChunkStore
+from services.lexical_index import LexicalIndex
+from services.local_index import LocalVectorIndex
+from services.reranker import build_rerank_features
+
+CHUNKS = [
+    {"text": "Supervised learning uses labeled data.", "source": "ml.md", "title": "ML", "chunk_index": 0},
+    {"text": "Clustering groups unlabeled points.", "source": "ml.md", "title": "ML", "chunk_index": 1},
+]
+EMBEDDINGS = [[1.0, 0.0], [0.6, 0.8]]
+
+
+class RecordingIndex(LocalVectorIndex):
+    def __init__(self, path):
+        super().__init__(path)
+        self.queries = []
+        self.fetches = []
+
+    def query(self, vector, top_k, namespace, include_metadata=True):
+        self.queries.append(include_metadata)
+        return super().query(vector, top_k, namespace, include_metadata)
+
+    def fetch(self, ids, namespace):
+        self.fetches.append(list(ids))
+        return super().fetch(ids, namespace)
+
+
+def setup(tmp_path, monkeypatch, slim):
+    index = RecordingIndex(str(tmp_path))
+    monkeypatch.setattr(vector_index, "_index", index)
+    monkeypatch.setattr(vector_store, "lexical_index", LexicalIndex(None))
+    monkeypatch.setattr(vector_store, "chunk_store", ChunkStore(":memory:"))
+    monkeypatch.setattr(vector_store, "SLIM_VECTOR_METADATA", slim)
+    chunks = [{**chunk, **build_rerank_features(chunk["text"])} for chunk in CHUNKS]
+    asyncio.run(vector_store.upsert_vectors(EMBEDDINGS, chunks, namespace="docs"))
+    return index
+
+
+def test_queries_read_text_from_the_store_not_the_index(tmp_path, monkeypatch):
+    index = setup(tmp_path, monkeypatch, slim=True)
+    stored = index.fetch([vector_store.chunk_id(CHUNKS[0])], "docs")
+    assert set(next(iter(stored.values()))["metadata"]) == {"source", "title", "chunk_index"}
+
+    docs = asyncio.run(vector_store.query_vectors([1.0, 0.0], namespace="docs", top_k=2))
+    assert index.queries == [False]
+    assert [doc["text"] for doc in docs] == [CHUNKS[0]["text"], CHUNKS[1]["text"]]
+    assert docs[0]["term_freqs"] == build_rerank_features(CHUNKS[0]["text"])["term_freqs"]
+    assert docs[0]["chunk_index"] == 0 and docs[0]["score"] > docs[1]["score"]
+
+
+def test_a_replica_without_the_chunks_recovers_them_from_the_index(tmp_path, monkeypatch):
+    index = setup(tmp_path, monkeypatch, slim=False)
+    monkeypatch.setattr(vector_store, "chunk_store", ChunkStore(":memory:"))
+    index.fetches.clear()
+
+    first = asyncio.run(vector_store.query_vectors([1.0, 0.0], namespace="docs", top_k=2))
+    second = asyncio.run(vector_store.query_vectors([1.0, 0.0], namespace="docs", top_k=2))
+    assert [doc["text"] for doc in first] == [doc["text"] for doc in second] == [CHUNKS[0]["text"], CHUNKS[1]["text"]]
+    # Recovered once, then served from this replica's store
+    assert len(index.fetches) == 1
+
+
+def test_oversized_chunks_keep_their_text_out_of_the_index(tmp_path, monkeypatch):
+    monkeypatch.setattr(vector_store, "SLIM_VECTOR_METADATA", False)
+    monkeypatch.setattr(vector_store, "VECTOR_METADATA_MAX_BYTES", 200)
+    big = {"text": "word " * 100, "source": "big.md", "title": "Big", "chunk_index": 0}
+    metadata = {key: big[key] for key in ("text", "source", "title", "chunk_index")}
+    assert "text" not in vector_store._index_metadata(metadata)
+    assert "text" in vector_store._index_metadata(dict(metadata, text="short"))
+
+
+def test_deleting_a_namespace_removes_its_chunks(tmp_path, monkeypatch):
+    setup(tmp_path, monkeypatch, slim=True)
+    ids = [vector_store.chunk_id(chunk) for chunk in CHUNKS]
+    assert len(vector_store.chunk_store.get_many("docs", ids)) == 2
+    asyncio.run(vector_store.delete_namespace("docs"))
+    assert vector_store.chunk_store.get_many("docs", ids) == {}
+
+
+def test_store_reads_and_writes_run_off_the_event_loop(tmp_path, monkeypatch):
+    setup(tmp_path, monkeypatch, slim=True)
+
+    class SlowStore(ChunkStore):
+        def put_many(self, namespace, chunks):
+            time.sleep(0.2)
+            super().put_many(namespace, chunks)
+
+        def get_many(self, namespace, chunk_ids):
+            time.sleep(0.2)
+            return super().get_many(namespace, chunk_ids)
+
+    monkeypatch.setattr(vector_store, "chunk_store", SlowStore(":memory:"))
+
+    async def main():
+        gaps = []
+
+        async def ticker(done):
+            last = time.perf_counter()
+            while not done.is_set():
+                await asyncio.sleep(0.01)
+                now = time.perf_counter()
+                gaps.append(now - last)
+                last = now
+
+        done = asyncio.Event()
+        ticking = asyncio.create_task(ticker(done))
+        await vector_store.upsert_vectors(EMBEDDINGS, CHUNKS, namespace="slow")
+        results = await vector_store.query_vectors([1.0, 0.0], namespace="slow", top_k=2)
+        done.set()
+        await ticking
+        return results, gaps
+
+    results, gaps = asyncio.run(main())
+    assert len(results) == 2
+    assert max(gaps) < 0.1
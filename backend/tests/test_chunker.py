@@ -0,0 +1,149 @@
+"""
+Chunker tests: the batched single-pass chunker must match the original implementation exactly.
+"""
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services import chunker
+from services.chunker import _Span, _joined_tokens, chunk_text, count_tokens, split_into_sentences
+from services.reranker import build_rerank_features
+
+WORDS = [
+    "retrieval", "augmented", "generation", "vector", "index", "namespace", "Pinecone", "Gemini",
+    "chunk", "token", "overlap", "the", "a", "of", "model", "café", "naïve", "東京", "embedding",
+    "latency", "p99", "v2.1", "x86_64", "self-attention", "e.g", "approx"
+]
+
+
+def reference_chunk_text(text, source="unknown", title="Untitled", chunk_size=chunker.CHUNK_SIZE, chunk_overlap=chunker.CHUNK_OVERLAP):
+    """The original chunker, kept verbatim as the oracle."""
+    paragraphs = [p.strip() for p in text.split('\n\n') if p.strip()]
+
+    chunks = []
+    current_chunk = ""
+    current_tokens = 0
+
+    for para in paragraphs:
+        para_tokens = count_tokens(para)
+
+        if para_tokens > chunk_size:
+            if current_chunk:
+                chunks.append(current_chunk)
+                current_chunk = ""
+                current_tokens = 0
+
+            sentences = split_into_sentences(para)
+            for sentence in sentences:
+                sent_tokens = count_tokens(sentence)
+
+                if current_tokens + sent_tokens <= chunk_size:
+                    current_chunk += (" " if current_chunk else "") + sentence
+                    current_tokens += sent_tokens
+                else:
+                    if current_chunk:
+                        chunks.append(current_chunk)
+                    current_chunk = sentence
+                    current_tokens = sent_tokens
+
+        elif current_tokens + para_tokens <= chunk_size:
+            current_chunk += ("\n\n" if current_chunk else "") + para
+            current_tokens += para_tokens
+
+        else:
+            if current_chunk:
+                chunks.append(current_chunk)
+            current_chunk = para
+            current_tokens = para_tokens
+
+    if current_chunk:
+        chunks.append(current_chunk)
+
+    if chunk_overlap > 0 and len(chunks) > 1:
+        overlapped_chunks = []
+        for i, chunk in enumerate(chunks):
+            if i > 0:
+                prev_sentences = split_into_sentences(chunks[i-1])
+                overlap_text = ""
+                overlap_tokens = 0
+
+                for sent in reversed(prev_sentences):
+                    sent_tokens = count_tokens(sent)
+                    if overlap_tokens + sent_tokens <= chunk_overlap:
+                        overlap_text = sent + " " + overlap_text
+                        overlap_tokens += sent_tokens
+                    else:
+                        break
+
+                if overlap_text:
+                    chunk = overlap_text.strip() + " " + chunk
+
+            overlapped_chunks.append(chunk)
+        chunks = overlapped_chunks
+
+    result = []
+    for i, chunk in enumerate(chunks):
+        result.append({
+            "text": chunk,
+            "source": source,
+            "title": title,
+            "chunk_index": i,
+            "token_count": count_tokens(chunk),
+            **build_rerank_features(chunk)
+        })
+
+    return result
+
+
+def make_document(paragraphs: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    parts = []
+    for _ in range(paragraphs):
+        sentences = []
+        # Mostly short paragraphs, with the occasional one far over the chunk size
+        for _ in range(rng.choice([1, 2, 4, 8, 150])):
+            words = [rng.choice(WORDS) for _ in range(rng.randint(1, 40))]
+            sentences.append(" ".join(words).capitalize() + rng.choice([".", "!", "?", "", ".\n"]))
+        parts.append(" ".join(sentences))
+    return rng.choice(["\n\n", "\n\n\n", " \n\n "]).join(parts)
+
+
+@pytest.mark.parametrize("seed", range(6))
+def test_matches_reference_with_default_settings(seed):
+    text = make_document(80, seed)
+    assert chunk_text(text, "doc.md", "Doc") == reference_chunk_text(text, "doc.md", "Doc")
+
+
+@pytest.mark.parametrize("chunk_size,chunk_overlap", [(50, 0), (120, 30), (300, 200)])
+def test_matches_reference_with_other_settings(monkeypatch, chunk_size, chunk_overlap):
+    monkeypatch.setattr(chunker, "CHUNK_SIZE", chunk_size)
+    monkeypatch.setattr(chunker, "CHUNK_OVERLAP", chunk_overlap)
+    text = make_document(40, seed=chunk_size)
+    assert chunk_text(text) == reference_chunk_text(text, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+
+def test_long_overlap_sentences_fall_back_to_single_counts(monkeypatch):
+    # Sentences of very long single-character tokens exceed the batched character budget
+    monkeypatch.setattr(chunker, "CHUNK_SIZE", 60)
+    text = "\n\n".join(" ".join(["x" * 40 + "."] * 12) for _ in range(4))
+    assert chunk_text(text) == reference_chunk_text(text, chunk_size=60)
+
+
+def test_joined_span_counts_match_direct_encoding():
+    rng = random.Random(7)
+    alphabet = ["word", "Word", "'s", "'ll", "123", "4567", ".", "!?", "...", "(x)", "—", "é", "東京", "🙂",
+                " ", "  ", "\t", "\n", "\r\n", "\xa0", "\x85", "\u3000", "\x1c", "<|endoftext|>"]
+    for _ in range(2000):
+        texts = ["".join(rng.choice(alphabet) for _ in range(rng.randint(1, 12))) for _ in range(rng.randint(1, 4))]
+        separators = [rng.choice([" ", "\n\n", "\n", " \t", ""]) for _ in texts[1:]]
+        joined = texts[0] + "".join(sep + text for sep, text in zip(separators, texts[1:]))
+        expected = len(chunker.get_encoding().encode_ordinary(joined))
+        assert _joined_tokens([_Span(text) for text in texts], separators) == expected, repr(joined)
+
+
+def test_edge_cases():
+    for text in ["", "   \n\n  ", "One sentence.", "no punctuation at all " * 500]:
+        assert chunk_text(text) == reference_chunk_text(text)
@@ -0,0 +1,125 @@
+"""
+Context packing tests: overlap between consecutive chunks and near-duplicates are paid for once,
+and the packed sources stay within the token budget.
+"""
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services import context
+from services.chunker import chunk_text, count_tokens
+from services.context import pack_sources, overlap_length
+from services.llm import build_prompt, prepare_prompt
+
+WORDS = "model data training label cluster network tree regression fraud spam signal vector".split()
+
+
+def make_text(sentences: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    return " ".join(
+        " ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 14))).capitalize() + "."
+        for _ in range(sentences)
+    )
+
+
+def as_sources(chunks, scores=None):
+    scores = scores or [1.0 - 0.1 * i for i in range(len(chunks))]
+    return [{**chunk, "id": f"c{i}", "score": score, "rerank_score": score} for i, (chunk, score) in enumerate(zip(chunks, scores))]
+
+
+def test_overlap_is_the_sentences_the_chunker_repeated():
+    chunks = chunk_text(make_text(400), source="doc.md")
+    assert len(chunks) >= 3
+    for previous, following in zip(chunks, chunks[1:]):
+        overlap = overlap_length(previous["text"], following["text"])
+        assert overlap > 0
+        assert previous["text"].endswith(following["text"][:overlap])
+
+
+def test_unrelated_texts_have_no_overlap():
+    assert overlap_length("The model is trained.", "Then it is tested. The model is trained.") == 0
+    assert overlap_length("It ends with the", "the start of another.") == 0
+
+
+def test_consecutive_chunks_merge_without_repeating_the_overlap():
+    chunks = chunk_text(make_text(400), source="doc.md")[:3]
+    # Ranked out of document order; the passage takes the rank of its best chunk
+    sources = as_sources([chunks[2], chunks[0], chunks[1]])
+    passages, stats = pack_sources(sources, budget=100000)
+
+    assert len(passages) == 1
+    assert passages[0]["chunk_indices"] == [0, 1, 2]
+    assert stats["chunks_merged"] == 2
+    body = passages[0]["text"]
+    assert body.startswith(chunks[0]["text"])
+    assert body.endswith(chunks[2]["text"][overlap_length(chunks[1]["text"], chunks[2]["text"]):])
+    assert count_tokens(body) < sum(c["token_count"] for c in chunks)
+
+
+def test_same_named_files_in_different_namespaces_stay_apart():
+    first = chunk_text(make_text(400, seed=1), source="report.md", title="Q1 report")[:2]
+    second = chunk_text(make_text(400, seed=2), source="report.md", title="Q2 report")[:2]
+    sources = as_sources([
+        {**first[0], "namespace": "q1"}, {**second[1], "namespace": "q2"}, {**first[1], "namespace": "q1"}
+    ])
+    passages, stats = pack_sources(sources, budget=100000)
+
+    assert [(p["namespace"], p["title"], p["chunk_indices"]) for p in passages] == [
+        ("q1", "Q1 report", [0, 1]), ("q2", "Q2 report", [1])
+    ]
+    assert stats["chunks_merged"] == 1
+    assert second[1]["text"] not in passages[0]["text"]
+
+
+def test_near_duplicates_are_dropped():
+    text = make_text(20)
+    sources = as_sources([
+        {"text": text, "source": "a.md", "title": "A"},
+        {"text": text.replace("model", "models", 1), "source": "b.md", "title": "B"},
+        {"text": make_text(20, seed=1), "source": "c.md", "title": "C"},
+    ])
+    passages, stats = pack_sources(sources, budget=100000)
+    assert [p["source"] for p in passages] == ["a.md", "c.md"]
+    assert stats["duplicates_removed"] == 1
+
+
+def test_budget_keeps_higher_ranked_sources_and_skips_ones_that_dont_fit():
+    sources = as_sources([
+        {"text": make_text(30, seed=1), "source": "a.md", "title": "A"},
+        {"text": make_text(60, seed=2), "source": "b.md", "title": "B"},
+        {"text": make_text(5, seed=3), "source": "c.md", "title": "C"},
+    ])
+    budget = count_tokens(sources[0]["text"]) + count_tokens(sources[2]["text"]) + 5
+    passages, stats = pack_sources(sources, budget=budget)
+    assert [p["source"] for p in passages] == ["a.md", "c.md"]
+    assert stats["dropped_over_budget"] == 1
+    assert stats["context_tokens"] <= budget
+
+
+def test_top_source_is_cut_to_the_budget():
+    passages, stats = pack_sources(as_sources([{"text": make_text(50), "source": "a.md", "title": "A"}]), budget=20)
+    assert stats["truncated"]
+    assert count_tokens(passages[0]["text"]) <= 20
+
+
+def test_prepare_prompt_reports_exact_tokens_saved(monkeypatch):
+    monkeypatch.setattr(context, "CONTEXT_TOKEN_BUDGET", 100000)
+    chunks = chunk_text(make_text(400), source="doc.md")[:3]
+    sources = as_sources(chunks)
+    passages, prompt, stats = prepare_prompt("what about fraud?", sources)
+
+    assert prompt == build_prompt("what about fraud?", passages)
+    assert stats["prompt_tokens"] == count_tokens(prompt)
+    assert stats["tokens_saved"] == count_tokens(build_prompt("what about fraud?", sources)) - count_tokens(prompt)
+    assert stats["tokens_saved"] > 0
+
+
+def test_special_token_text_is_counted_as_ordinary_text():
+    # Documents and queries can contain tiktoken's special-token markers; they're plain text here
+    sources = as_sources([{"text": "Training ended at <|endoftext|> and resumed later.", "source": "a.md", "title": "A"}])
+    passages, prompt, stats = prepare_prompt("what does <|endoftext|> mean?", sources)
+
+    assert "<|endoftext|>" in prompt
+    assert stats["prompt_tokens"] == count_tokens(prompt) > 0
+    assert count_tokens("<|endoftext|>") > 1
@@ -0,0 +1,221 @@
+"""
+Embedder tests against a fake Gemini provider - no network required.
+Run with pytest, or directly to print the batching speedup on a 1,000-chunk document.
+"""
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+from google.api_core import exceptions as google_exceptions
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services import embedder
+from services.embedding_cache import EmbeddingCache
+
+NUM_CHUNKS = 1000
+CALL_LATENCY_S = 0.002
+
+
+class FakeProvider:
+    """Stands in for genai.embed_content with a fixed per-request latency."""
+
+    def __init__(self, latency: float = CALL_LATENCY_S, rate_limit_failures: int = 0):
+        self.latency = latency
+        self.rate_limit_failures = rate_limit_failures
+        self.calls = 0
+
+    def embed_content(self, model, content, task_type=None):
+        self.calls += 1
+        time.sleep(self.latency)
+        if self.rate_limit_failures > 0:
+            self.rate_limit_failures -= 1
+            raise google_exceptions.ResourceExhausted("quota exceeded")
+        if isinstance(content, str):
+            return {"embedding": fake_vector(content)}
+        return {"embedding": [fake_vector(text) for text in content]}
+
+
+def fake_vector(text: str) -> list:
+    return [float(len(text)), float(sum(map(ord, text)) % 997)]
+
+
+def make_document(num_chunks: int = NUM_CHUNKS) -> list:
+    return [f"Chunk {i}: " + "lorem ipsum " * (i % 7 + 1) for i in range(num_chunks)]
+
+
+async def embed_sequential(provider: FakeProvider, texts: list) -> list:
+    """The pre-batching behaviour: one blocking request per chunk."""
+    return [provider.embed_content(model="fake", content=text)["embedding"] for text in texts]
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch):
+    cache = EmbeddingCache(max_entries=10000)
+    monkeypatch.setattr(embedder, "embedding_cache", cache)
+    return cache
+
+
+def test_embed_texts_preserves_order(monkeypatch):
+    provider = FakeProvider(latency=0)
+    monkeypatch.setattr(embedder.genai, "embed_content", provider.embed_content)
+    texts = make_document(250)
+
+    embeddings = asyncio.run(embedder.embed_texts(texts))
+
+    assert embeddings == [fake_vector(t) for t in texts]
+    assert provider.calls == 3
+
+
+def test_embed_texts_retries_rate_limits(monkeypatch):
+    provider = FakeProvider(latency=0, rate_limit_failures=2)
+    monkeypatch.setattr(embedder.genai, "embed_content", provider.embed_content)
+    monkeypatch.setattr(embedder, "EMBED_RETRY_BASE_DELAY", 0.001)
+
+    embeddings = asyncio.run(embedder.embed_texts(["alpha", "beta"]))
+
+    assert embeddings == [fake_vector("alpha"), fake_vector("beta")]
+    assert provider.calls == 3
+
+
+def test_embed_texts_gives_up_after_max_retries(monkeypatch):
+    provider = FakeProvider(latency=0, rate_limit_failures=100)
+    monkeypatch.setattr(embedder.genai, "embed_content", provider.embed_content)
+    monkeypatch.setattr(embedder, "EMBED_RETRY_BASE_DELAY", 0.001)
+
+    try:
+        asyncio.run(embedder.embed_texts(["alpha"]))
+        assert False, "expected ResourceExhausted"
+    except google_exceptions.ResourceExhausted:
+        pass
+    assert provider.calls == embedder.EMBED_MAX_RETRIES + 1
+
+
+def test_reembedding_unchanged_document_hits_cache(monkeypatch, fresh_cache):
+    provider = FakeProvider(latency=0)
+    monkeypatch.setattr(embedder.genai, "embed_content", provider.embed_content)
+    texts = make_document(300)
+
+    asyncio.run(embedder.embed_texts(texts))
+    calls_after_first_ingest = provider.calls
+    # A new version of the document with a single edited chunk
+    edited = texts[:150] + ["An edited paragraph."] + texts[151:]
+    embeddings = asyncio.run(embedder.embed_texts(edited))
+
+    assert embeddings == [fake_vector(t) for t in edited]
+    assert provider.calls == calls_after_first_ingest + 1
+    stats = fresh_cache.stats()
+    assert stats["memory_hits"] == 299
+    assert stats["misses"] == 301
+
+
+def test_cache_key_includes_task_type(monkeypatch):
+    provider = FakeProvider(latency=0)
+    monkeypatch.setattr(embedder.genai, "embed_content", provider.embed_content)
+
+    asyncio.run(embedder.embed_texts(["what is rag"]))
+    asyncio.run(embedder.embed_query("what is rag"))
+    asyncio.run(embedder.embed_query("what is rag"))
+
+    assert provider.calls == 2
+
+
+def test_lru_evicts_least_recently_used():
+    cache = EmbeddingCache(max_entries=2)
+    cache.put_many({"a": [1.0], "b": [2.0]})
+    cache.get_many(["a"])
+    cache.put_many({"c": [3.0]})
+
+    assert set(cache.get_many(["a", "b", "c"])) == {"a", "c"}
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    db_path = str(tmp_path / "cache.sqlite3")
+    EmbeddingCache(max_entries=10, db_path=db_path).put_many({"a": [0.5, 0.25]})
+
+    restarted = EmbeddingCache(max_entries=10, db_path=db_path)
+
+    assert restarted.get_many(["a", "b"]) == {"a": [0.5, 0.25]}
+    assert restarted.stats()["disk_hits"] == 1
+    assert restarted.stats()["misses"] == 1
+
+
+def test_cache_reads_and_writes_run_off_the_event_loop(monkeypatch):
+    class SlowCache(EmbeddingCache):
+        def get_many(self, keys):
+            time.sleep(0.2)
+            return super().get_many(keys)
+
+        def put_many(self, items):
+            time.sleep(0.2)
+            super().put_many(items)
+
+    monkeypatch.setattr(embedder, "embedding_cache", SlowCache(max_entries=10))
+    monkeypatch.setattr(embedder.genai, "embed_content", FakeProvider(latency=0).embed_content)
+
+    async def main():
+        gaps = []
+        done = asyncio.Event()
+
+        async def ticker():
+            last = time.perf_counter()
+            while not done.is_set():
+                await asyncio.sleep(0.01)
+                now = time.perf_counter()
+                gaps.append(now - last)
+                last = now
+
+        ticking = asyncio.create_task(ticker())
+        await embedder.embed_query("what is rag")
+        await embedder.embed_texts(["a chunk", "another chunk"])
+        done.set()
+        await ticking
+        return gaps
+
+    assert max(asyncio.run(main())) < 0.1
+
+
+def measure_speedup() -> dict:
+    """Embed a 1,000-chunk document sequentially and batched, return both timings."""
+    texts = make_document()
+
+    sequential_provider = FakeProvider()
+    start = time.perf_counter()
+    expected = asyncio.run(embed_sequential(sequential_provider, texts))
+    sequential_s = time.perf_counter() - start
+
+    batched_provider = FakeProvider()
+    original = embedder.genai.embed_content, embedder.embedding_cache
+    embedder.genai.embed_content = batched_provider.embed_content
+    embedder.embedding_cache = EmbeddingCache(max_entries=len(texts))
+    try:
+        start = time.perf_counter()
+        embeddings = asyncio.run(embedder.embed_texts(texts))
+        batched_s = time.perf_counter() - start
+    finally:
+        embedder.genai.embed_content, embedder.embedding_cache = original
+
+    assert embeddings == expected
+    return {
+        "chunks": len(texts),
+        "sequential_calls": sequential_provider.calls,
+        "batched_calls": batched_provider.calls,
+        "sequential_s": sequential_s,
+        "batched_s": batched_s,
+        "speedup": sequential_s / batched_s,
+    }
+
+
+def test_batched_embedding_speedup():
+    result = measure_speedup()
+    assert result["batched_calls"] == NUM_CHUNKS // embedder.EMBED_BATCH_SIZE
+    assert result["speedup"] > 10
+
+
+if __name__ == "__main__":
+    result = measure_speedup()
+    print(f"Chunks:     {result['chunks']}")
+    print(f"Sequential: {result['sequential_calls']} calls, {result['sequential_s'] * 1000:.0f}ms")
+    print(f"Batched:    {result['batched_calls']} calls, {result['batched_s'] * 1000:.0f}ms")
+    print(f"Speedup:    {result['speedup']:.1f}x")
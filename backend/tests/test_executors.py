@@ -0,0 +1,63 @@
+"""
+Dependency executor tests: blocking calls run off the event loop, within the pool's limit and timeout.
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services import executors
+
+
+@pytest.fixture(autouse=True)
+def small_pool(monkeypatch):
+    monkeypatch.setitem(executors.DEPENDENCY_POOLS, "test_dependency", {"max_concurrency": 2, "timeout_s": 0.2})
+    yield
+    executors.shutdown_executors()
+
+
+def test_concurrency_is_capped_by_pool_size():
+    active = []
+    peak = []
+    lock = threading.Lock()
+
+    def blocking_call():
+        with lock:
+            active.append(1)
+            peak.append(len(active))
+        time.sleep(0.02)
+        with lock:
+            active.pop()
+
+    async def run():
+        await asyncio.gather(*(executors.run_blocking("test_dependency", blocking_call) for _ in range(6)))
+
+    asyncio.run(run())
+    assert max(peak) == 2
+
+
+def test_event_loop_stays_responsive():
+    ticks = []
+
+    async def ticker():
+        for _ in range(5):
+            ticks.append(time.perf_counter())
+            await asyncio.sleep(0.01)
+
+    async def run():
+        await asyncio.gather(executors.run_blocking("test_dependency", time.sleep, 0.1), ticker())
+
+    asyncio.run(run())
+    assert ticks[-1] - ticks[0] < 0.09
+
+
+def test_slow_calls_time_out():
+    async def run():
+        await executors.run_blocking("test_dependency", time.sleep, 1)
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(run())
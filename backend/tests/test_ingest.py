@@ -0,0 +1,246 @@
+"""
+Streaming ingest tests: paragraph splitting across piece boundaries, incremental decoding and the
+chunk -> embed -> upsert pipeline with bounded queues.
+"""
+import asyncio
+import io
+import os
+import random
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services import ingest
+from services.chunker import chunk_text, iter_paragraphs
+from services.manifest import ChunkManifest
+from services.vector_store import chunk_id
+from test_chunker import make_document
+
+
+def split_randomly(text: str, rng: random.Random):
+    cuts = sorted(rng.sample(range(len(text)), min(len(text), 50)))
+    return [text[start:end] for start, end in zip([0] + cuts, cuts + [len(text)])]
+
+
+def test_paragraphs_match_splitting_the_whole_text():
+    rng = random.Random(0)
+    for seed in range(20):
+        text = make_document(30, seed) + rng.choice(["", "\n", "\n\n", "\n\n\n"])
+        expected = [p.strip() for p in text.split("\n\n") if p.strip()]
+        assert list(iter_paragraphs(split_randomly(text, rng))) == expected
+
+
+def test_empty_pieces_dont_hide_a_paragraph_break():
+    assert list(iter_paragraphs(["a\n", "", "\nb"])) == ["a", "b"]
+    assert list(iter_paragraphs(["a\n", "", "", "\n", "b"])) == ["a", "b"]
+
+
+def test_pdf_pages_are_separate_paragraphs():
+    pages = ["First page\n", "", "\nSecond page", "Third\n\n\npage"]
+    expected = [p.strip() for p in "\n\n".join(pages).split("\n\n") if p.strip()]
+    assert list(iter_paragraphs(ingest.iter_pdf_pages(pages))) == expected
+
+
+def test_text_file_decodes_characters_split_across_blocks():
+    text = "naïve café 東京 🙂\n\n" * 100
+    assert "".join(ingest.iter_text_file(io.BytesIO(text.encode("utf-8")), block_size=7)) == text
+    with pytest.raises(UnicodeDecodeError):
+        list(ingest.iter_text_file(io.BytesIO(b"ok \xff"), block_size=2))
+
+
+@pytest.fixture
+def fake_pipeline(monkeypatch):
+    state = {"upserted": [], "deleted": [], "fail_on_batch": None}
+
+    async def fake_embed_texts(texts):
+        await asyncio.sleep(0.001)
+        if state["fail_on_batch"] is not None and len(state["upserted"]) >= state["fail_on_batch"]:
+            raise RuntimeError("embedding service unavailable")
+        return [[float(len(text)), 1.0] for text in texts]
+
+    async def fake_upsert_vectors(embeddings, chunks, namespace=None):
+        await asyncio.sleep(0.002)
+        state["upserted"].append((namespace, chunks))
+        return {"namespace": namespace, "vectors_upserted": len(chunks)}
+
+    async def fake_delete_namespace(namespace):
+        state["deleted"].append(namespace)
+
+    async def fake_delete_vectors(ids, namespace):
+        state["deleted_vectors"].extend(ids)
+
+    state["deleted_vectors"] = []
+    monkeypatch.setattr(ingest, "embed_texts", fake_embed_texts)
+    monkeypatch.setattr(ingest, "upsert_vectors", fake_upsert_vectors)
+    monkeypatch.setattr(ingest, "delete_namespace", fake_delete_namespace)
+    monkeypatch.setattr(ingest, "delete_vectors", fake_delete_vectors)
+    monkeypatch.setattr(ingest, "chunk_manifest", ChunkManifest(":memory:"))
+    monkeypatch.setattr(ingest, "INGEST_BATCH_CHUNKS", 5)
+    return state
+
+
+def test_pipeline_indexes_every_chunk_in_batches(fake_pipeline):
+    text = make_document(200, seed=3)
+    result = asyncio.run(ingest.ingest_document(split_randomly(text, random.Random(1)), "doc.md", "Doc", namespace="docs"))
+
+    expected = chunk_text(text, "doc.md", "Doc")
+    upserted = sorted((c for _, batch in fake_pipeline["upserted"] for c in batch), key=lambda c: c["chunk_index"])
+    assert upserted == expected
+    assert all(namespace == "docs" and len(batch) <= 5 for namespace, batch in fake_pipeline["upserted"])
+    assert result["chunks_created"] == result["vectors_upserted"] == len(expected)
+    assert result["avg_chunk_tokens"] == sum(c["token_count"] for c in expected) // len(expected)
+
+
+def test_reading_stays_a_bounded_distance_ahead_of_upserts(fake_pipeline, monkeypatch):
+    produced, max_lead = [0], [0]
+    next_batch = ingest._next_batch
+
+    def tracking_next_batch(chunks, size):
+        batch = next_batch(chunks, size)
+        produced[0] += len(batch)
+        upserted = sum(len(b) for _, b in fake_pipeline["upserted"])
+        max_lead[0] = max(max_lead[0], produced[0] - upserted)
+        return batch
+
+    monkeypatch.setattr(ingest, "_next_batch", tracking_next_batch)
+    asyncio.run(ingest.ingest_document([make_document(400, seed=6)], "doc.md", "Doc", namespace="docs"))
+
+    # Two queues, the embed workers, the upserter and the batch being read
+    bound = (2 * ingest.INGEST_QUEUE_BATCHES + ingest.INGEST_EMBED_WORKERS + 2) * ingest.INGEST_BATCH_CHUNKS
+    assert produced[0] > 2 * bound
+    assert max_lead[0] <= bound
+
+
+def test_pipeline_resolves_namespace_up_front(fake_pipeline):
+    result = asyncio.run(ingest.ingest_document([make_document(100, seed=4)], "doc.md", "Doc"))
+
+    namespaces = {namespace for namespace, _ in fake_pipeline["upserted"]}
+    assert len(fake_pipeline["upserted"]) > 1
+    assert namespaces == {result["namespace"]}
+
+
+def test_failure_removes_a_generated_namespace(fake_pipeline):
+    fake_pipeline["fail_on_batch"] = 2
+    with pytest.raises(RuntimeError):
+        asyncio.run(ingest.ingest_document([make_document(100, seed=5)], "doc.md", "Doc"))
+    assert fake_pipeline["deleted"] == [fake_pipeline["upserted"][0][0]]
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(ingest.ingest_document([make_document(100, seed=5)], "doc.md", "Doc", namespace="shared"))
+    assert "shared" not in fake_pipeline["deleted"]
+
+
+def test_short_content_is_rejected(fake_pipeline):
+    for pieces in [[""], ["  \n\n  "], ["too", " short"]]:
+        with pytest.raises(ingest.EmptyDocumentError):
+            asyncio.run(ingest.ingest_document(pieces, "direct_input", "Untitled"))
+    assert fake_pipeline["upserted"] == []
+
+
+def test_chunk_ids_depend_only_on_source_and_text():
+    chunk = {"text": "Pumps must be primed.", "source": "manual.pdf", "chunk_index": 0}
+    assert chunk_id(chunk) == chunk_id({**chunk, "chunk_index": 5, "title": "Other"})
+    assert chunk_id(chunk) != chunk_id({**chunk, "source": "other.pdf"})
+    assert chunk_id(chunk) != chunk_id({**chunk, "text": "Pumps must be primed!"})
+
+
+def test_reupload_only_upserts_changed_or_moved_chunks_and_deletes_removed_ones(fake_pipeline):
+    paragraphs = make_document(300, seed=7).split("\n\n")
+    original = "\n\n".join(paragraphs)
+    edited = "\n\n".join(paragraphs[:100] + ["A completely rewritten paragraph about priming pumps."] + paragraphs[120:])
+
+    def upload(text):
+        fake_pipeline["upserted"].clear()
+        result = asyncio.run(ingest.ingest_document([text], "manual.md", "Manual", namespace="docs", replace=True))
+        return result, [c for _, batch in fake_pipeline["upserted"] for c in batch]
+
+    first, embedded = upload(original)
+    assert first["vectors_upserted"] == first["chunks_created"] and first["chunks_deleted"] == 0
+
+    again, embedded = upload(original)
+    assert embedded == [] and again["chunks_unchanged"] == again["chunks_created"]
+    assert fake_pipeline["deleted_vectors"] == []
+
+    edit, embedded = upload(edited)
+    old_positions = {chunk_id(c): c["chunk_index"] for c in chunk_text(original, "manual.md", "Manual")}
+    new_positions = {chunk_id(c): c["chunk_index"] for c in chunk_text(edited, "manual.md", "Manual")}
+    new_ids, old_ids = set(new_positions), set(old_positions)
+    moved = {i for i in new_ids & old_ids if new_positions[i] != old_positions[i]}
+    assert new_ids - old_ids and moved
+    # Chunks after the edit moved up, so they're upserted again to keep their chunk_index right
+    assert {chunk_id(c) for c in embedded} == (new_ids - old_ids) | moved
+    assert all(c["chunk_index"] == new_positions[chunk_id(c)] for c in embedded)
+    assert edit["chunks_unchanged"] == len(new_ids & old_ids) - len(moved) > 0
+    assert set(fake_pipeline["deleted_vectors"]) == old_ids - new_ids
+    assert ingest.chunk_manifest.positions("docs", "manual.md") == new_positions
+
+
+def test_manifest_written_without_positions_reads_as_moved(tmp_path):
+    db_path = str(tmp_path / "manifest.sqlite3")
+    db = sqlite3.connect(db_path)
+    db.execute(
+        "CREATE TABLE chunks (namespace TEXT NOT NULL, source TEXT NOT NULL, chunk_id TEXT NOT NULL, "
+        "PRIMARY KEY (namespace, source, chunk_id)) WITHOUT ROWID"
+    )
+    db.execute("INSERT INTO chunks VALUES ('docs', 'manual.md', 'abc')")
+    db.commit()
+    db.close()
+
+    manifest = ChunkManifest(db_path)
+    assert manifest.positions("docs", "manual.md") == {"abc": None}
+    manifest.add("docs", "manual.md", {"abc": 4})
+    assert manifest.positions("docs", "manual.md") == {"abc": 4}
+
+def test_additions_without_replace_keep_existing_chunks(fake_pipeline):
+    for seed in (8, 9):
+        asyncio.run(ingest.ingest_document([make_document(50, seed)], "direct_input", "Untitled", namespace="docs"))
+    assert fake_pipeline["deleted_vectors"] == []
+    expected = {chunk_id(c) for seed in (8, 9) for c in chunk_text(make_document(50, seed), "direct_input", "Untitled")}
+    assert ingest.chunk_manifest.chunk_ids("docs", "direct_input") == expected
+
+
+def test_documents_share_full_embedding_batches(fake_pipeline, monkeypatch):
+    batch_sizes = []
+    embed_texts = ingest.embed_texts
+
+    async def recording_embed_texts(texts):
+        batch_sizes.append(len(texts))
+        return await embed_texts(texts)
+
+    monkeypatch.setattr(ingest, "embed_texts", recording_embed_texts)
+    notes = [f"# Note {n}\n\nThe pump model P-{n} must be primed before its first use." for n in range(23)]
+    documents = [{"pieces": [note], "source": f"notes/{n}.md", "title": str(n)} for n, note in enumerate(notes)]
+    result = asyncio.run(ingest.ingest_documents(documents, namespace="docs"))
+
+    expected = [chunk_text(note, f"notes/{n}.md", str(n)) for n, note in enumerate(notes)]
+    # Each note is a single chunk, yet every batch but the last is full
+    assert [len(chunks) for chunks in expected] == [1] * 23
+    assert batch_sizes == [5, 5, 5, 5, 3]
+    assert [d["source"] for d in result["documents"]] == [f"notes/{n}.md" for n in range(23)]
+    assert all(d["chunks_created"] == d["vectors_upserted"] == 1 for d in result["documents"])
+    for n in range(23):
+        assert ingest.chunk_manifest.chunk_ids("docs", f"notes/{n}.md") == {chunk_id(expected[n][0])}
+
+
+def test_unreadable_document_is_reported_and_its_chunks_removed(fake_pipeline):
+    def broken_pieces():
+        yield make_document(40, seed=11)
+        raise UnicodeDecodeError("utf-8", b"\xff", 0, 1, "invalid start byte")
+
+    documents = [
+        {"pieces": [make_document(40, seed=10)], "source": "good.md", "title": "Good"},
+        {"pieces": broken_pieces(), "source": "broken.md", "title": "Broken"},
+        {"pieces": ["   "], "source": "empty.md", "title": "Empty"},
+    ]
+    result = asyncio.run(ingest.ingest_documents(documents, namespace="docs"))
+
+    good, broken, empty = result["documents"]
+    assert good["error"] is None and good["vectors_upserted"] == good["chunks_created"]
+    assert "invalid start byte" in broken["error"]
+    assert empty["error"] == "Content too short"
+    assert ingest.chunk_manifest.chunk_ids("docs", "broken.md") == set()
+    broken_ids = {chunk_id(c) for _, batch in fake_pipeline["upserted"] for c in batch if c["source"] == "broken.md"}
+    assert set(fake_pipeline["deleted_vectors"]) == broken_ids
+    assert fake_pipeline["deleted"] == []
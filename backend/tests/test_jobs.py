@@ -0,0 +1,175 @@
+"""
+Ingestion job tests: uploads run as queued jobs, progress and results are persisted, and jobs left
+behind by a restart are re-run or failed depending on whose namespace they were writing to.
+"""
+import asyncio
+import os
+import sys
+
+import pytest
+from fastapi import HTTPException
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services import ingest, jobs
+from services.chunker import chunk_text
+from services.vector_store import chunk_id
+from routers.jobs import job_status
+from test_chunker import make_document
+from test_ingest import fake_pipeline  # noqa: F401
+from test_pdf_extractor import make_pdf, make_manual
+
+
+@pytest.fixture
+def job_env(fake_pipeline, monkeypatch, tmp_path):  # noqa: F811
+    monkeypatch.setattr(jobs, "job_store", jobs.JobStore(str(tmp_path / "jobs.sqlite3")))
+    monkeypatch.setattr(jobs, "UPLOADS_DIR", str(tmp_path / "uploads"))
+    monkeypatch.setattr(jobs, "_queue", None)
+    monkeypatch.setattr(jobs, "_workers", [])
+    monkeypatch.setattr(jobs, "_finished", {})
+    fake_pipeline["tmp_path"] = tmp_path
+    return fake_pipeline
+
+
+def save_text(job_id: str, text: str) -> str:
+    path = jobs.upload_path(job_id, ".txt")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+    return path
+
+
+def run_jobs(*texts, namespace=None):
+    async def main():
+        submitted = []
+        for text in texts:
+            job_id = jobs.new_job_id()
+            submitted.append(await jobs.submit_job(job_id, "text", save_text(job_id, text), "doc.md", "Doc", namespace))
+        finished = [await jobs.wait_for_job(job["id"]) for job in submitted]
+        await jobs.stop_job_workers()
+        return submitted, finished
+
+    return asyncio.run(main())
+
+
+def test_job_runs_in_the_background_and_records_its_result(job_env):
+    text = make_document(100, seed=1)
+    [queued], [job] = run_jobs(text)
+
+    assert queued["status"] == "queued" and queued["namespace"].startswith("doc_")
+    assert job["status"] == "completed"
+    assert job["result"]["namespace"] == queued["namespace"]
+    assert job["chunks_done"] == job["result"]["chunks_created"] == sum(len(b) for _, b in job_env["upserted"])
+    assert not os.path.exists(job["file_path"])
+
+    status = asyncio.run(job_status(job["id"]))
+    assert status["status"] == "completed" and status["stage"] is None
+    assert status["chunks_done"] == job["chunks_done"]
+    assert status["elapsed_ms"] >= 0 and status["stats"] == job["result"]
+
+
+def test_pdf_job_indexes_every_page(job_env):
+    path = jobs.upload_path("manual", ".pdf")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(make_pdf(make_manual(5)))
+
+    async def main():
+        await jobs.submit_job("manual", "pdf", path, "manual.pdf", "Manual", None)
+        job = await jobs.wait_for_job("manual")
+        await jobs.stop_job_workers()
+        return job
+
+    job = asyncio.run(main())
+    assert job["status"] == "completed"
+    text = " ".join(c["text"] for _, batch in job_env["upserted"] for c in batch)
+    assert "Section 0.0" in text and "Section 4.39" in text
+
+
+def test_batch_job_reports_each_document(job_env):
+    directory = jobs.upload_path("batch", "")
+    files = {"guide/setup.md": make_document(30, seed=4), "notes.txt": "too short", "guide/faq.md": make_document(10, seed=5)}
+    for name, text in files.items():
+        os.makedirs(os.path.dirname(os.path.join(directory, name)), exist_ok=True)
+        with open(os.path.join(directory, name), "w", encoding="utf-8") as f:
+            f.write(text)
+
+    async def main():
+        await jobs.submit_job("batch", "batch", directory, "batch", "3 documents", None)
+        job = await jobs.wait_for_job("batch")
+        await jobs.stop_job_workers()
+        return job
+
+    job = asyncio.run(main())
+    assert job["status"] == "completed"
+    documents = job["result"]["documents"]
+    assert [d["source"] for d in documents] == ["guide/faq.md", "guide/setup.md", "notes.txt"]
+    assert [d["title"] for d in documents] == ["faq", "setup", "notes"]
+    assert documents[2]["error"] == "Content too short"
+    for d in documents[:2]:
+        assert d["error"] is None
+        assert d["chunks_created"] == len(chunk_text(files[d["source"]], d["source"], d["title"]))
+    assert job["result"]["chunks_created"] == job["chunks_done"] == sum(d["chunks_created"] for d in documents)
+    assert not os.path.exists(directory)
+
+
+def test_failed_jobs_keep_the_error_and_its_status(job_env):
+    _, [empty] = run_jobs("   ")
+    assert empty["status"] == "failed" and empty["error_status"] == 400
+    assert empty["error"] == "Content too short"
+
+    job_env["fail_on_batch"] = 0
+    _, [broken] = run_jobs(make_document(100, seed=2))
+    assert broken["status"] == "failed" and broken["error_status"] == 500
+    assert "embedding service unavailable" in broken["error"]
+    assert job_env["deleted"][-1] == broken["namespace"]
+    assert not os.path.exists(broken["file_path"])
+
+
+def test_unknown_job_is_a_404(job_env):
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(job_status("missing"))
+    assert exc.value.status_code == 404
+
+
+def test_restart_requeues_unfinished_jobs(job_env):
+    store = jobs.JobStore(str(job_env["tmp_path"] / "jobs.sqlite3"))
+    text = make_document(60, seed=3)
+    for job_id, status, namespace, created in [
+        ("queued", "queued", "doc_a", True),
+        ("own_namespace", "running", "doc_b", True),
+        ("shared_namespace", "running", "shared", False),
+    ]:
+        store.create({
+            "id": job_id, "status": status, "kind": "text", "source": f"{job_id}.md", "title": "Doc",
+            "namespace": namespace, "created_namespace": created, "file_path": save_text(job_id, text),
+            "chunks_done": 7 if status == "running" else 0, "created_at": 1.0
+        })
+    # The interrupted job had already upserted its first chunks
+    first_chunks = chunk_text(text, "shared_namespace.md", "Doc")[:3]
+    ingest.chunk_manifest.add("shared", "shared_namespace.md", {chunk_id(c): c["chunk_index"] for c in first_chunks})
+
+    async def main():
+        await jobs.start_job_workers()
+        finished = [await jobs.wait_for_job(job_id) for job_id in ["queued", "own_namespace", "shared_namespace"]]
+        await jobs.stop_job_workers()
+        return finished
+
+    finished = asyncio.run(main())
+    assert all(job["status"] == "completed" for job in finished)
+    assert all(job["chunks_done"] == job["result"]["chunks_created"] for job in finished)
+    assert {namespace for namespace, _ in job_env["upserted"]} == {"doc_a", "doc_b", "shared"}
+    # Resuming skips what was indexed before the restart
+    shared = finished[2]["result"]
+    assert shared["chunks_unchanged"] == 3 and shared["chunks_embedded"] == shared["chunks_created"] - 3
+    assert job_env["deleted"] == []
+
+
+def test_finished_jobs_are_purged_after_retention(job_env):
+    store = jobs.job_store
+    for job_id, finished_at in [("old", 100.0), ("new", 1000.0)]:
+        store.create({
+            "id": job_id, "status": "completed", "kind": "text", "namespace": "ns", "created_namespace": False,
+            "chunks_done": 0, "created_at": 1.0, "finished_at": finished_at
+        })
+    assert store.purge(500.0) == 1
+    assert store.get("old") is None and store.get("new")["status"] == "completed"
@@ -0,0 +1,106 @@
+"""
+Lexical index tests: varint postings, BM25 against the reranker's scalar scorer, deletes and persistence.
+"""
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.lexical_index import LexicalIndex, encode_varint, decode_varints
+from services.reranker import build_rerank_features, compute_bm25, tokenize
+
+VOCABULARY = [
+    "embedding", "vector", "retrieval", "pinecone", "gemini", "chunk", "token", "rerank",
+    "namespace", "cache", "latency", "kubernetes", "python", "fastapi", "cosine", "bm25"
+]
+
+
+def make_docs(count: int, seed: int = 0, prefix: str = "d"):
+    rng = random.Random(seed)
+    docs = []
+    for i in range(count):
+        text = " ".join(rng.choice(VOCABULARY) for _ in range(rng.randint(5, 60)))
+        docs.append({"id": f"{prefix}{i}", "text": text, **build_rerank_features(text)})
+    return docs
+
+
+def reference_search(docs, query, top_k):
+    doc_tokens = [tokenize(doc["text"]) for doc in docs]
+    avg_doc_len = sum(len(tokens) for tokens in doc_tokens) / len(docs)
+    doc_freq = {}
+    for tokens in doc_tokens:
+        for term in set(tokens):
+            doc_freq[term] = doc_freq.get(term, 0) + 1
+    query_tokens = list(dict.fromkeys(tokenize(query)))
+    scored = [
+        (doc["id"], compute_bm25(query_tokens, tokens, avg_doc_len, doc_freq, len(docs)))
+        for doc, tokens in zip(docs, doc_tokens)
+    ]
+    scored = [item for item in scored if item[1] > 0]
+    scored.sort(key=lambda item: -item[1])
+    return scored[:top_k]
+
+
+def test_varint_round_trip():
+    values = [0, 1, 127, 128, 300, 16383, 16384, 2 ** 31 + 5]
+    buffer = bytearray()
+    for value in values:
+        encode_varint(value, buffer)
+    assert decode_varints(buffer).tolist() == values
+    assert len(decode_varints(bytearray())) == 0
+
+
+def test_search_matches_reference_bm25():
+    index = LexicalIndex(None)
+    docs = make_docs(300)
+    index.add("docs", docs)
+
+    for query in ["pinecone latency", "How does BM25 rerank a chunk?", "gemini embedding vector cosine"]:
+        hits = index.search("docs", query, 10)
+        expected = reference_search(docs, query, 10)
+        assert [hit["id"] for hit in hits] == [doc_id for doc_id, _ in expected]
+        assert [hit["score"] for hit in hits] == pytest.approx([score for _, score in expected])
+
+    assert index.search("docs", "unrelated words only", 10) == []
+    assert index.search("missing", "pinecone", 10) == []
+
+
+def test_replace_delete_and_reload(tmp_path):
+    index = LexicalIndex(str(tmp_path))
+    docs = make_docs(50)
+    index.add("docs", docs)
+
+    replacement = {"id": "d3", "text": "zebra zebra", **build_rerank_features("zebra zebra")}
+    index.add("docs", [replacement])
+    index.delete("docs", ["d4", "unknown"])
+    survivors = [replacement if doc["id"] == "d3" else doc for doc in docs if doc["id"] != "d4"]
+
+    reopened = LexicalIndex(str(tmp_path))
+    for candidate in (index, reopened):
+        assert [hit["id"] for hit in candidate.search("docs", "zebra", 5)] == ["d3"]
+        hits = candidate.search("docs", "retrieval namespace", 10)
+        assert [hit["id"] for hit in hits] == [doc_id for doc_id, _ in reference_search(survivors, "retrieval namespace", 10)]
+
+
+def test_compaction_keeps_results(tmp_path):
+    index = LexicalIndex(str(tmp_path))
+    docs = make_docs(100)
+    index.add("docs", docs)
+    index.delete("docs", [doc["id"] for doc in docs[:70]])
+
+    survivors = docs[70:]
+    expected = [doc_id for doc_id, _ in reference_search(survivors, "fastapi token cache", 10)]
+    assert index.stats()["documents"] == 30
+    assert [hit["id"] for hit in index.search("docs", "fastapi token cache", 10)] == expected
+    assert [hit["id"] for hit in LexicalIndex(str(tmp_path)).search("docs", "fastapi token cache", 10)] == expected
+
+
+def test_delete_namespace(tmp_path):
+    index = LexicalIndex(str(tmp_path))
+    index.add("a b/c", make_docs(5))
+    index.delete_namespace("a b/c")
+
+    assert index.search("a b/c", "pinecone", 5) == []
+    assert LexicalIndex(str(tmp_path)).search("a b/c", "pinecone", 5) == []
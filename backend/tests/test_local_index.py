@@ -0,0 +1,114 @@
+"""
+Local vector index tests: exact top-k, updates and deletes, persistence, int8 quantization and IVF recall.
+"""
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.local_index import LocalVectorIndex
+
+DIM = 32
+
+
+def make_vectors(count: int, seed: int = 0, prefix: str = "v"):
+    rng = np.random.default_rng(seed)
+    values = rng.normal(size=(count, DIM)).astype(np.float32)
+    return [
+        {"id": f"{prefix}{i}", "values": values[i].tolist(), "metadata": {"text": f"chunk {i}"}}
+        for i in range(count)
+    ]
+
+
+def brute_force(vectors, query, top_k):
+    matrix = np.asarray([v["values"] for v in vectors], dtype=np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    scores = matrix @ (np.asarray(query, dtype=np.float32) / np.linalg.norm(query))
+    return [vectors[i]["id"] for i in np.argsort(-scores, kind="stable")[:top_k]]
+
+
+def test_query_matches_brute_force(tmp_path):
+    index = LocalVectorIndex(str(tmp_path))
+    vectors = make_vectors(500)
+    index.upsert(vectors, "docs")
+
+    for query in make_vectors(5, seed=1, prefix="q"):
+        matches = index.query(query["values"], 10, "docs")
+        assert [m["id"] for m in matches] == brute_force(vectors, query["values"], 10)
+        assert matches[0]["metadata"]["text"].startswith("chunk ")
+
+    assert index.query(vectors[0]["values"], 5, "missing") == []
+
+
+def test_update_delete_and_reload(tmp_path):
+    index = LocalVectorIndex(str(tmp_path))
+    vectors = make_vectors(20)
+    index.upsert(vectors, "docs")
+
+    target = vectors[3]["values"]
+    index.upsert([{"id": "v7", "values": target, "metadata": {"text": "moved"}}], "docs")
+    index.delete(["v3"], "docs")
+
+    top = index.query(target, 1, "docs")[0]
+    assert (top["id"], top["metadata"]["text"]) == ("v7", "moved")
+
+    reopened = LocalVectorIndex(str(tmp_path))
+    assert reopened.query(target, 1, "docs")[0]["id"] == "v7"
+    assert reopened.fetch(["v3", "v7"], "docs").keys() == {"v7"}
+    assert reopened.describe_stats()["total_vectors"] == 19
+
+
+def test_delete_compacts_and_keeps_results(tmp_path):
+    index = LocalVectorIndex(str(tmp_path))
+    vectors = make_vectors(100)
+    index.upsert(vectors, "docs")
+    index.delete([v["id"] for v in vectors[:80]], "docs")
+
+    survivors = vectors[80:]
+    query = make_vectors(1, seed=2, prefix="q")[0]["values"]
+    assert [m["id"] for m in index.query(query, 5, "docs")] == brute_force(survivors, query, 5)
+    assert os.path.getsize(tmp_path / "ns_docs" / "vectors.f32") == len(survivors) * DIM * 4
+
+    reopened = LocalVectorIndex(str(tmp_path))
+    assert [m["id"] for m in reopened.query(query, 5, "docs")] == brute_force(survivors, query, 5)
+
+
+def test_quantized_index_keeps_ranking(tmp_path):
+    index = LocalVectorIndex(str(tmp_path), quantize=True)
+    vectors = make_vectors(1000)
+    index.upsert(vectors, "docs")
+
+    recalled = 0
+    for query in make_vectors(20, seed=3, prefix="q"):
+        expected = set(brute_force(vectors, query["values"], 10))
+        recalled += len(expected & {m["id"] for m in index.query(query["values"], 10, "docs")})
+    assert recalled / 200 >= 0.9
+    assert os.path.getsize(tmp_path / "ns_docs" / "vectors.i8") == 1000 * DIM
+
+
+def test_ann_recall_against_exact_search(tmp_path):
+    rng = np.random.default_rng(4)
+    centers = rng.normal(size=(40, DIM))
+    values = centers[rng.integers(0, 40, size=4000)] + 0.3 * rng.normal(size=(4000, DIM))
+    vectors = [{"id": f"v{i}", "values": values[i].tolist(), "metadata": {}} for i in range(4000)]
+
+    index = LocalVectorIndex(str(tmp_path), ann_min_vectors=1000, nprobe=8)
+    index.upsert(vectors, "docs")
+
+    recalled = 0
+    for query in values[:50] + 0.1 * rng.normal(size=(50, DIM)):
+        expected = set(brute_force(vectors, query, 10))
+        recalled += len(expected & {m["id"] for m in index.query(query.tolist(), 10, "docs")})
+    assert recalled / 500 >= 0.9
+
+
+def test_delete_namespace(tmp_path):
+    index = LocalVectorIndex(str(tmp_path))
+    index.upsert(make_vectors(5), "a b/c")
+    index.upsert(make_vectors(3), "other")
+    assert index.describe_stats() == {"total_vectors": 8, "namespaces": ["a b/c", "other"]}
+
+    index.delete_namespace("a b/c")
+    assert index.describe_stats() == {"total_vectors": 3, "namespaces": ["other"]}
+    assert index.query(make_vectors(1)[0]["values"], 5, "a b/c") == []
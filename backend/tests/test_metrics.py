@@ -0,0 +1,93 @@
+"""
+Metrics and logging tests: dependency calls are counted by outcome, stages land in their
+histograms, and routine log events are sampled while warnings never are.
+"""
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+
+import pytest
+from prometheus_client import REGISTRY
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services import executors, ingest, logs, metrics
+from services.logs import JsonFormatter, log_event
+from test_ingest import fake_pipeline  # noqa: F401
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+@pytest.fixture(autouse=True)
+def small_pool(monkeypatch):
+    monkeypatch.setitem(executors.DEPENDENCY_POOLS, "metrics_dependency", {"max_concurrency": 1, "timeout_s": 0.1})
+    yield
+    executors.shutdown_executors()
+
+
+def test_dependency_calls_are_counted_by_outcome():
+    def fail():
+        raise RuntimeError("down")
+
+    before = {outcome: sample("rag_dependency_calls_total", dependency="metrics_dependency", outcome=outcome)
+              for outcome in ("ok", "error", "timeout")}
+    asyncio.run(executors.run_blocking("metrics_dependency", lambda: 1))
+    with pytest.raises(RuntimeError):
+        asyncio.run(executors.run_blocking("metrics_dependency", fail))
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(executors.run_blocking("metrics_dependency", time.sleep, 0.3))
+
+    for outcome in ("ok", "error", "timeout"):
+        after = sample("rag_dependency_calls_total", dependency="metrics_dependency", outcome=outcome)
+        assert after == before[outcome] + 1
+    assert sample("rag_dependency_call_seconds_count", dependency="metrics_dependency") >= 3
+
+
+def test_observe_records_the_stage():
+    before = sample("rag_query_stage_seconds_count", stage="rerank")
+    assert asyncio.run(metrics.observe("rerank", asyncio.sleep(0.01, result="done"))) == "done"
+    assert sample("rag_query_stage_seconds_count", stage="rerank") == before + 1
+    assert b'rag_query_stage_seconds_bucket{le="0.025",stage="rerank"}' in metrics.render()[0]
+
+
+def test_ingest_observes_every_stage(fake_pipeline):  # noqa: F811
+    stages = ("extract", "chunk", "embed", "upsert")
+    before = {stage: sample("rag_ingest_stage_seconds_count", stage=stage) for stage in stages}
+    tokens = sample("rag_tokens_total", kind="embedded")
+    result = asyncio.run(ingest.ingest_document(["A paragraph about pumps.\n\n" * 40], "doc.md", "Doc", namespace="docs"))
+
+    for stage in stages:
+        assert sample("rag_ingest_stage_seconds_count", stage=stage) > before[stage]
+    upserted = [c for _, batch in fake_pipeline["upserted"] for c in batch]
+    assert result["vectors_upserted"] == len(upserted)
+    assert sample("rag_tokens_total", kind="embedded") == tokens + sum(c["token_count"] for c in upserted)
+
+
+def test_log_events_are_sampled_json(monkeypatch):
+    records = []
+
+    class Capture(logging.Handler):
+        def emit(self, record):
+            records.append(JsonFormatter().format(record))
+
+    handler = Capture()
+    level = logs.logger.level
+    logs.logger.addHandler(handler)
+    logs.logger.setLevel(logging.INFO)
+    monkeypatch.setattr(logs, "LOG_SAMPLE_RATE", 0.0)
+    try:
+        log_event("query.retrieved", retrieved=3)
+        log_event("query.failed", level=logging.ERROR, error="boom")
+        log_event("ingest.job_finished", sample_rate=1.0, chunks=5)
+    finally:
+        logs.logger.removeHandler(handler)
+        logs.logger.setLevel(level)
+
+    entries = [json.loads(record) for record in records]
+    assert [e["event"] for e in entries] == ["query.failed", "ingest.job_finished"]
+    assert entries[0]["level"] == "error" and entries[0]["error"] == "boom" and entries[0]["sample_rate"] == 1.0
+    assert entries[1]["chunks"] == 5
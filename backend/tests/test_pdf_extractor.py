@@ -0,0 +1,144 @@
+"""
+PDF extraction tests: page ranges extracted in the process pool come back in page order, and one
+upload never has more than its share of extraction tasks in flight.
+"""
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from pypdf import PdfReader
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services import pdf_extractor
+
+
+def _pdf_string(text: str) -> str:
+    return "(" + text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") + ")"
+
+
+def make_pdf(pages) -> bytes:
+    """A minimal uncompressed PDF with one Helvetica text line per string in each page's list."""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for lines in pages:
+        content = "BT /F1 10 Tf 12 TL 50 750 Td " + " ".join(f"{_pdf_string(line)} Tj T*" for line in lines) + " ET"
+        objects.append(f"<< /Length {len(content)} >>\nstream\n{content}\nendstream")
+        objects.append(
+            "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>"
+        )
+        kids.append(len(objects))
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(f'{kid} 0 R' for kid in kids)}] /Count {len(kids)} >>"
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return bytes(out)
+
+
+def make_manual(page_count: int, lines_per_page: int = 40):
+    return [
+        [f"Section {page}.{line}: the pump (model P-{page % 7}) must be primed before use." for line in range(lines_per_page)]
+        for page in range(page_count)
+    ]
+
+
+def write_pdf(tmp_path, pages) -> str:
+    path = str(tmp_path / "manual.pdf")
+    with open(path, "wb") as f:
+        f.write(make_pdf(pages))
+    return path
+
+
+class TrackingPool:
+    """Runs tasks on threads and records how many were outstanding at once."""
+
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(max_workers=8)
+        self.lock = threading.Lock()
+        self.outstanding = 0
+        self.peak = 0
+        self.submitted = 0
+
+    def submit(self, fn, *args):
+        with self.lock:
+            self.outstanding += 1
+            self.submitted += 1
+            self.peak = max(self.peak, self.outstanding)
+        future = self.executor.submit(fn, *args)
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future):
+        with self.lock:
+            self.outstanding -= 1
+
+
+def sequential_pages(path: str):
+    return [page.extract_text() or "" for page in PdfReader(path).pages]
+
+
+def test_process_pool_returns_pages_in_order(tmp_path, monkeypatch):
+    monkeypatch.setattr(pdf_extractor, "PDF_PAGES_PER_TASK", 3)
+    monkeypatch.setattr(pdf_extractor, "PDF_PARALLEL_MIN_PAGES", 4)
+    path = write_pdf(tmp_path, make_manual(40, lines_per_page=5))
+    try:
+        pages = list(pdf_extractor.extract_pages(path, 40, tasks_per_upload=4))
+    finally:
+        pdf_extractor.shutdown_pdf_extractor()
+
+    assert pages == sequential_pages(path)
+    assert "Section 39.4" in pages[39]
+
+
+def fake_extract_range(path, start, end):
+    time.sleep(0.001)
+    return [f"page {i}" for i in range(start, end)]
+
+
+def test_each_upload_keeps_a_bounded_number_of_tasks_in_flight(monkeypatch):
+    pool = TrackingPool()
+    monkeypatch.setattr(pdf_extractor, "get_pool", lambda: pool)
+    # Only the scheduling is under test here; real extraction is covered with the process pool above
+    monkeypatch.setattr(pdf_extractor, "_extract_range", fake_extract_range)
+    monkeypatch.setattr(pdf_extractor, "PDF_PAGES_PER_TASK", 2)
+    monkeypatch.setattr(pdf_extractor, "PDF_PARALLEL_MIN_PAGES", 4)
+    path = "manual.pdf"
+
+    assert list(pdf_extractor.extract_pages(path, 30, tasks_per_upload=3)) == [f"page {i}" for i in range(30)]
+    assert pool.submitted == 15
+    assert pool.peak <= 3
+
+    # Stopping early doesn't submit the rest of the document
+    pool.submitted = 0
+    pages = pdf_extractor.extract_pages(path, 30, tasks_per_upload=3)
+    next(pages)
+    pages.close()
+    assert pool.submitted <= 4
+
+
+def test_short_pdfs_are_extracted_without_the_pool(tmp_path, monkeypatch):
+    def no_pool():
+        raise AssertionError("short PDFs shouldn't use the process pool")
+
+    monkeypatch.setattr(pdf_extractor, "get_pool", no_pool)
+    path = write_pdf(tmp_path, make_manual(3, lines_per_page=2))
+    assert pdf_extractor.count_pages(path) == 3
+    assert list(pdf_extractor.extract_pages(path, 3)) == sequential_pages(path)
+
+
+def test_unreadable_pdf_raises(tmp_path):
+    path = str(tmp_path / "broken.pdf")
+    with open(path, "wb") as f:
+        f.write(b"not a pdf")
+    with pytest.raises(Exception):
+        pdf_extractor.count_pages(path)
@@ -0,0 +1,62 @@
+"""
+Query-result cache tests: exact and near-duplicate matches, TTL expiry and namespace invalidation.
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.query_cache import QueryCache, normalize_query
+
+RESULT = {"answer": "Supervised, unsupervised and reinforcement learning [1].", "citations": [{"number": 1}]}
+
+
+def make_cache(ttl_s: float = 60) -> QueryCache:
+    return QueryCache(ttl_s=ttl_s, similarity_threshold=0.95, max_entries=2)
+
+
+def test_normalize_query_ignores_case_spacing_and_trailing_punctuation():
+    assert normalize_query("  What is   Machine Learning?? ") == normalize_query("what is machine learning")
+
+
+def test_exact_and_semantic_matches():
+    cache = make_cache()
+    cache.put("docs", "what is rag", [1.0, 0.0, 0.0], RESULT, cache.generation("docs"))
+
+    assert cache.get_exact("docs", "what is rag") == RESULT
+    assert cache.get_similar("docs", [0.99, 0.05, 0.0])[0] == RESULT
+    assert cache.get_similar("docs", [0.0, 1.0, 0.0]) is None
+    assert cache.get_exact("other", "what is rag") is None
+
+    stats = cache.stats()
+    assert (stats["exact_hits"], stats["semantic_hits"], stats["misses"]) == (1, 1, 1)
+
+
+def test_entries_expire_after_ttl():
+    cache = make_cache(ttl_s=0.01)
+    cache.put(None, "what is rag", [1.0, 0.0], RESULT, cache.generation(None))
+    time.sleep(0.02)
+
+    assert cache.get_exact(None, "what is rag") is None
+    assert cache.get_similar(None, [1.0, 0.0]) is None
+
+
+def test_invalidation_drops_namespace_and_rejects_in_flight_puts():
+    cache = make_cache()
+    cache.put("docs", "what is rag", [1.0, 0.0], RESULT, cache.generation("docs"))
+    generation_before_upload = cache.generation("docs")
+
+    cache.invalidate_namespace("docs")
+    cache.put("docs", "what is ml", [0.0, 1.0], RESULT, generation_before_upload)
+
+    assert cache.get_exact("docs", "what is rag") is None
+    assert cache.get_exact("docs", "what is ml") is None
+
+
+def test_namespace_keeps_most_recent_entries():
+    cache = make_cache()
+    for i, query in enumerate(["q1", "q2", "q3"]):
+        cache.put("docs", query, [1.0, float(i)], RESULT, cache.generation("docs"))
+
+    assert cache.get_exact("docs", "q1") is None
+    assert cache.get_exact("docs", "q3") == RESULT
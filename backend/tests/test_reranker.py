@@ -0,0 +1,117 @@
+"""
+Reranker tests: the vectorized scorer must reproduce the original per-document ranking exactly.
+"""
+import asyncio
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services import reranker
+from services.reranker import (
+    tokenize, compute_bm25, compute_title_match, compute_phrase_match, compute_term_coverage,
+    build_rerank_features, rerank_documents
+)
+
+VOCABULARY = (
+    "machine learning supervised unsupervised reinforcement labeled data model training "
+    "neural network decision tree regression clustering spam fraud diagnosis the of and is "
+    "to in for a with on k-means pca 2024 gpu latency"
+).split()
+
+QUERIES = [
+    "What is machine learning?",
+    "supervised vs unsupervised learning",
+    "learning learning data",
+    "neural network training on gpu",
+    "the of and",
+    "How is fraud detection done with machine learning models?",
+]
+
+
+def reference_rerank(query, documents, top_k=reranker.TOP_K_RERANK):
+    """The original scalar implementation, kept as the ranking oracle."""
+    if not documents:
+        return []
+    query_tokens = tokenize(query)
+    doc_tokens_list = [tokenize(doc['text']) for doc in documents]
+    total_docs = len(documents)
+    avg_doc_len = sum(len(tokens) for tokens in doc_tokens_list) / total_docs if total_docs > 0 else 1
+    doc_freq = {}
+    for tokens in doc_tokens_list:
+        for term in set(tokens):
+            doc_freq[term] = doc_freq.get(term, 0) + 1
+
+    scored_docs = []
+    for i, doc in enumerate(documents):
+        doc_tokens = doc_tokens_list[i]
+        final_score = (
+            reranker.W_BM25 * compute_bm25(query_tokens, doc_tokens, avg_doc_len, doc_freq, total_docs) +
+            reranker.W_TITLE_MATCH * compute_title_match(query_tokens, doc.get('title', '')) +
+            reranker.W_PHRASE_MATCH * compute_phrase_match(query, doc['text']) +
+            reranker.W_TERM_COVERAGE * compute_term_coverage(query_tokens, doc_tokens) +
+            reranker.W_VECTOR_SCORE * doc.get('score', 0)
+        )
+        max_possible = reranker.W_BM25 * 10 + reranker.W_TITLE_MATCH + reranker.W_PHRASE_MATCH + reranker.W_TERM_COVERAGE + reranker.W_VECTOR_SCORE
+        doc_copy = doc.copy()
+        doc_copy['rerank_score'] = min(final_score / max_possible, 1.0)
+        scored_docs.append(doc_copy)
+
+    scored_docs.sort(key=lambda x: x['rerank_score'], reverse=True)
+    return [doc for doc in scored_docs if doc['rerank_score'] >= reranker.RERANK_THRESHOLD][:top_k]
+
+
+def make_candidates(count: int, seed: int = 0, with_features: bool = True) -> list:
+    rng = random.Random(seed)
+    candidates = []
+    for i in range(count):
+        length = rng.randint(0, 400)
+        text = " ".join(rng.choice(VOCABULARY) for _ in range(length))
+        if i % 5 == 0:
+            text += " What is machine learning? Supervised learning uses labeled data."
+        doc = {
+            "id": f"doc_{i}",
+            "score": round(rng.random(), 3),
+            "text": text,
+            "source": f"source_{i % 4}.md",
+            "title": rng.choice(["Machine Learning Introduction", "Fraud Detection", "", "GPU notes"])
+        }
+        if with_features and i % 3:
+            doc.update(build_rerank_features(text))
+        candidates.append(doc)
+    # Exact duplicates produce score ties, which must keep retrieval order
+    return candidates + [dict(candidates[0], id="dup_0")]
+
+
+def test_matches_reference_ranking_exactly():
+    for seed in range(5):
+        candidates = make_candidates(60, seed=seed)
+        for query in QUERIES:
+            for top_k in (1, 5, 100):
+                expected = reference_rerank(query, candidates, top_k)
+                actual = asyncio.run(rerank_documents(query, candidates, top_k))
+                assert [d["id"] for d in actual] == [d["id"] for d in expected]
+                assert [d["rerank_score"] for d in actual] == [d["rerank_score"] for d in expected]
+
+
+def test_precomputed_features_match_tokenizing_at_query_time():
+    with_features = make_candidates(30, seed=7)
+    without_features = make_candidates(30, seed=7, with_features=False)
+    for query in QUERIES:
+        ranked = [d["id"] for d in asyncio.run(rerank_documents(query, with_features, 100))]
+        assert ranked == [d["id"] for d in asyncio.run(rerank_documents(query, without_features, 100))]
+
+
+def test_empty_inputs():
+    assert asyncio.run(rerank_documents("anything", [])) == []
+    assert asyncio.run(rerank_documents("", make_candidates(3))) == reference_rerank("", make_candidates(3))
+
+
+def test_batched_scoring_matches_one_query_at_a_time():
+    document_sets = [make_candidates(20 + 7 * i, seed=i) for i in range(len(QUERIES))] + [[]]
+    queries = QUERIES + ["anything"]
+    batched = asyncio.run(reranker.rerank_document_sets(queries, document_sets, top_k=100))
+    for query, documents, ranked in zip(queries, document_sets, batched):
+        expected = asyncio.run(rerank_documents(query, documents, 100))
+        assert [d["id"] for d in ranked] == [d["id"] for d in expected]
+        assert [d["rerank_score"] for d in ranked] == [d["rerank_score"] for d in expected]
@@ -0,0 +1,98 @@
+"""
+Hybrid retrieval tests: reciprocal-rank fusion and recovering keyword matches the embedding misses,
+and multi-namespace fan-out that degrades when a namespace is slow or failing.
+"""
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services import retriever, vector_index, vector_store
+from services.chunk_store import ChunkStore
+from services.lexical_index import LexicalIndex
+from services.local_index import LocalVectorIndex
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    fused = retriever.reciprocal_rank_fusion([["a", "b", "c"], ["c", "d"]])
+    assert fused == ["c", "a", "b", "d"]
+
+
+def test_hybrid_retrieval_recovers_keyword_match(tmp_path, monkeypatch):
+    monkeypatch.setattr(vector_index, "_index", LocalVectorIndex(str(tmp_path)))
+    monkeypatch.setattr(vector_store, "lexical_index", LexicalIndex(None))
+    monkeypatch.setattr(vector_store, "chunk_store", ChunkStore(":memory:"))
+    monkeypatch.setattr(retriever, "lexical_index", vector_store.lexical_index)
+
+    chunks = [{"text": f"General notes about topic {i}.", "source": "notes.md", "title": "Notes"} for i in range(5)]
+    chunks.append({"text": "Error code ZX-4411 means the shard is read-only.", "source": "errors.md", "title": "Errors"})
+    # The keyword chunk's embedding points away from the query, so vector search ranks it last
+    embeddings = [[1.0, 0.1 * i] for i in range(5)] + [[-1.0, 0.0]]
+    asyncio.run(vector_store.upsert_vectors(embeddings, chunks, namespace="docs"))
+
+    vector_only = asyncio.run(vector_store.query_vectors([1.0, 0.0], namespace="docs", top_k=3))
+    assert all(doc["source"] != "errors.md" for doc in vector_only)
+
+    docs = asyncio.run(retriever.retrieve("what does zx 4411 mean", [1.0, 0.0], namespace="docs", top_k=3))
+    keyword_doc = next(doc for doc in docs if doc["source"] == "errors.md")
+    assert keyword_doc["text"].startswith("Error code ZX-4411")
+    assert keyword_doc["score"] == -1.0
+    assert len(docs) == 3
+
+
+def fake_namespace_retrieve(monkeypatch, behaviour):
+    async def fake_retrieve(query, query_embedding, namespace=None, top_k=10):
+        result = behaviour[namespace]
+        if isinstance(result, Exception):
+            raise result
+        if isinstance(result, float):
+            await asyncio.sleep(result)
+            return []
+        return [{"id": doc_id, "score": score, "text": doc_id} for doc_id, score in result]
+
+    monkeypatch.setattr(retriever, "retrieve", fake_retrieve)
+
+
+def test_fan_out_merges_top_k_across_namespaces(monkeypatch):
+    fake_namespace_retrieve(monkeypatch, {
+        "a": [("a1", 0.9), ("shared", 0.5), ("a2", 0.2)],
+        "b": [("b1", 0.8), ("shared", 0.7)],
+        "c": [],
+    })
+    docs, summary = asyncio.run(retriever.retrieve_across("q", [1.0], ["a", "b", "c"], top_k=3))
+    assert [(doc["id"], doc["namespace"]) for doc in docs] == [("a1", "a"), ("b1", "b"), ("shared", "b")]
+    assert summary == {"searched": 3, "failed": [], "timed_out": []}
+
+
+def test_fan_out_leaves_out_slow_and_failing_namespaces(monkeypatch):
+    fake_namespace_retrieve(monkeypatch, {
+        "ok": [("doc", 0.9)],
+        "slow": 5.0,
+        "broken": ConnectionError("pinecone 503"),
+    })
+    docs, summary = asyncio.run(retriever.retrieve_across("q", [1.0], ["ok", "slow", "broken"], timeout_s=0.05))
+    assert [doc["id"] for doc in docs] == ["doc"]
+    assert summary == {"searched": 3, "failed": ["broken"], "timed_out": ["slow"]}
+
+
+def test_fan_out_fails_when_no_namespace_answers(monkeypatch):
+    fake_namespace_retrieve(monkeypatch, {"slow": 5.0, "broken": ConnectionError("pinecone 503")})
+    with pytest.raises(RuntimeError):
+        asyncio.run(retriever.retrieve_across("q", [1.0], ["slow", "broken"], timeout_s=0.05))
+
+
+def test_prefix_lists_namespaces_and_uploads_refresh_the_list(tmp_path, monkeypatch):
+    monkeypatch.setattr(vector_index, "_index", LocalVectorIndex(str(tmp_path)))
+    monkeypatch.setattr(vector_store, "lexical_index", LexicalIndex(None))
+    monkeypatch.setattr(vector_store, "chunk_store", ChunkStore(":memory:"))
+    monkeypatch.setattr(vector_store, "_namespace_list", None)
+
+    chunk = {"text": "Team notes.", "source": "notes.md", "title": "Notes"}
+    asyncio.run(vector_store.upsert_vectors([[1.0, 0.0]], [chunk], namespace="team_a_1"))
+    asyncio.run(vector_store.upsert_vectors([[1.0, 0.0]], [chunk], namespace="other"))
+    assert asyncio.run(vector_store.list_namespaces("team_a_")) == ["team_a_1"]
+
+    asyncio.run(vector_store.upsert_vectors([[1.0, 0.0]], [chunk], namespace="team_a_2"))
+    assert asyncio.run(vector_store.list_namespaces("team_a_")) == ["team_a_1", "team_a_2"]
@@ -0,0 +1,104 @@
+"""
+Request coalescing tests: identical in-flight queries share one pipeline run and its result.
+"""
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from routers import query
+from services.single_flight import SingleFlight
+
+
+def test_concurrent_callers_share_one_call():
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "answer"
+
+    async def main():
+        flights = SingleFlight()
+        results = await asyncio.gather(*(flights.run("key", work) for _ in range(5)))
+        assert flights.in_flight() == 0
+        # Once the call finishes, the next caller starts a new one
+        return results, await flights.run("key", work)
+
+    results, later = asyncio.run(main())
+    assert [result for result, _ in results] == ["answer"] * 5
+    assert [shared for _, shared in results] == [False, True, True, True, True]
+    assert later == ("answer", False)
+    assert len(calls) == 2
+
+
+def test_different_keys_run_separately():
+    async def main():
+        flights = SingleFlight()
+        return await asyncio.gather(flights.run("a", lambda: asyncio.sleep(0, "a")), flights.run("b", lambda: asyncio.sleep(0, "b")))
+
+    assert asyncio.run(main()) == [("a", False), ("b", False)]
+
+
+def test_errors_reach_every_caller():
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("gemini down")
+
+    async def main():
+        flights = SingleFlight()
+        return await asyncio.gather(*(flights.run("key", fail) for _ in range(3)), return_exceptions=True)
+
+    assert [str(e) for e in asyncio.run(main())] == ["gemini down"] * 3
+
+
+def test_a_cancelled_caller_does_not_cancel_the_call_for_others():
+    async def work():
+        await asyncio.sleep(0.02)
+        return "answer"
+
+    async def main():
+        flights = SingleFlight()
+        first = asyncio.ensure_future(flights.run("key", work))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(flights.run("key", work))
+        await asyncio.sleep(0.005)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(main()) == ("answer", True)
+
+
+def test_identical_queries_share_embedding_retrieval_and_generation(monkeypatch):
+    counts = {"embed": 0, "generate": 0}
+
+    async def fake_embed(text):
+        counts["embed"] += 1
+        await asyncio.sleep(0.01)
+        return [1.0, 0.0]
+
+    async def fake_sources(request, embedding):
+        return [{"id": "a", "text": "RAG retrieves then generates.", "source": "rag.md", "title": "RAG", "score": 0.9, "rerank_score": 0.5}]
+
+    async def fake_generate(question, sources, light=False):
+        counts["generate"] += 1
+        await asyncio.sleep(0.01)
+        return {"answer": "It retrieves [1].", "citations": [{"number": 1}], "token_estimate": 10, "context": None}
+
+    monkeypatch.setattr(query, "embed_query", fake_embed)
+    monkeypatch.setattr(query, "_retrieve_sources", fake_sources)
+    monkeypatch.setattr(query, "generate_answer", fake_generate)
+    monkeypatch.setattr(query, "query_flights", SingleFlight())
+
+    async def main():
+        questions = ["What is RAG?", "what is rag", "  What is RAG?? ", "What is RAG?"]
+        return await asyncio.gather(*(query.query_documents(query.QueryRequest(query=q, namespace="coalesce_test")) for q in questions))
+
+    responses = asyncio.run(main())
+    assert counts == {"embed": 1, "generate": 1}
+    assert {r["answer"] for r in responses} == {"It retrieves [1]."}
+    assert [r["coalesced"] for r in responses] == [False, True, True, True]
@@ -0,0 +1,74 @@
+"""
+Warm-up tests: the replica reports ready only once every step has succeeded, retrying failed ones.
+"""
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services import embedder, manifest, vector_store, warmup
+from services.chunk_store import ChunkStore
+from services.embedding_cache import EmbeddingCache
+from services.manifest import ChunkManifest
+
+
+def test_ready_only_after_every_step_succeeds(monkeypatch):
+    attempts = {"flaky": 0}
+
+    async def fine():
+        await asyncio.sleep(0.01)
+
+    async def flaky():
+        attempts["flaky"] += 1
+        if attempts["flaky"] < 3:
+            raise ConnectionError("pinecone unreachable")
+
+    monkeypatch.setattr(warmup, "STEPS", {"fine": fine, "flaky": flaky})
+    monkeypatch.setattr(warmup, "WARMUP_RETRY_S", 0.001)
+
+    async def main():
+        warmup.start_warm_up()
+        await asyncio.sleep(0)
+        assert not warmup.is_ready()
+        while not warmup.is_ready():
+            await asyncio.sleep(0.001)
+        state = warmup.readiness()
+        await warmup.stop_warm_up()
+        return state
+
+    state = asyncio.run(main())
+    assert attempts["flaky"] == 3
+    assert state["ready"] and state["warmup_ms"] >= 10
+    assert {name: step["status"] for name, step in state["steps"].items()} == {"fine": "ok", "flaky": "ok"}
+    assert not warmup.is_ready()
+
+
+def test_failed_step_keeps_the_replica_unready(monkeypatch):
+    async def bad_key():
+        raise PermissionError("API key not valid")
+
+    monkeypatch.setattr(warmup, "STEPS", {"gemini": bad_key})
+    monkeypatch.setattr(warmup, "WARMUP_RETRY_S", 60)
+
+    async def main():
+        warmup.start_warm_up()
+        await asyncio.sleep(0.01)
+        state = warmup.readiness()
+        await warmup.stop_warm_up()
+        return state
+
+    state = asyncio.run(main())
+    assert not state["ready"]
+    assert state["steps"]["gemini"]["status"] == "failed"
+    assert state["steps"]["gemini"]["error"] == "API key not valid"
+
+
+def test_local_stores_are_opened_by_warm_up_not_on_creation(tmp_path, monkeypatch):
+    paths = {name: tmp_path / name / f"{name}.sqlite3" for name in ("embeddings", "chunks", "manifest")}
+    monkeypatch.setattr(embedder, "embedding_cache", EmbeddingCache(10, db_path=str(paths["embeddings"])))
+    monkeypatch.setattr(vector_store, "chunk_store", ChunkStore(str(paths["chunks"])))
+    monkeypatch.setattr(manifest, "chunk_manifest", ChunkManifest(str(paths["manifest"])))
+    assert not any(path.parent.exists() for path in paths.values())
+
+    asyncio.run(warmup.STEPS["local_stores"]())
+    assert all(path.exists() for path in paths.values())
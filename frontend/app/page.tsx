@@ -26,6 +26,20 @@ export default function Home() {
   const [hasQueried, setHasQueried] = useState(false);
   const fileInputRef = useRef<HTMLInputElement>(null);
 
+  // Uploads are indexed in the background; poll the job until it finishes
+  const waitForJob = async (jobId: string, fileName: string) => {
+    while (true) {
+      await new Promise((resolve) => setTimeout(resolve, 1000));
+      const response = await fetch(`${API_URL}/api/jobs/${jobId}`);
+      const job = await response.json();
+
+      if (!response.ok) throw new Error(job.detail || `Lost track of ${fileName}`);
+      if (job.status === 'completed') return job;
+      if (job.status === 'failed') throw new Error(job.error || `Indexing failed for ${fileName}`);
+      setUploadStatus(`${fileName} — ${job.chunks_done} chunks indexed…`);
+    }
+  };
+
   const handleFileUpload = async (files: FileList) => {
     setIsUploading(true);
     setError(null);
@@ -54,7 +68,8 @@ export default function Home() {
 
         // After first upload, use the returned namespace for subsequent files
         currentNamespace = data.stats.namespace;
-        results.push(`✓ ${file.name} — ${data.stats.chunks_created} chunks`);
+        const job = await waitForJob(data.job_id, file.name);
+        results.push(`✓ ${file.name} — ${job.stats.chunks_created} chunks`);
       } catch (err: any) {
         results.push(`✗ ${file.name} — ${err.message}`);
       }
@@ -75,21 +90,54 @@ export default function Home() {
     setHasQueried(true);
 
     try {
-      const response = await fetch(`${API_URL}/api/query`, {
+      const response = await fetch(`${API_URL}/api/query/stream`, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({ query, namespace }),
       });
-      const data = await response.json();
 
-      if (!response.ok) throw new Error(data.detail || 'Query failed');
+      if (!response.ok || !response.body) {
+        const data = await response.json().catch(() => ({}));
+        throw new Error(data.detail || 'Query failed');
+      }
 
-      setAnswer(data.answer);
-      setCitations(data.citations || []);
-      setStats({
-        time: data.timing_ms,
-        tokens: data.token_estimate
-      });
+      // Server-Sent Events: citations first, then answer tokens, then timing/cost
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      let streamedAnswer = '';
+
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        const events = buffer.split('\n\n');
+        buffer = events.pop() || '';
+
+        for (const rawEvent of events) {
+          const eventLine = rawEvent.split('\n').find((line) => line.startsWith('event: '));
+          const dataLine = rawEvent.split('\n').find((line) => line.startsWith('data: '));
+          if (!eventLine || !dataLine) continue;
+
+          const event = eventLine.slice('event: '.length);
+          const data = JSON.parse(dataLine.slice('data: '.length));
+
+          if (event === 'citations') {
+            setCitations(data.citations || []);
+          } else if (event === 'token') {
+            streamedAnswer += data.text;
+            setAnswer(streamedAnswer);
+          } else if (event === 'done') {
+            setStats({
+              time: data.timing_ms,
+              tokens: data.token_estimate
+            });
+          } else if (event === 'error') {
+            throw new Error(data.detail || 'Query failed');
+          }
+        }
+      }
     } catch (err: any) {
       setError(err.message);
     } finally {